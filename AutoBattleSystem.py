@@ -7,6 +7,7 @@ import cv2
 import numpy as np
 from pynput.keyboard import Key, Controller as KeyboardController
 import traceback
+from minimap_engine import MinimapEngine, ColorClassifier, CLASS_MINIMAP_BACKGROUND, MINIMAP_BACKGROUND_RULES
 
 
 class AutoBattleSystem:
@@ -15,9 +16,6 @@ class AutoBattleSystem:
         self.detector = detector
         self.monster_detector = monster_detector
         self.coordinate_transformer = coordinate_transformer
-        self.last_frame_hash = None
-        self.cache_result = None
-        self.cache_timeout = time.time()
         self.running = True
         self.controller = controller
 
@@ -31,11 +29,13 @@ class AutoBattleSystem:
         self.player_position = None
         self.facing_right = True
         self.last_target = None
+        self.player_jump_distance = 120  # 跳躍可跨越的最大間隙寬度（像素）
 
         # 小地圖相關變數
         self.last_minimap_region = None
         self.minimap_player_position = None
         self.minimap_monster_positions = []
+        self.platform_edges = []
 
     def start(self):
         """開始自動打怪"""
@@ -82,24 +82,24 @@ class AutoBattleSystem:
                 self._random_move()
                 return
                 
-            # 計算移動方向
+            # 計算移動方向（_select_target 已更新玩家位置）
             monster_pos = target["position"]
-            screen_center = (frame.shape[1] / 2, frame.shape[0] / 2)
+            player_pos = self.player_position
             
             # 調整角色朝向目標
-            if monster_pos[0] > screen_center[0] and direction == "left":
+            if monster_pos[0] > player_pos[0] and direction == "left":
                 # 目標在右側但角色面向左側，需要轉向
                 self.keyboard.press(Key.right)
                 time.sleep(0.1)
                 self.keyboard.release(Key.right)
-            elif monster_pos[0] < screen_center[0] and direction == "right":
+            elif monster_pos[0] < player_pos[0] and direction == "right":
                 # 目標在左側但角色面向右側，需要轉向
                 self.keyboard.press(Key.left)
                 time.sleep(0.1)
                 self.keyboard.release(Key.left)
                 
             # 判斷距離
-            distance = self._calculate_distance(screen_center, monster_pos)
+            distance = self._calculate_distance(player_pos, monster_pos)
             if distance < 150:
                 # 足夠近，進行攻擊
                 self._attack()
@@ -127,8 +127,7 @@ class AutoBattleSystem:
                 
             # 計算垂直距離
             monster_pos = target["position"]
-            screen_center = (frame.shape[1] / 2, frame.shape[0] / 2)
-            vertical_distance = abs(monster_pos[1] - screen_center[1])
+            vertical_distance = abs(monster_pos[1] - self.player_position[1])
             
             if vertical_distance < 100:
                 # 垂直距離較小，直接攻擊
@@ -185,55 +184,12 @@ class AutoBattleSystem:
         return (x_min, y_min, x_max - x_min, y_max - y_min)
 
     def analyze_minimap(self, minimap_image):
-        current_time = time.time()
-        frame_hash = hash(minimap_image.tobytes()[:1000])
-        
-        if frame_hash == self.last_frame_hash and current_time - self.cache_timeout < 0.5:
-            return self.cache_result
-        
-        self.last_frame_hash = frame_hash
-        self.cache_timeout = current_time
-
-        hsv = cv2.cvtColor(minimap_image, cv2.COLOR_BGR2HSV)
-        gray = cv2.cvtColor(minimap_image, cv2.COLOR_BGR2GRAY)
-        
-        # 玩家位置檢測
-        player_mask = cv2.inRange(hsv, np.array([0, 0, 200]), np.array([180, 30, 255]))
-        player_contours, _ = cv2.findContours(player_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        if player_contours:
-            largest_contour = max(player_contours, key=cv2.contourArea)
-            M = cv2.moments(largest_contour)
-            if M["m00"] > 0:
-                cx, cy = int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"])
-                self.player_position = (cx, cy)
-                self._update_explored_area(cx, cy)
-        
-        # 怪物位置檢測
-        monster_mask = cv2.inRange(hsv, np.array([0, 100, 100]), np.array([10, 255, 255]))
-        monster_contours, _ = cv2.findContours(monster_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        self.minimap_monster_positions = []
-        for contour in monster_contours:
-            M = cv2.moments(contour)
-            if M["m00"] > 0:
-                cx, cy = int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"])
-                self.minimap_monster_positions.append((cx, cy))
-        
-        # 平台邊緣檢測
-        edges = cv2.Canny(gray, 50, 150)
-        horizontal_kernel = np.ones((1, 7), np.uint8)
-        horizontal_edges = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, horizontal_kernel)
-        
-        contours, _ = cv2.findContours(horizontal_edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        filtered_contours = [cnt for cnt in contours if cv2.contourArea(cnt) > 50]
-        
-        self.platform_edges = []
-        for contour in filtered_contours:
-            x, y, w, h = cv2.boundingRect(contour)
-            if w > h*3 and w > 20:
-                self.platform_edges.append((x, y, x+w, y+h))
-        
-        self.cache_result = (self.player_position, self.platform_edges)
-        return self.cache_result
+        """分析小地圖，並同步玩家、怪物和平台邊緣資訊"""
+        result = self.minimap_analyzer.analyze_minimap(minimap_image)
+        self.minimap_player_position = self.minimap_analyzer.player_position
+        self.minimap_monster_positions = self.minimap_analyzer.minimap_monster_positions
+        self.platform_edges = self.minimap_analyzer.platform_edges
+        return result
 
     def _select_target(self):
         """選擇主畫面中檢測到的最近的怪物作為目標"""
@@ -248,17 +204,16 @@ class AutoBattleSystem:
         # 使用地形檢測器檢測怪物
         detections = self.detector.detect(frame, model_type='terrain')
         
-        # 過濾出怪物檢測結果
+        # 過濾出怪物檢測結果（加上檢測循環最近一次的模板匹配結果）
         monster_detections = [d for d in detections if d.get("class_name", "") == "monster"]
+        if self.monster_detector:
+            monster_detections.extend(self.monster_detector.last_detections)
         
         if not monster_detections:
             return None  # 如果沒有檢測到怪物,返回None
         
-        # 找出最近的怪物
-        if not self.player_position:
-            # 如果不知道玩家位置,假設在畫面中央
-            screen_center = (frame.shape[1] // 2, frame.shape[0] // 2)
-            self.player_position = screen_center
+        # 找出最近的怪物（玩家位置優先取自狀態估計器）
+        self._update_player_position(frame)
             
         # 選擇距離玩家最近的怪物
         closest_monster = min(monster_detections, 
@@ -292,9 +247,11 @@ class AutoBattleSystem:
         direction = "right" if dx > 0 else "left"
         direction_key = Key.right if direction == "right" else Key.left
 
-        # 2. 檢測前方是否有平台間隙
-        gap_detected = self.collision_system.detect_platform_gap(
-            start_pos=self.player_position,
+        # 2. 檢測前方是否有平台間隙（碰撞系統使用世界座標）
+        collision_system = self.controller.collision_system
+        world_position = self.coordinate_transformer.screen_to_world(self.player_position)
+        gap_detected = collision_system.detect_platform_gaps(
+            start_pos=world_position,
             direction=direction,
             max_distance=100  # 檢測前方100像素
         )
@@ -302,7 +259,7 @@ class AutoBattleSystem:
         # 3. 根據檢測結果決定行動
         if gap_detected["gap"]:
             gap_distance = gap_detected["distance"]
-            gap_width = gap_detected["width"]  # 假設檢測函數會返回間隙寬度
+            gap_width = gap_detected["width"]  # 沒有可落腳的平台時為 inf
 
             # 3.1 如果間隙太近且可跳過
             if gap_distance < 50 and gap_width < self.player_jump_distance:
@@ -325,8 +282,8 @@ class AutoBattleSystem:
         # 4. 沒有間隙，正常移動
         else:
             # 檢查是否有障礙物
-            obstacle = self.collision_system.predict_obstacle_collision(
-                self.player_position,
+            obstacle = collision_system.predict_obstacle_collision(
+                world_position,
                 direction,
                 distance=30
             )
@@ -414,19 +371,23 @@ class AutoBattleSystem:
         self.keyboard.release(Key.down)
 
     def _update_player_position(self, frame):
-        # 使用小地圖玩家位置估算遊戲世界中的位置
-        if self.minimap_player_position:
-            # 將小地圖座標轉換為遊戲世界座標
-            self.player_position = (
-                frame.shape[1] / 2,  # 使用畫面中心X座標
-                frame.shape[0] / 2   # 使用畫面中心Y座標
-            )
-            print(f"使用小地圖推斷玩家位置: {self.player_position}")
-            return
-        
-        # 默認位置
-        self.player_position = (400, 300)
-        print("無法檢測到玩家,使用預設位置: {self.player_position}")
+        """更新玩家的畫面座標：優先使用融合後的狀態估計，其次使用畫面中心"""
+        estimator = getattr(self.controller, "player_state", None)
+        if estimator:
+            world_pos = estimator.get_position(time.time())
+            if world_pos:
+                if self.coordinate_transformer:
+                    self.player_position = self.coordinate_transformer.world_to_screen(world_pos)
+                else:
+                    self.player_position = world_pos
+                return
+
+        # 尚無估計時，假設玩家在畫面中央
+        self.player_position = (
+            frame.shape[1] / 2,
+            frame.shape[0] / 2
+        )
+        print(f"無法取得玩家估計位置，使用畫面中心: {self.player_position}")
 
     
     def _check_platform_edge(self, direction):
@@ -468,6 +429,17 @@ class MinimapAnalyzer:
         self.minimap_monster_positions = []
         self.latest_minimap_image = None
         self.analysis_thread = None
+        self.engine = MinimapEngine()
+        self.background_classifier = ColorClassifier(MINIMAP_BACKGROUND_RULES)
+        self.last_analysis = None
+
+        # 小地圖邊框模板（只從磁碟載入一次）與鎖定的小地圖位置
+        self.top_template = None
+        self.bottom_template = None
+        self.locked_minimap_rect = None
+        self.lock_verify_interval = 30  # 鎖定後每隔多少幀驗證一次
+        self.lock_search_margin = 20    # 驗證時在鎖定位置周圍搜索的範圍
+        self._frames_since_verify = 0
 
     def extract_minimap(self, frame):
         height, width = frame.shape[:2]
@@ -475,10 +447,7 @@ class MinimapAnalyzer:
         roi_width = min(200, width // 3)
         roi = frame[0:roi_height, 0:roi_width]
         
-        hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
-        lower_bound = np.array([0, 0, 200])
-        upper_bound = np.array([180, 30, 255])
-        mask = cv2.inRange(hsv, lower_bound, upper_bound)
+        mask = self.background_classifier.mask(roi, CLASS_MINIMAP_BACKGROUND)
         
         contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         
@@ -504,96 +473,48 @@ class MinimapAnalyzer:
         self.last_frame_hash = frame_hash
         self.cache_timeout = current_time
 
-        hsv = cv2.cvtColor(minimap_image, cv2.COLOR_BGR2HSV)
-        gray = cv2.cvtColor(minimap_image, cv2.COLOR_BGR2GRAY)
-        
-        # 玩家位置檢測
-        player_mask = cv2.inRange(hsv, np.array([0, 0, 200]), np.array([180, 30, 255]))
-        player_contours, _ = cv2.findContours(player_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        if player_contours:
-            largest_contour = max(player_contours, key=cv2.contourArea)
-            M = cv2.moments(largest_contour)
-            if M["m00"] > 0:
-                cx, cy = int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"])
-                self.player_position = (cx, cy)
-                self._update_explored_area(cx, cy)
-        
-        # 怪物位置檢測
-        monster_mask = cv2.inRange(hsv, np.array([0, 100, 100]), np.array([10, 255, 255]))
-        monster_contours, _ = cv2.findContours(monster_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        self.minimap_monster_positions = []
-        for contour in monster_contours:
-            M = cv2.moments(contour)
-            if M["m00"] > 0:
-                cx, cy = int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"])
-                self.minimap_monster_positions.append((cx, cy))
-        
-        # 平台邊緣檢測
-        edges = cv2.Canny(gray, 50, 150)
-        horizontal_kernel = np.ones((1, 7), np.uint8)
-        horizontal_edges = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, horizontal_kernel)
-        
-        contours, _ = cv2.findContours(horizontal_edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        filtered_contours = [cnt for cnt in contours if cv2.contourArea(cnt) > 50]
-        
-        self.platform_edges = []
-        for contour in filtered_contours:
-            x, y, w, h = cv2.boundingRect(contour)
-            if w > h*3 and w > 20:
-                self.platform_edges.append((x, y, x+w, y+h))
+        # 一次查表標記所有顏色類別，再以連通區域取得位置
+        result = self.engine.analyze(minimap_image)
+        self.last_analysis = result
+
+        # 玩家位置：取面積最大的玩家色塊
+        player = result["player"]
+        if len(player["areas"]):
+            cx, cy = player["centroids"][np.argmax(player["areas"])]
+            self.player_position = (int(cx), int(cy))
+            self._update_explored_area(*self.player_position)
+
+        # 怪物位置
+        self.minimap_monster_positions = [(int(cx), int(cy)) for cx, cy in result["monster"]["centroids"]]
+
+        # 平台邊緣
+        self.platform_edges = [tuple(int(v) for v in edge) for edge in result["platforms"]]
         
         self.cache_result = (self.player_position, self.platform_edges)
         return self.cache_result
 
+    def track_player(self, minimap_image):
+        """只提取小地圖玩家點（不使用快取、不做平台檢測），供高頻追蹤使用"""
+        player = self.engine.analyze(minimap_image, include_platforms=False)["player"]
+        if not len(player["areas"]):
+            return None
+        cx, cy = player["centroids"][np.argmax(player["areas"])]
+        return (float(cx), float(cy))
+
     def _update_explored_area(self, x, y):
         grid_x, grid_y = x // 10, y // 10
         key = f"{grid_x},{grid_y}"
         self.explored_areas[key] = {"position": (x, y), "time": time.time()}
 
-    def minimap_to_world(self, minimap_pos):
-        if not self.player_position or not minimap_pos:
-            return None
-        screen_center_x, screen_center_y = 400, 300
-    
-        if isinstance(minimap_pos, tuple) and len(minimap_pos) == 2:
-            # 正確處理元組中的x和y坐標
-            world_x = screen_center_x + (minimap_pos[0] - self.player_position[0]) * self.scale_factor
-            world_y = screen_center_y + (minimap_pos[1] - self.player_position[1]) * self.scale_factor
-            return (int(world_x), int(world_y))
-        return None
-
-    def world_to_minimap(self, world_pos, screen_center=(400, 300)):
-        if not self.player_position:
-            return None
-    
-        if isinstance(world_pos, tuple) and len(world_pos) == 2:
-            # 正確處理元組中的x和y坐標
-            dx = world_pos[0] - screen_center[0]
-            dy = world_pos[1] - screen_center[1]
-        
-            minimap_dx = dx / self.scale_factor
-            minimap_dy = dy / self.scale_factor
-        
-            minimap_x = self.player_position[0] + minimap_dx
-            minimap_y = self.player_position[1] + minimap_dy
-        
-            return (int(minimap_x), int(minimap_y))
-        return None
-    
     def locate_minimap(self, frame):
         """自適應定位小地圖區域"""
         try:
             print("進入locate_minimap方法")
-            # 1. 轉換顏色空間以便於處理
-            hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-
-            # 2. 尋找小地圖常見的顏色範圍（需根據遊戲調整）
-            lower_bound = np.array([0, 0, 200])  # 高亮度低飽和度（常見小地圖背景）
-            upper_bound = np.array([180, 30, 255])
-            mask = cv2.inRange(hsv, lower_bound, upper_bound)
+            # 1-2. 以查找表標記小地圖常見的背景顏色（高亮度低飽和度，範圍見 MINIMAP_BACKGROUND_RULES）
+            # 小地圖面積較大，隔行隔列取樣即可定位，座標最後再放大回原尺寸
+            mask = self.background_classifier.mask(frame[::2, ::2], CLASS_MINIMAP_BACKGROUND)
 
             # 保存中間結果以便檢查
-            cv2.imwrite("debug_hsv.png", hsv)
             cv2.imwrite("debug_mask.png", mask)
 
             # 3. 尋找輪廓
@@ -603,7 +524,7 @@ class MinimapAnalyzer:
             # 4. 篩選可能的小地圖區域（通常是較大的矩形區域）
             if contours:
                 largest_contour = max(contours, key=cv2.contourArea)
-                x, y, w, h = cv2.boundingRect(largest_contour)
+                x, y, w, h = (v * 2 for v in cv2.boundingRect(largest_contour))
                 self.minimap_region = (x, y, w, h)
                 return (x, y, w, h)
 
@@ -616,43 +537,101 @@ class MinimapAnalyzer:
             return (0, 0, 200, 200)
 
     def locate_minimap_by_template(self, screen):
-        """使用多尺度模板匹配定位小地圖"""
+        """使用模板匹配定位小地圖
+
+        找到後鎖定小地圖位置，之後只定期在鎖定位置附近驗證，
+        驗證失敗時才重新進行全畫面搜索。
+        """
         try:
-            # 轉換為灰度圖
-            gray_screen = cv2.cvtColor(screen, cv2.COLOR_BGR2GRAY)
-            
-            # 載入上下邊框模板
-            top_template = cv2.imread('templates/top.png', 0)
-            bottom_template = cv2.imread('templates/down.png', 0)
-            
-            if top_template is None or bottom_template is None:
-                print("無法載入模板圖像")
+            if not self._load_border_templates():
                 return (0, 0, 200, 200)
-                
-            # 匹配上邊框
-            top_result = cv2.matchTemplate(gray_screen, top_template, cv2.TM_CCOEFF_NORMED)
-            _, top_max_val, _, top_max_loc = cv2.minMaxLoc(top_result)
-            
-            # 匹配下邊框
-            bottom_result = cv2.matchTemplate(gray_screen, bottom_template, cv2.TM_CCOEFF_NORMED)
-            _, bottom_max_val, _, bottom_max_loc = cv2.minMaxLoc(bottom_result)
-            
-            # 檢查匹配質量
-            if top_max_val < 0.5 or bottom_max_val < 0.5:
-                print(f"匹配質量不佳: 上={top_max_val:.2f}, 下={bottom_max_val:.2f}")
+
+            if self.locked_minimap_rect:
+                self._frames_since_verify += 1
+                if self._frames_since_verify < self.lock_verify_interval:
+                    return self.locked_minimap_rect
+
+                self._frames_since_verify = 0
+                rect = self._verify_locked_minimap(screen)
+                if rect:
+                    self.locked_minimap_rect = rect
+                    return rect
+                print("小地圖鎖定驗證失敗，重新搜索")
+                self.locked_minimap_rect = None
+
+            # 全畫面搜索
+            gray_screen = cv2.cvtColor(screen, cv2.COLOR_BGR2GRAY)
+            rect = self._match_minimap_borders(gray_screen, 0, 0)
+            if rect is None:
                 return (0, 0, 200, 200)
-                
-            # 計算小地圖區域
-            x = top_max_loc[0]
-            y = top_max_loc[1]
-            width = top_template.shape[1]
-            height = bottom_max_loc[1] + bottom_template.shape[0] - top_max_loc[1]
-            
-            # 確保高度和寬度至少為1像素
-            width = max(1, width)
-            height = max(1, height)
-            
-            return (x, y, width, height)
+
+            self.locked_minimap_rect = rect
+            self._frames_since_verify = 0
+            return rect
         except Exception as e:
             print(f"模板匹配小地圖時出錯: {str(e)}")
             return (0, 0, 200, 200)
+
+    def unlock_minimap(self):
+        """解除小地圖鎖定，下次定位時重新全畫面搜索"""
+        self.locked_minimap_rect = None
+        self._frames_since_verify = 0
+
+    def _load_border_templates(self):
+        """載入上下邊框模板並快取"""
+        if self.top_template is None:
+            self.top_template = cv2.imread('templates/top.png', 0)
+        if self.bottom_template is None:
+            self.bottom_template = cv2.imread('templates/down.png', 0)
+
+        if self.top_template is None or self.bottom_template is None:
+            print("無法載入模板圖像")
+            return False
+        return True
+
+    def _verify_locked_minimap(self, screen):
+        """只在鎖定位置附近的小窗口中重新匹配邊框"""
+        x, y, w, h = self.locked_minimap_rect
+        margin = self.lock_search_margin
+        screen_h, screen_w = screen.shape[:2]
+
+        x1 = max(0, x - margin)
+        y1 = max(0, y - margin)
+        x2 = min(screen_w, x + w + margin)
+        y2 = min(screen_h, y + h + margin)
+
+        window = cv2.cvtColor(screen[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+        return self._match_minimap_borders(window, x1, y1)
+
+    def _match_minimap_borders(self, gray_image, offset_x, offset_y):
+        """在灰度圖中匹配上下邊框，返回小地圖區域或None"""
+        top_h, top_w = self.top_template.shape[:2]
+        bottom_h, bottom_w = self.bottom_template.shape[:2]
+        if (gray_image.shape[0] < max(top_h, bottom_h) or
+                gray_image.shape[1] < max(top_w, bottom_w)):
+            return None
+
+        # 匹配上邊框
+        top_result = cv2.matchTemplate(gray_image, self.top_template, cv2.TM_CCOEFF_NORMED)
+        _, top_max_val, _, top_max_loc = cv2.minMaxLoc(top_result)
+
+        # 匹配下邊框
+        bottom_result = cv2.matchTemplate(gray_image, self.bottom_template, cv2.TM_CCOEFF_NORMED)
+        _, bottom_max_val, _, bottom_max_loc = cv2.minMaxLoc(bottom_result)
+
+        # 檢查匹配質量
+        if top_max_val < 0.5 or bottom_max_val < 0.5:
+            print(f"匹配質量不佳: 上={top_max_val:.2f}, 下={bottom_max_val:.2f}")
+            return None
+
+        # 計算小地圖區域
+        x = top_max_loc[0] + offset_x
+        y = top_max_loc[1] + offset_y
+        width = top_w
+        height = bottom_max_loc[1] + bottom_h - top_max_loc[1]
+
+        # 確保高度和寬度至少為1像素
+        width = max(1, width)
+        height = max(1, height)
+
+        return (x, y, width, height)
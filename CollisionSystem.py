@@ -1,5 +1,7 @@
-import math
 import cv2
+import numpy as np
+from spatial_hash import SpatialHashGrid
+from collision_layer import CELL_PLATFORM, CELL_OBSTACLE
 
 class CollisionBox:
     def __init__(self, x, y, width, height, obj_type, obj_data=None):
@@ -11,12 +13,18 @@ class CollisionBox:
         obj_type: 物體類型
         obj_data: 額外數據
         """
+        self.set_center(x, y, width, height)
+        self.type = obj_type
+        self.data = obj_data
+        self.obj_id = None
+        self.missed_frames = 0
+
+    def set_center(self, x, y, width, height):
+        """以中心與寬高設置邊界盒"""
         self.x1 = x - width / 2
         self.y1 = y - height / 2
         self.x2 = x + width / 2
         self.y2 = y + height / 2
-        self.type = obj_type
-        self.data = obj_data
 
     def check_collision(self, other):
         """檢查與另一個邊界盒的碰撞"""
@@ -25,6 +33,10 @@ class CollisionBox:
                 self.y1 < other.y2 and
                 self.y2 > other.y1)
 
+    @property
+    def bounds(self):
+        return (self.x1, self.y1, self.x2, self.y2)
+
     def contains_point(self, point):
         """檢查邊界盒是否包含點"""
         x, y = point
@@ -35,19 +47,56 @@ class CollisionBox:
         return ((self.x1 + self.x2) / 2, (self.y1 + self.y2) / 2)
 
 class CollisionSystem:
-    def __init__(self, map_memory):
+    # 檢測類別 -> (碰撞盒類型, 高度放大倍數)
+    OBJECT_CLASSES = {
+        "minimap_portal": ("portal", 1.0),
+        "game_portal": ("portal", 1.0),
+        "climbable_object": ("rope", 1.5),
+        "Ground": ("platform", 1.0),
+        "ground": ("platform", 1.0),
+        "platform": ("platform", 1.0),
+    }
+    # 會阻擋移動的碰撞盒類型（檢測器沒有獨立的牆壁類別，前方高起的平台/地面即為障礙）
+    BLOCKING_TYPES = ("platform",)
+
+    def __init__(self, map_memory, cell_size=100, match_distance=30, max_missed_frames=10):
         """
         初始化碰撞系統
         參數：
         map_memory: 地圖記憶系統實例
+        cell_size: 空間雜湊網格的邊長（世界座標像素）
+        match_distance: 同類型檢測的中心在此距離內視為同一物件
+        max_missed_frames: 在畫面內連續多少幀未檢測到就移除物件
         """
         self.map_memory = map_memory
-        self.collision_boxes = []
+        self.objects = {}  # 物件ID -> CollisionBox
+        self.player_box = None
+        self.spatial_index = SpatialHashGrid(cell_size)
+        self.match_distance = match_distance
+        self.max_missed_frames = max_missed_frames
+        self._next_id = 0
+
+    @property
+    def collision_boxes(self):
+        return list(self.objects.values())
+
+    def reset(self):
+        """清除所有碰撞物件（例如切換地圖後）"""
+        self.objects.clear()
+        self.spatial_index.clear()
         self.player_box = None
 
-    def update_from_detections(self, detections, coordinate_transformer):
-        """從檢測結果更新碰撞盒"""
-        self.collision_boxes = []
+    def update_from_detections(self, detections, coordinate_transformer, view_box=None):
+        """從檢測結果增量更新碰撞盒
+
+        每個檢測以 track_id（若有）或同類型、中心距離在 match_distance 內的已有物件配對；
+        只有新增的物件會寫入地圖記憶與碰撞柵格，空間索引只處理新增、移動與移除。
+        view_box 為目前畫面的世界座標範圍，只有畫面內未被檢測到的物件才會累計遺失幀數。
+        返回 {"inserted": [...], "updated": [...], "expired": [...]} 物件ID列表。
+        """
+        changes = {"inserted": [], "updated": [], "expired": []}
+        seen = set()
+        to_world = coordinate_transformer.screen_transform  # 整批檢測共用同一個鏡頭位置
         for detection in detections:
             try:
                 # 檢查是使用 'class_name' 還是 'class' 鍵
@@ -66,55 +115,126 @@ class CollisionSystem:
                 else:
                     continue
 
-                # 計算中心點
-                x_center = (x1 + x2) / 2
-                y_center = (y1 + y2) / 2
-
-                # 轉換座標到世界坐標
-                world_pos = coordinate_transformer.screen_to_world(
-                    (x_center, y_center)
-                )
-                
-                if not world_pos:
-                    continue
-                    
-                x, y = world_pos
+                # 轉換外框到世界坐標並計算中心點
+                world_box = tuple(to_world.apply_boxes((x1, y1, x2, y2))[0].tolist())
+                x = (world_box[0] + world_box[2]) / 2
+                y = (world_box[1] + world_box[3]) / 2
                 
                 # 計算寬度和高度
                 width = (x2 - x1) * 1.2  # 放大20%，更寬鬆的碰撞檢測
                 height = (y2 - y1) * 1.2
                 
-                # 創建不同類型的碰撞盒
                 if obj_class == "minimap_player":
-                    self.player_box = CollisionBox(x, y, width, height, "player", detection)
+                    if self.player_box is None:
+                        self.player_box = CollisionBox(x, y, width, height, "player", detection)
+                    else:
+                        self.player_box.set_center(x, y, width, height)
+                        self.player_box.data = detection
                     # 更新玩家位置到地圖記憶系統
                     self.map_memory.update_player_position((x, y))
-                elif obj_class == "minimap_portal" or obj_class == "game_portal":
-                    collision_box = CollisionBox(x, y, width, height, "portal", detection)
-                    self.collision_boxes.append(collision_box)
-                    # 添加到地圖記憶
-                    self.map_memory.add_object("portal", (x, y), detection)
-                elif obj_class == "climbable_object":
-                    collision_box = CollisionBox(x, y, width, height * 1.5, "rope", detection)
-                    self.collision_boxes.append(collision_box)
-                    # 添加到地圖記憶
-                    self.map_memory.add_object("rope", (x, y), detection)
-                # 地形識別 - 添加平台類型處理
-                elif obj_class == "ground" or obj_class == "platform":
-                    collision_box = CollisionBox(x, y, width, height, "platform", detection)
-                    self.collision_boxes.append(collision_box)
-                    # 添加到地圖記憶
-                    self.map_memory.update_terrain_feature((x, y), "platform", detection)
+                    continue
+
+                if obj_class not in self.OBJECT_CLASSES:
+                    continue
+                obj_type, height_scale = self.OBJECT_CLASSES[obj_class]
+
+                box = self._match_object(detection.get("track_id"), obj_type, (x, y), seen)
+                if box is None:
+                    box = CollisionBox(x, y, width, height * height_scale, obj_type, detection)
+                    self._insert_object(box, detection.get("track_id"))
+                    self._record_new_object(box, detection, (x, y), world_box)
+                    changes["inserted"].append(box.obj_id)
+                else:
+                    old_bounds = box.bounds
+                    box.set_center(x, y, width, height * height_scale)
+                    box.data = detection
+                    box.missed_frames = 0
+                    if box.bounds != old_bounds:
+                        self.spatial_index.update(box, box.bounds)
+                        changes["updated"].append(box.obj_id)
+                seen.add(box.obj_id)
             except Exception as e:
                 print(f"處理碰撞盒時發生錯誤: {str(e)}")
 
+        changes["expired"] = self._expire_objects(seen, view_box)
+        return changes
+
+    def _match_object(self, track_id, obj_type, center, seen):
+        """尋找與檢測對應的已有物件（本幀已配對過的物件除外）"""
+        if track_id is not None:
+            box = self.objects.get((obj_type, track_id))
+            if box is not None:
+                return box
+
+        best, best_distance = None, self.match_distance
+        for box in self.spatial_index.query_radius(center, self.match_distance, {obj_type}):
+            if box.obj_id in seen:
+                continue
+            cx, cy = box.get_center()
+            distance = ((cx - center[0]) ** 2 + (cy - center[1]) ** 2) ** 0.5
+            if distance <= best_distance:
+                best, best_distance = box, distance
+
+        # 追蹤器給了新編號（例如物件離開畫面後再出現）時沿用原有物件
+        if best is not None and track_id is not None:
+            del self.objects[best.obj_id]
+            best.obj_id = (obj_type, track_id)
+            self.objects[best.obj_id] = best
+        return best
+
+    def _insert_object(self, box, track_id=None):
+        if track_id is not None:
+            box.obj_id = (box.type, track_id)
+        else:
+            box.obj_id = self._next_id
+            self._next_id += 1
+        self.objects[box.obj_id] = box
+        self.spatial_index.insert(box, box.bounds, box.type)
+
+    def _record_new_object(self, box, detection, world_pos, world_box):
+        """把新出現的物件寫入地圖記憶與碰撞柵格"""
+        if box.type in ("portal", "rope"):
+            self.map_memory.add_object(box.type, world_pos, detection)
+        elif box.type == "platform" and not detection.get("from_terrain_cache", False):
+            # 來自地形快取的平台已記錄過
+            with self.map_memory.lock:
+                self.map_memory.update_terrain_feature(world_pos, "platform", detection)
+                self.collision_layer.stamp_box(world_box, CELL_PLATFORM)
+
+    def _expire_objects(self, seen, view_box):
+        """累計畫面內未被檢測到的物件，超過 max_missed_frames 幀即移除"""
+        expired = []
+        for obj_id, box in list(self.objects.items()):
+            if obj_id in seen:
+                continue
+            if view_box is not None and not self._overlaps(box.bounds, view_box):
+                continue
+            box.missed_frames += 1
+            if box.missed_frames > self.max_missed_frames:
+                del self.objects[obj_id]
+                self.spatial_index.remove(box)
+                expired.append(obj_id)
+        return expired
+
+    def _overlaps(self, a, b):
+        return a[0] <= b[2] and a[2] >= b[0] and a[1] <= b[3] and a[3] >= b[1]
+
+    @property
+    def collision_layer(self):
+        """目前地圖的碰撞柵格（與路徑規劃共用）"""
+        return self.map_memory.collision_layer
+
+    def cast_terrain_ray(self, start_pos, direction, max_distance=150, classes=(CELL_PLATFORM, CELL_OBSTACLE)):
+        """在碰撞柵格上沿方向尋找第一個地形格，返回距離（射程內沒有時為 inf）"""
+        return self.collision_layer.cast_ray(start_pos, self._direction_vector(direction), max_distance, classes)
+
     def check_player_collisions(self):
         """檢查玩家與所有物件的碰撞"""
         if not self.player_box:
             return []
             
         collisions = []
-        for box in self.collision_boxes:
+        for box in self.spatial_index.query_box(self.player_box.bounds):
             if self.player_box.check_collision(box):
                 collisions.append({"type": box.type, "position": box.get_center(), "data": box.data})
                 
@@ -126,46 +246,74 @@ class CollisionSystem:
             return False
             
         player_center = self.player_box.get_center()
-        for box in self.collision_boxes:
-            if box.type == obj_type:
-                box_center = box.get_center()
-                dist = ((player_center[0] - box_center[0]) ** 2 +
-                        (player_center[1] - box_center[1]) ** 2) ** 0.5
-                if dist <= distance:
-                    return True
+        # 中心距離在範圍內的物件，其外框必與同半徑的圓相交
+        for box in self.spatial_index.query_radius(player_center, distance, {obj_type}):
+            box_center = box.get_center()
+            dist = ((player_center[0] - box_center[0]) ** 2 +
+                    (player_center[1] - box_center[1]) ** 2) ** 0.5
+            if dist <= distance:
+                return True
                     
         return False
 
+    def sweep_box(self, box, velocity, horizon=1.0, types=BLOCKING_TYPES, exclude_overlapping=False):
+        """連續掃掠AABB：求 box 以 velocity 移動時，horizon 時間內最先碰到的物件
+
+        以 Minkowski 和把所有候選物件按 box 的半寬高擴大，再對 box 中心做一次向量化射線求交。
+        返回 (碰撞時間, 物件)；起始時已重疊的時間為 0（exclude_overlapping 為 True 時略過這些物件），
+        沒有碰撞時返回 (None, None)。
+        """
+        x1, y1, x2, y2 = box
+        vx, vy = velocity
+        swept = (min(x1, x1 + vx * horizon), min(y1, y1 + vy * horizon),
+                 max(x2, x2 + vx * horizon), max(y2, y2 + vy * horizon))
+        candidates = self.spatial_index.query_box(swept, set(types) if types else None)
+        if not candidates:
+            return None, None
+
+        bounds = np.array([candidate.bounds for candidate in candidates], dtype=np.float64)
+        half = np.array([(x2 - x1) / 2, (y2 - y1) / 2])
+        expanded = np.hstack([bounds[:, :2] - half, bounds[:, 2:] + half])
+        center = ((x1 + x2) / 2, (y1 + y2) / 2)
+
+        t_enter, t_exit = self.ray_box_intervals(center, np.array([vx, vy], dtype=np.float64), expanded)
+        impact = np.where(np.isfinite(t_exit), np.maximum(t_enter, 0), np.inf)
+        if exclude_overlapping:
+            impact[t_enter < 0] = np.inf
+        first = int(np.argmin(impact))
+        if impact[first] > horizon:
+            return None, None
+        return float(impact[first]), candidates[first]
+
+    def time_to_collision(self, velocity, horizon=1.0, types=BLOCKING_TYPES, box=None):
+        """碰撞盒（預設為玩家）以 velocity（像素/秒）移動時的 (碰撞時間, 物件)
+
+        起始時已重疊的物件（例如腳下的平台）不算碰撞；horizon 內不會碰撞時返回 (None, None)。
+        """
+        if box is None:
+            if not self.player_box:
+                return None, None
+            box = self.player_box.bounds
+        return self.sweep_box(box, velocity, horizon, types, exclude_overlapping=True)
+
     def predict_obstacle_collision(self, start_pos, direction, distance=100):
-        """預測給定方向上是否會碰到障礙物"""
-        step_size = 10  # 每步檢查的距離
-        steps = int(distance / step_size)
-        
-        # 計算方向向量
-        dir_x = 1 if direction == "right" else -1 if direction == "left" else 0
-        dir_y = 1 if direction == "down" else -1 if direction == "up" else 0
-        
-        # 逐步檢查路徑上的點
-        for i in range(1, steps + 1):
-            check_x = start_pos[0] + dir_x * step_size * i
-            check_y = start_pos[1] + dir_y * step_size * i
-            check_pos = (check_x, check_y)
-            
-            # 創建一個臨時的碰撞盒來檢查碰撞
-            temp_box = CollisionBox(check_x, check_y, 20, 20, "temp")
-            
-            # 檢查是否與任何障礙物碰撞
-            for box in self.collision_boxes:
-                if box.type == "obstacle" and temp_box.check_collision(box):
-                    return {
-                        "collision": True,
-                        "position": check_pos,
-                        "distance": step_size * i,
-                        "obstacle": box
-                    }
-                    
-        # 沒有檢測到碰撞
-        return {"collision": False}
+        """預測給定方向上是否會碰到障礙物（以20×20的探測盒做連續掃掠）"""
+        vector = self._direction_vector(direction)
+        x, y = start_pos
+        probe = (x - 10, y - 10, x + 10, y + 10)
+
+        t, obstacle = self.time_to_collision(vector * distance, 1.0, box=probe)
+        if obstacle is None:
+            # 沒有檢測到碰撞
+            return {"collision": False}
+
+        hit_distance = t * distance
+        return {
+            "collision": True,
+            "position": (float(x + vector[0] * hit_distance), float(y + vector[1] * hit_distance)),
+            "distance": hit_distance,
+            "obstacle": obstacle
+        }
 
     def draw_ray_detection(self, image, start_pos, hits, direction="right", max_distance=150, ray_color=(0, 255, 255), hit_color=(255, 0, 0)):
         """視覺化射線檢測結果"""
@@ -186,15 +334,10 @@ class CollisionSystem:
         ray_count = 5  # 繪製5條射線
         ray_spread = 30  # 射線扇形範圍
         
-        for i in range(ray_count):
-            # 計算當前射線角度
-            angle_offset = ray_spread * (i / (ray_count - 1) - 0.5) if ray_count > 1 else 0
-            angle = base_angle + angle_offset
-            radian = math.radians(angle)
-            
+        for dir_x, dir_y in self.fan_directions(base_angle, ray_spread, ray_count):
             # 計算射線終點
-            end_x = int(start_x + max_distance * math.cos(radian))
-            end_y = int(start_y + max_distance * math.sin(radian))
+            end_x = int(start_x + max_distance * dir_x)
+            end_y = int(start_y + max_distance * dir_y)
             
             # 繪製射線
             cv2.line(result, (start_x, start_y), (end_x, end_y), ray_color, 1, cv2.LINE_AA)
@@ -208,81 +351,164 @@ class CollisionSystem:
         
         return result
     
+    def _direction_vector(self, direction):
+        """把方向名稱或 (dx, dy) 轉為單位向量"""
+        if isinstance(direction, str):
+            return np.array({
+                "right": (1.0, 0.0),
+                "left": (-1.0, 0.0),
+                "down": (0.0, 1.0),
+                "up": (0.0, -1.0)
+            }.get(direction, (0.0, 0.0)))
+        vector = np.asarray(direction, dtype=np.float64)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _terrain_array(self, terrain_objects=None):
+        """把地形物件（檢測字典、CollisionBox 或 N×4 數組）轉為 N×4 的外框數組"""
+        if terrain_objects is None:
+            terrain_objects = [box for box in self.collision_boxes if box.type == "platform"]
+        if isinstance(terrain_objects, np.ndarray):
+            return terrain_objects.astype(np.float64).reshape(-1, 4)
+
+        boxes = []
+        for obj in terrain_objects:
+            if isinstance(obj, CollisionBox):
+                boxes.append(obj.bounds)
+            else:
+                bbox = obj.get("bbox", obj.get("box", []))
+                if len(bbox) == 4:
+                    boxes.append(bbox)
+        return np.array(boxes, dtype=np.float64).reshape(-1, 4)
+
+    def ray_box_intervals(self, origin, direction, boxes):
+        """以平板法一次計算射線與所有外框的進入/離開距離
+
+        direction 為單位向量 (2,) 時返回形狀 (N,) 的 (t_enter, t_exit)；
+        為 K 條射線 (K, 2) 時返回 (K, N)。未相交的外框兩者皆為 inf。
+        """
+        origin = np.asarray(origin, dtype=np.float64)
+        direction = np.asarray(direction, dtype=np.float64)
+        if direction.ndim == 2:
+            direction = direction[:, None, :]
+        lo = boxes[:, :2] - origin
+        hi = boxes[:, 2:] - origin
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t1 = lo / direction
+            t2 = hi / direction
+        parallel = direction == 0
+        # 與某軸平行時，只要起點在該軸範圍內就視為全程相交
+        inside = (lo <= 0) & (hi >= 0)
+        t_near = np.where(parallel, np.where(inside, -np.inf, np.inf), np.minimum(t1, t2))
+        t_far = np.where(parallel, np.where(inside, np.inf, -np.inf), np.maximum(t1, t2))
+
+        t_enter = t_near.max(axis=-1)
+        t_exit = t_far.min(axis=-1)
+        miss = (t_enter > t_exit) | (t_exit < 0)
+        t_enter[miss] = np.inf
+        t_exit[miss] = np.inf
+        return t_enter, t_exit
+
+    def fan_directions(self, base_angle, spread=30, ray_count=5):
+        """以 base_angle（度）為中心、總張角 spread 度的扇形射線單位向量 (K×2)"""
+        offsets = np.linspace(-spread / 2, spread / 2, ray_count) if ray_count > 1 else np.zeros(1)
+        radians = np.radians(base_angle + offsets)
+        return np.stack([np.cos(radians), np.sin(radians)], axis=1)
+
+    def cast_rays(self, start_pos, directions, max_distance=150, terrain_objects=None):
+        """一次對 K 條射線計算到地形的命中距離
+
+        directions 為 K×2 方向數組，返回長度 K 的距離數組；射程內未命中為 inf，
+        起點在地形內時為 0。
+        """
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 2)
+        norms = np.linalg.norm(directions, axis=1, keepdims=True)
+        directions = directions / np.maximum(norms, 1e-9)
+
+        boxes = self._terrain_array(terrain_objects)
+        if len(boxes) == 0:
+            return np.full(len(directions), np.inf)
+
+        t_enter, _ = self.ray_box_intervals(start_pos, directions, boxes)
+        distances = np.maximum(t_enter, 0).min(axis=1)
+        distances[distances > max_distance] = np.inf
+        return distances
+
+    def cast_fan(self, start_pos, base_angle, spread=30, ray_count=5, max_distance=150, terrain_objects=None):
+        """對扇形內的射線做一次批量檢測，返回各射線的方向、命中距離與命中點"""
+        directions = self.fan_directions(base_angle, spread, ray_count)
+        distances = self.cast_rays(start_pos, directions, max_distance, terrain_objects)
+        hit = np.isfinite(distances)
+        points = np.asarray(start_pos, dtype=np.float64) + directions * np.where(hit, distances, 0)[:, None]
+        return {"directions": directions, "distances": distances, "points": points[hit]}
+
     def detect_platform_gaps(self, start_pos, direction, max_distance=150, visualization_img=None, terrain_objects=None):
-        """檢測指定方向是否有平台間隙"""
-        print(f"執行平台間隙檢測: 起始位置={start_pos}, 方向={direction}")
-        
-            # 使用傳入的地形物件或收集已知的平台
-        if terrain_objects:
-            platforms = terrain_objects
-        else:
-            # 取得所有平台碰撞盒
-            platforms = [box for box in self.collision_boxes if box.type == "platform"]
-    
-        print(f"目前平台數量: {len(platforms)}")
-    
-        if not platforms:
+        """檢測指定方向是否有平台間隙
+
+        以射線與所有平台外框的相交區間求出被平台覆蓋的範圍，返回第一個未覆蓋點：
+        {"gap": True, "position", "distance"（間隙起點距離）, "width"（到下一個平台的距離，
+        沒有可落腳平台時為 inf）, "landing_platform"（下一個平台外框或None）}。
+        """
+        platforms = self._terrain_array(terrain_objects)
+        if len(platforms) == 0:
             print("未找到平台，無法檢測間隙")
             return {"gap": False}
 
-        # 計算方向向量
-        dir_x = 1 if direction == "right" else -1 if direction == "left" else 0
-        dir_y = 1 if direction == "down" else -1 if direction == "up" else 0
-        
-        # 用於可視化的顏色
+        origin = np.asarray(start_pos, dtype=np.float64)
+        vector = self._direction_vector(direction)
+        t_enter, t_exit = self.ray_box_intervals(origin, vector, platforms)
+
+        hit = np.isfinite(t_exit)
+        order = np.argsort(t_enter[hit])
+        indices = np.nonzero(hit)[0][order]
+        enter = t_enter[indices]
+        exit_ = t_exit[indices]
+
+        # 依進入距離排序後，某區間的起點超過之前所有區間覆蓋到的最遠處即為間隙
+        reach = np.concatenate([[0.0], np.maximum.accumulate(exit_)])
+        gaps = np.nonzero(enter > reach[:-1])[0]
+        if len(gaps):
+            k = gaps[0]
+            gap_start = reach[k]
+            landing = indices[k]
+            width = enter[k] - gap_start
+        else:
+            gap_start = reach[-1]
+            landing = None
+            width = float("inf")
+
+        result = {"gap": False}
+        if gap_start < max_distance:
+            result = {
+                "gap": True,
+                "position": tuple((origin + vector * gap_start).tolist()),
+                "distance": float(gap_start),
+                "width": float(width),
+                "landing_platform": tuple(platforms[landing].tolist()) if landing is not None else None
+            }
+
+        if visualization_img is not None:
+            self._draw_gap_detection(visualization_img, origin, vector, max_distance, enter, exit_, result)
+        return result
+
+    def _draw_gap_detection(self, image, origin, vector, max_distance, enter, exit_, result):
+        """繪製射線、平台覆蓋區段與間隙"""
         ray_color = (0, 255, 255)  # 黃色
         hit_color = (0, 255, 0)    # 綠色
         gap_color = (0, 0, 255)    # 紅色
-        
-        # 標記起始點
-        if visualization_img is not None:
-            cv2.circle(
-                visualization_img, 
-                (int(start_pos[0]), int(start_pos[1])), 
-                5, (255, 0, 0), -1
-            )
-        
-        # 從玩家位置向指定方向檢測
-        for i in range(1, int(max_distance / 10) + 1):
-            check_x = start_pos[0] + dir_x * 10 * i
-            check_y = start_pos[1] + dir_y * 10 * i
-            
-            # 繪製射線
-            if visualization_img is not None:
-                cv2.line(
-                    visualization_img, 
-                    (int(start_pos[0]), int(start_pos[1])), 
-                    (int(check_x), int(check_y)), 
-                    ray_color, 1
-                )
-            
-            # 檢測是否有平台/障礙物
-            has_platform = False
-            for platform in platforms:
-                # 處理平台數據
-                bbox = platform.get("bbox", [])
-                if len(bbox) == 4:
-                    x1, y1, x2, y2 = bbox
-                    if x1 <= check_x <= x2 and y1 <= check_y <= y2:
-                        has_platform = True
-                        if visualization_img is not None:
-                            cv2.circle(
-                                visualization_img, 
-                                (int(check_x), int(check_y)), 
-                                3, hit_color, -1
-                            )
-                        break
-            
-            if not has_platform:
-                # 標記間隙點
-                if visualization_img is not None:
-                    cv2.circle(
-                        visualization_img, 
-                        (int(check_x), int(check_y)), 
-                        5, gap_color, -1
-                    )
-                
-                return {"gap": True, "position": (check_x, check_y)}
-        
-        return {"gap": False}
 
+        def point(t):
+            p = origin + vector * t
+            return (int(p[0]), int(p[1]))
+
+        cv2.circle(image, point(0), 5, (255, 0, 0), -1)
+        cv2.line(image, point(0), point(max_distance), ray_color, 1)
+
+        # 射程內被平台覆蓋的區段
+        for t0, t1 in zip(np.clip(enter, 0, max_distance), np.clip(exit_, 0, max_distance)):
+            if t1 > t0:
+                cv2.line(image, point(t0), point(t1), hit_color, 2)
+
+        if result["gap"]:
+            cv2.circle(image, point(result["distance"]), 5, gap_color, -1)
@@ -1,184 +1,456 @@
 import os
-import pickle
+import json
 import time
 import math
+import queue
+import threading
+import numpy as np
+from terrain_model import TerrainModel
+from collision_layer import CollisionLayer, CELL_WALKABLE, CELL_PLATFORM, CELL_OBSTACLE
+from chunk_grid import ChunkedGrid, FLAG_EXPLORED, FLAG_PLATFORM, FLAG_OBSTACLE, FLAG_GAP
+from spatial_hash import SpatialHashGrid
+from trajectory import TrajectoryStore
+
+
+def _json_default(value):
+    """NumPy 數值與陣列轉為 JSON 可序列化的型別"""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"無法序列化 {type(value).__name__}")
+
+
+def _atomic_write(path, write):
+    """先寫入暫存檔再替換目標檔案"""
+    temp_path = path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        write(f)
+    os.replace(temp_path, path)
+
 
 class MapMemory:
+    CONNECTION_TYPES = ("rope", "portal")  # 需要記錄上下連接平台的物件類型
+    CONNECTION_RANGE = 20                  # 向上/向下搜索連接平台的格數
+
     def __init__(self, cell_size=50, save_path="map_data"):
         self.cell_size = cell_size
         self.save_path = save_path
-        self.map_grid = {}
+        self.grid = ChunkedGrid()  # 已探索/平台/障礙物/間隙旗標與最後觀測時間
         self.current_map_id = "unknown"
-        self.player_positions = []
-        self.portals = {}
-        self.ropes = {}
-        self.explored_cells = set()  # 新增探索記錄
+        self.trajectory = TrajectoryStore()  # 有上限、按時間降採樣的玩家軌跡
+        self.objects = {"portal": {}, "rope": {}}  # 物件類型 -> {(cell_x, cell_y): 物件}
+        self.object_index = SpatialHashGrid(cell_size=200)  # 以 (類型, 網格) 為鍵的物件位置索引
+        self._column_objects = {}  # cell_x -> 該列上需要連接資訊的物件 {(類型, 網格)}
+        self._dirty_connections = set()  # 連接平台需要重新計算的物件
+        self.terrain = TerrainModel()  # 此地圖的靜態地形快取
+        self.collision_layer = CollisionLayer()  # 碰撞系統與路徑規劃共用的柵格
+        self.minimap_scale = None  # 此地圖固定的小地圖 -> 世界縮放 (sx, sy)，決定世界原點
+
+        # 增量保存：每張地圖一個目錄（index.json + 每區塊一個 .npz），由背景線程寫入
+        self.lock = threading.RLock()  # 保護地圖數據的修改與保存快照
+        self._save_queue = queue.Queue()
+        self._save_stop = threading.Event()
+        self._save_thread = None
+        self._save_interval = 10.0
+        self._saved_index = None
+        self._saved_layer_version = self.collision_layer.version
+        self._saved_trajectory_version = self.trajectory.version
         
         os.makedirs(save_path, exist_ok=True)
 
+    @property
+    def portals(self):
+        """(cell_x, cell_y) -> 傳送點"""
+        return self.objects["portal"]
+
+    @property
+    def ropes(self):
+        """(cell_x, cell_y) -> 繩索"""
+        return self.objects["rope"]
+
+    def _cell(self, position):
+        """世界座標 -> 整數網格座標"""
+        return (math.floor(position[0] / self.cell_size), math.floor(position[1] / self.cell_size))
+
     def is_position_explored(self, position):
         """檢查位置是否已被探索"""
-        x, y = position
-        cell_x = int(x / self.cell_size)
-        cell_y = int(y / self.cell_size)
-        return (cell_x, cell_y) in self.explored_cells
-
-    def get_nearby_objects(self, position, radius=5):
-        """獲取附近物體（修正版）"""
-        x, y = position
-        cell_x = int(x / self.cell_size)
-        cell_y = int(y / self.cell_size)
-        
-        nearby = []
-        
-        # 檢查周圍網格
-        for dx in range(-radius, radius+1):
-            for dy in range(-radius, radius+1):
-                check_cell = (cell_x + dx, cell_y + dy)
-                
-                # 檢查傳送點
-                if check_cell in self.portals:
-                    nearby.append({
-                        "type": "portal",
-                        "position": self.portals[check_cell]["position"]
-                    })
-                
-                # 檢查繩索
-                if check_cell in self.ropes:
-                    nearby.append({
-                        "type": "rope",
-                        "position": self.ropes[check_cell]["position"]
-                    })
-        
-        return nearby
+        return self.grid.has_flag(self._cell(position), FLAG_EXPLORED)
 
     def update_player_position(self, position):
         """更新玩家位置並標記探索區域"""
-        x, y = position
-        cell_x = int(x / self.cell_size)
-        cell_y = int(y / self.cell_size)
-        
-        # 標記當前網格為已探索
-        self.explored_cells.add((cell_x, cell_y))
+        cell = self._cell(position)
+        now = time.time()
         
-        # 原始更新邏輯保持不變
-        if not self.player_positions or self._distance(self.player_positions[-1], position) > 20:
-            self.player_positions.append(position)
-            key = f"{cell_x},{cell_y}"
-            self.map_grid[key] = {"type": "explored", "time": time.time()}
-    
-    def update_player_position(self, position):
-        """更新玩家位置"""
-        x, y = position
-        # 避免記錄過於頻繁的位置
-        if not self.player_positions or self._distance(self.player_positions[-1], position) > 20:
-            self.player_positions.append(position)
+        with self.lock:
+            # 標記當前網格為已探索
+            if not self.grid.has_flag(cell, FLAG_EXPLORED):
+                self.collision_layer.stamp_box(self._cell_box(*cell), CELL_WALKABLE)
+            self.grid.set_flags([cell], FLAG_EXPLORED, now)
             
-            # 標記已探索區域
-            cell_x, cell_y = int(x / self.cell_size), int(y / self.cell_size)
-            key = f"{cell_x},{cell_y}"
-            self.map_grid[key] = {"type": "explored", "time": time.time()}
+            # 記錄軌跡（移動距離太小且間隔太短時會被忽略）
+            self.trajectory.add(position, now)
+
+    def last_visit(self, position):
+        """玩家最後一次到過 position 所在網格的時間，從未到過時返回None"""
+        return self.trajectory.last_visit(self._cell_box(*self._cell(position)))
     
     def add_object(self, obj_type, position, obj_data=None):
         """添加遊戲物件（傳送點、繩索等）"""
-        x, y = position
-        cell_x, cell_y = int(x / self.cell_size), int(y / self.cell_size)
-        key = f"{cell_x},{cell_y}"
-        
-        if obj_type == "portal":
-            self.portals[key] = {"position": position, "data": obj_data, "time": time.time()}
-        elif obj_type == "rope":
-            self.ropes[key] = {"position": position, "data": obj_data, "time": time.time()}
+        key = self._cell(position)
+        now = time.time()
         
-        # 更新網格
-        self.map_grid[key] = {"type": obj_type, "time": time.time()}
+        with self.lock:
+            self.objects.setdefault(obj_type, {})[key] = {"position": position, "data": obj_data, "time": now}
+            self._register_object(obj_type, key, position)
+            self._update_connection_points()
+            
+            # 更新網格
+            self.grid.set_flags([key], 0, now)
     
-    def get_nearby_objects(self, position, radius=5):
-        """獲取玩家附近的物件"""
-        x, y = position
-        cell_x, cell_y = int(x / self.cell_size), int(y / self.cell_size)
-        
-        nearby = []
-        for dx in range(-radius, radius + 1):
-            for dy in range(-radius, radius + 1):
-                key = f"{cell_x + dx},{cell_y + dy}"
-                if key in self.map_grid:
-                    obj_type = self.map_grid[key]["type"]
-                    if obj_type == "portal" and key in self.portals:
-                        nearby.append({"type": "portal", "position": self.portals[key]["position"]})
-                    elif obj_type == "rope" and key in self.ropes:
-                        nearby.append({"type": "rope", "position": self.ropes[key]["position"]})
-        
-        return nearby
+    def _register_object(self, obj_type, key, position):
+        """把物件加入位置索引；繩索與傳送點同時登記到所在的列並排入連接計算"""
+        self.object_index.insert((obj_type, key), (position[0], position[1], position[0], position[1]), obj_type)
+        if obj_type in self.CONNECTION_TYPES:
+            self._column_objects.setdefault(key[0], set()).add((obj_type, key))
+            self._dirty_connections.add((obj_type, key))
+
+    def _object_info(self, item, distance):
+        obj_type, key = item
+        return {"type": obj_type, "position": self.objects[obj_type][key]["position"], "distance": distance}
+
+    def get_nearby_objects(self, position, radius=5, obj_types=None):
+        """獲取玩家附近 radius 格內的物件，按距離由近到遠排序"""
+        world_radius = radius * self.cell_size
+        found = self.object_index.query_radius(position, world_radius, obj_types, sort=True)
+        return [self._object_info(item, self.object_index.distance(item, position)) for item in found]
+
+    def find_nearest_objects(self, position, k=1, obj_types=None, max_distance=float("inf")):
+        """獲取距離最近的 k 個物件，按距離由近到遠排序"""
+        found = self.object_index.query_nearest(position, k, obj_types, max_distance)
+        return [self._object_info(item, distance) for distance, item in found]
+
+    def get_nearest_object(self, position, obj_type, max_distance=float("inf")):
+        """獲取最近的指定類型物件（例如最近的繩索），沒有時返回None"""
+        found = self.find_nearest_objects(position, 1, (obj_type,), max_distance)
+        return found[0] if found else None
     
     def is_position_walkable(self, position):
         """檢查位置是否可行走（根據已探索數據）"""
-        x, y = position
-        cell_x, cell_y = int(x / self.cell_size), int(y / self.cell_size)
-        key = f"{cell_x},{cell_y}"
-        
         # 如果該區域已被標記為障礙物，則不可行走
-        if key in self.map_grid and self.map_grid[key]["type"] == "obstacle":
-            return False
-        
-        return True
+        return not self.grid.has_flag(self._cell(position), FLAG_OBSTACLE)
     
     def save_map(self):
-        """保存當前地圖數據"""
-        if self.current_map_id == "unknown":
+        """同步保存當前地圖中有變更的部分"""
+        self._enqueue(self._snapshot())
+        self._wait_for_writes()
+
+    def _wait_for_writes(self):
+        """等待排隊中的快照寫入完成（沒有保存線程時直接在目前線程寫入）"""
+        if self._save_thread is None:
+            self._write_queued()
+        else:
+            self._save_queue.join()
+
+    def start_autosave(self, interval=10.0):
+        """啟動背景保存線程，每 interval 秒把有變更的區塊寫入磁碟"""
+        if self._save_thread is not None:
             return
-            
-        data = {
-            "map_grid": self.map_grid,
-            "player_positions": self.player_positions,
-            "portals": self.portals,
-            "ropes": self.ropes
-        }
-        
-        map_file = os.path.join(self.save_path, f"{self.current_map_id}.pickle")
-        with open(map_file, 'wb') as f:
-            pickle.dump(data, f)
-    
+        self._save_interval = interval
+        self._save_stop.clear()
+        self._save_thread = threading.Thread(target=self._autosave_loop, daemon=True)
+        self._save_thread.start()
+
+    def stop_autosave(self):
+        """停止背景保存線程並保存剩餘的變更"""
+        thread = self._save_thread
+        if thread is not None:
+            self._save_stop.set()
+            self._save_queue.put(None)
+            thread.join(timeout=5.0)
+            self._save_thread = None
+        self.save_map()
+
+    def _autosave_loop(self):
+        while not self._save_stop.is_set():
+            try:
+                item = self._save_queue.get(timeout=self._save_interval)
+            except queue.Empty:
+                try:
+                    self._enqueue(self._snapshot())
+                except Exception as e:
+                    print(f"建立地圖保存快照時發生錯誤: {e}")
+                continue
+            try:
+                if item is not None:
+                    self._write_snapshot(item)
+            except Exception as e:
+                print(f"保存地圖數據時發生錯誤: {e}")
+            finally:
+                self._save_queue.task_done()
+        self._write_queued()
+
+    def _write_queued(self):
+        """在目前線程寫入所有排隊中的快照"""
+        while True:
+            try:
+                item = self._save_queue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                if item is not None:
+                    self._write_snapshot(item)
+            except Exception as e:
+                print(f"保存地圖數據時發生錯誤: {e}")
+            finally:
+                self._save_queue.task_done()
+
+    def _enqueue(self, snapshot):
+        if snapshot is not None:
+            self._save_queue.put(snapshot)
+
+    def _map_dir(self, map_id):
+        return os.path.join(self.save_path, map_id)
+
+    def _chunk_file(self, map_id, key):
+        return os.path.join(self._map_dir(map_id), "chunks", f"{key[0]}_{key[1]}.npz")
+
+    def _snapshot(self):
+        """複製需要保存的數據（只有變更過的區塊），實際寫入在保存線程進行"""
+        with self.lock:
+            if self.current_map_id == "unknown":
+                return None
+
+            # 先記錄區塊列表再取走變更標記，避免索引遺漏已寫入的區塊
+            chunk_keys = sorted(set(self.grid.chunks) | self.grid.pending)
+            chunks = self.grid.take_dirty()
+
+            # dict() / list() 的複製在 GIL 下是原子操作，檢測線程可同時新增物件
+            index = {
+                "version": 1,
+                "cell_size": self.cell_size,
+                "chunk_size": self.grid.chunk_size,
+                "chunks": [list(key) for key in chunk_keys],
+                "objects": {obj_type: self._objects_to_list(dict(objects))
+                            for obj_type, objects in list(self.objects.items())},
+                "terrain": self.terrain.to_dict(),
+                "minimap_scale": self.minimap_scale
+            }
+            index_text = json.dumps(index, ensure_ascii=False, default=_json_default)
+            if index_text == self._saved_index:
+                index_text = None
+            else:
+                self._saved_index = index_text
+
+            layer = None
+            if self.collision_layer.version != self._saved_layer_version:
+                self._saved_layer_version = self.collision_layer.version
+                layer = self.collision_layer.to_dict()
+                layer["grid"] = layer["grid"].copy()
+
+            trajectory = None
+            if self.trajectory.version != self._saved_trajectory_version:
+                self._saved_trajectory_version = self.trajectory.version
+                trajectory = self.trajectory.samples()
+
+            if not chunks and index_text is None and layer is None and trajectory is None:
+                return None
+            return {"map_id": self.current_map_id, "chunks": chunks, "index": index_text,
+                    "layer": layer, "trajectory": trajectory}
+
+    def _write_snapshot(self, snapshot):
+        """寫入快照，每個檔案先寫暫存檔再替換，中途中斷不會留下半個檔案"""
+        map_id = snapshot["map_id"]
+        map_dir = self._map_dir(map_id)
+        os.makedirs(os.path.join(map_dir, "chunks"), exist_ok=True)
+
+        for key, chunk in snapshot["chunks"].items():
+            _atomic_write(self._chunk_file(map_id, key), lambda f, c=chunk: np.savez(f, **c))
+
+        layer = snapshot["layer"]
+        if layer is not None:
+            _atomic_write(os.path.join(map_dir, "collision_layer.npz"), lambda f: np.savez(
+                f, grid=layer["grid"], origin=np.array(layer["origin"]), resolution=np.array(layer["resolution"])))
+
+        if snapshot["trajectory"] is not None:
+            _atomic_write(os.path.join(map_dir, "trajectory.npy"), lambda f: np.save(f, snapshot["trajectory"]))
+
+        # 索引最後寫入，使其引用的區塊都已存在
+        if snapshot["index"] is not None:
+            _atomic_write(os.path.join(map_dir, "index.json"), lambda f: f.write(snapshot["index"].encode("utf-8")))
+
+    def _objects_to_list(self, objects):
+        """物件字典 -> 可保存為JSON的列表（不保存原始檢測結果）"""
+        return [{"cell": list(key), "position": list(value["position"]), "time": value.get("time"),
+                 "connects": [list(c) for c in value.get("connects", [])]}
+                for key, value in objects.items()]
+
+    def _objects_from_list(self, items):
+        objects = {}
+        for item in items:
+            objects[tuple(item["cell"])] = {
+                "position": tuple(item["position"]), "data": None, "time": item.get("time"),
+                "connects": [tuple(c) for c in item.get("connects", [])]
+            }
+        return objects
+
+    def _load_chunk(self, key):
+        """延遲載入單一區塊，檔案不存在時返回None"""
+        path = self._chunk_file(self.current_map_id, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                return {"flags": data["flags"], "last_seen": data["last_seen"].astype(np.float64)}
+        except Exception as e:
+            print(f"載入地圖區塊 {path} 時發生錯誤: {e}")
+            return None
+
     def load_map(self):
-        """載入指定地圖數據"""
-        map_file = os.path.join(self.save_path, f"{self.current_map_id}.pickle")
-        
+        """載入指定地圖數據：只讀取索引，區塊在第一次存取時才載入"""
+        map_dir = self._map_dir(self.current_map_id)
+        index_file = os.path.join(map_dir, "index.json")
+
         # 清空現有數據
-        self.map_grid = {}
-        self.player_positions = []
-        self.portals = {}
-        self.ropes = {}
-        
+        self.grid.clear()
+        self.trajectory.clear()
+        self.objects = {"portal": {}, "rope": {}}
+        self.object_index.clear()
+        self._column_objects = {}
+        self._dirty_connections = set()
+        self.terrain.reset()
+        self.collision_layer.clear()
+        self.minimap_scale = None
+        self._saved_index = None
+
         # 如果存在保存的數據，則加載
-        if os.path.exists(map_file):
-            with open(map_file, 'rb') as f:
+        if os.path.exists(index_file):
+            try:
+                with open(index_file, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+                self.grid.set_pending([tuple(key) for key in index.get("chunks", [])], self._load_chunk)
+                for obj_type, items in index.get("objects", {}).items():
+                    self.objects[obj_type] = self._objects_from_list(items)
+                    for key, value in self.objects[obj_type].items():
+                        self._register_object(obj_type, key, value["position"])
+                # 保存的連接資訊仍然有效，不需要重新計算
+                self._dirty_connections.clear()
+                self.terrain.load_dict(index.get("terrain", {}))
+                if index.get("minimap_scale"):
+                    self.minimap_scale = tuple(index["minimap_scale"])
+
+                trajectory_file = os.path.join(map_dir, "trajectory.npy")
+                if os.path.exists(trajectory_file):
+                    self.trajectory.load_array(np.load(trajectory_file, allow_pickle=False))
+
+                layer_file = os.path.join(map_dir, "collision_layer.npz")
+                if os.path.exists(layer_file):
+                    with np.load(layer_file, allow_pickle=False) as data:
+                        self.collision_layer.load_dict({"grid": data["grid"], "origin": data["origin"].tolist(),
+                                                        "resolution": int(data["resolution"])})
+                else:
+                    self._rebuild_collision_layer()
+            except Exception as e:
+                print(f"載入地圖數據時發生錯誤: {e}")
+        elif os.path.exists(self._legacy_file()):
+            self._migrate_legacy_save()
+
+        self._saved_layer_version = self.collision_layer.version
+        self._saved_trajectory_version = self.trajectory.version
+
+    def switch_map(self, map_id):
+        """切換到指定地圖：先保存目前地圖的變更，再載入目標地圖的索引"""
+        if map_id == self.current_map_id:
+            return False
+
+        # 等待目前地圖寫入完成，避免之後切回時讀到舊檔案（只包含上次保存後的變更）
+        self._enqueue(self._snapshot())
+        self._wait_for_writes()
+        with self.lock:
+            self.current_map_id = map_id
+            self.load_map()
+        return True
+
+    def _legacy_file(self):
+        return os.path.join(self.save_path, f"{self.current_map_id}.pickle")
+
+    def _migrate_legacy_save(self):
+        """把舊版整檔 pickle 存檔轉換為目前的格式（只執行一次）
+
+        舊存檔是本程式自己寫出的檔案，轉換時讀取一次；轉換後立即寫出新格式並把舊檔改名，之後不再載入。
+        舊版的玩家位置沒有時間戳，不會轉換為軌跡。
+        """
+        legacy_file = self._legacy_file()
+        print(f"發現舊版地圖存檔 {legacy_file}，轉換為新格式")
+        try:
+            import pickle
+            with open(legacy_file, 'rb') as f:
                 data = pickle.load(f)
-                self.map_grid = data["map_grid"]
-                self.player_positions = data["player_positions"]
-                self.portals = data["portals"]
-                self.ropes = data["ropes"]
-    
-    def _distance(self, pos1, pos2):
-        """計算兩點之間的距離"""
-        return ((pos1[0] - pos2[0]) ** 2 + (pos1[1] - pos2[1]) ** 2) ** 0.5
+
+            if "grid" in data:
+                size = data["grid"].get("chunk_size", self.grid.chunk_size)
+                for (cx, cy), chunk in data["grid"].get("chunks", {}).items():
+                    for layer in ("flags", "last_seen"):
+                        self.grid.write_region(cx * size, cy * size, chunk[layer], layer)
+                objects = {"portal": data.get("portals", {}), "rope": data.get("ropes", {})}
+            else:
+                objects = self._load_legacy_grid(data)
+            for obj_type, items in objects.items():
+                for key, value in items.items():
+                    self.objects[obj_type][key] = {"position": tuple(value["position"]), "data": None,
+                                                   "time": value.get("time")}
+                    self._register_object(obj_type, key, value["position"])
+            self._update_connection_points()
+
+            if "terrain" in data:
+                self.terrain.load_dict(data["terrain"])
+            if "collision_layer" in data:
+                self.collision_layer.load_dict(data["collision_layer"])
+            else:
+                self._rebuild_collision_layer()
+
+            self._write_snapshot(self._snapshot())
+            os.replace(legacy_file, legacy_file + ".migrated")
+        except Exception as e:
+            print(f"轉換舊版地圖存檔時發生錯誤，已略過: {e}")
+
+    def _load_legacy_grid(self, data):
+        """轉換以 "x,y" 字串為鍵的舊版網格，返回 {物件類型: {網格: 物件}}"""
+        def parse(key):
+            return tuple(map(int, key.split(','))) if isinstance(key, str) else key
+
+        explored = [parse(key) for key in data.get("explored_cells", set())]
+        if explored:
+            self.grid.set_flags(explored, FLAG_EXPLORED)
+        type_flags = {"explored": FLAG_EXPLORED, "platform": FLAG_PLATFORM | FLAG_EXPLORED,
+                      "obstacle": FLAG_OBSTACLE | FLAG_EXPLORED, "gap": FLAG_GAP | FLAG_EXPLORED}
+        for key, value in data.get("map_grid", {}).items():
+            self.grid.set_flags([parse(key)], type_flags.get(value["type"], 0), value.get("time"))
+
+        return {"portal": {parse(key): value for key, value in data.get("portals", {}).items()},
+                "rope": {parse(key): value for key, value in data.get("ropes", {}).items()}}
+
+    def _rebuild_collision_layer(self):
+        """由網格旗標重建碰撞柵格（舊版存檔沒有柵格）"""
+        self.collision_layer.clear()
+        for flag, class_id in ((FLAG_EXPLORED, CELL_WALKABLE), (FLAG_PLATFORM, CELL_PLATFORM),
+                               (FLAG_OBSTACLE, CELL_OBSTACLE)):
+            for cell_x, cell_y in self.grid.cells_with(flag):
+                self.collision_layer.stamp_box(self._cell_box(cell_x, cell_y), class_id)
+
+    def _cell_box(self, cell_x, cell_y):
+        """網格對應的世界座標外框"""
+        return (cell_x * self.cell_size, cell_y * self.cell_size,
+                (cell_x + 1) * self.cell_size - 1, (cell_y + 1) * self.cell_size - 1)
     
     def detect_platform_edges(self):
         """檢測平台邊緣"""
         platform_edges = {}
     
-        # 遍歷已探索區域
-        for cell_x, cell_y in self.explored_cells:
-            key = f"{cell_x},{cell_y}"
-        
-            # 檢查是否為平台
-            if key in self.map_grid and self.map_grid[key]["type"] == "explored":
-                # 檢查下方是否為空氣（平台邊緣）
-                below_key = f"{cell_x},{cell_y+1}"
-                if below_key not in self.map_grid:
-                    # 這是一個平台邊緣
-                    if cell_y not in platform_edges:
-                        platform_edges[cell_y] = []
-                    platform_edges[cell_y].append(cell_x)
+        # 只有探索旗標（沒有其他地形）且下方從未記錄過的格子是平台邊緣
+        cells = self.grid.cells_with(FLAG_EXPLORED, exact=True)
+        below = self.grid.get_flags(cells + np.array([0, 1]))
+        seen_below = self.grid.get_last_seen(cells + np.array([0, 1]))
+        for cell_x, cell_y in cells[(below == 0) & (seen_below == 0)].tolist():
+            platform_edges.setdefault(cell_y, []).append(cell_x)
     
         # 合併相鄰的邊緣點形成完整平台
         platforms = []
@@ -199,53 +471,64 @@ class MapMemory:
     
     def update_terrain_feature(self, position, feature_type, data=None):
         """動態更新地形特徵"""
-        x, y = position
-        cell_x, cell_y = int(x / self.cell_size), int(y / self.cell_size)
-        key = f"{cell_x},{cell_y}"
-    
-        # 更新網格信息
-        if feature_type == "platform":
-            # 標記為平台
-            self.map_grid[key] = {"type": "platform", "time": time.time(), "data": data}
-        elif feature_type == "obstacle":
-            # 標記為障礙物
-            self.map_grid[key] = {"type": "obstacle", "time": time.time(), "data": data}
-        elif feature_type == "gap":
-            # 標記為間隙（不可行走）
-            self.map_grid[key] = {"type": "gap", "time": time.time(), "data": data}
+        cell = self._cell(position)
     
-        # 標記為已探索
-        self.explored_cells.add((cell_x, cell_y))
-    
-        # 更新相關連接點
-        self._update_connection_points()
+        with self.lock:
+            # 更新網格信息（同時標記為已探索）
+            if feature_type == "platform":
+                # 標記為平台；新出現的平台格使同列上下範圍內物件的連接資訊失效
+                flag = FLAG_PLATFORM
+                if not self.grid.has_flag(cell, FLAG_PLATFORM):
+                    self._invalidate_connections(cell)
+                self.collision_layer.stamp_box(self._cell_box(*cell), CELL_PLATFORM)
+            elif feature_type == "obstacle":
+                # 標記為障礙物
+                flag = FLAG_OBSTACLE
+                self.collision_layer.stamp_box(self._cell_box(*cell), CELL_OBSTACLE)
+            elif feature_type == "gap":
+                # 標記為間隙（不可行走）
+                flag = FLAG_GAP
+            else:
+                flag = 0
+            self.grid.set_flags([cell], flag | FLAG_EXPLORED, time.time())
+        
+            # 更新相關連接點
+            self._update_connection_points()
+
+    def _invalidate_connections(self, cell):
+        """平台格改變時，標記同一列上下 CONNECTION_RANGE 格內的物件需要重新計算"""
+        cell_x, cell_y = cell
+        for item in self._column_objects.get(cell_x, ()):
+            if 0 < abs(item[1][1] - cell_y) <= self.CONNECTION_RANGE:
+                self._dirty_connections.add(item)
 
     def _update_connection_points(self):
-        """更新連接點信息（繩索和傳送點的連接平台）"""
-        # 遍歷所有繩索和傳送點
-        for key, value in self.ropes.items():
-            position = value["position"]
-            x, y = position
-            cell_x, cell_y = int(x / self.cell_size), int(y / self.cell_size)
-        
-            # 查找繩索上下連接的平台
-            platforms = []
+        """更新連接點信息（繩索和傳送點的連接平台），只重新計算被標記的物件"""
+        if not self._dirty_connections:
+            return
+
+        # 物件上方與下方 CONNECTION_RANGE 格的相對位置（上方由遠到近）
+        above = np.arange(-self.CONNECTION_RANGE, 0)
+        below = np.arange(1, self.CONNECTION_RANGE + 1)
+        offsets = np.concatenate([above, below])
+
+        dirty, self._dirty_connections = self._dirty_connections, set()
+        for obj_type, key in dirty:
+            value = self.objects[obj_type].get(key)
+            if value is None:
+                continue
+            cell_x, cell_y = self._cell(value["position"])
         
-            # 向上查找平台
-            for dy in range(-20, 0):
-                check_key = f"{cell_x},{cell_y+dy}"
-                if check_key in self.map_grid and self.map_grid[check_key]["type"] == "platform":
-                    platforms.append((cell_x, cell_y+dy))
-                    break
+            # 一次讀取物件上下整列的平台旗標
+            column = np.stack([np.full(len(offsets), cell_x), cell_y + offsets], axis=1)
+            is_platform = (self.grid.get_flags(column) & FLAG_PLATFORM) != 0
         
-            # 向下查找平台
-            for dy in range(1, 21):
-                check_key = f"{cell_x},{cell_y+dy}"
-                if check_key in self.map_grid and self.map_grid[check_key]["type"] == "platform":
-                    platforms.append((cell_x, cell_y+dy))
-                    break
+            # 查找物件上下連接的平台
+            platforms = []
+            for part in (slice(0, len(above)), slice(len(above), None)):
+                hits = np.nonzero(is_platform[part])[0]
+                if len(hits):
+                    platforms.append((cell_x, int(cell_y + offsets[part][hits[0]])))
         
-            # 更新繩索連接的平台信息
-            self.ropes[key]["connects"] = platforms
-
-
+            # 更新物件連接的平台信息
+            value["connects"] = platforms
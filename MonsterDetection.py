@@ -1,13 +1,40 @@
 import cv2
 import numpy as np
+import io
 import os
 import json
+import time
+import hashlib
+import zipfile
 
 class TemplateMonsterDetector:
     def __init__(self, templates_dir="monster_templates"):
         self.templates_dir = templates_dir
-        self.templates = []
+        self.atlas_file = os.path.join(templates_dir, "templates_atlas.npz")
+        # 模板以內容雜湊為鍵，相同圖像只會保存一份
+        # templates 保存預處理後的灰度圖，mirrored_templates 保存其水平翻轉版本
+        self.templates = {}
+        self.mirrored_templates = {}
         self.template_info = {}
+        self._unloaded_info = {}  # 索引中暫時無法載入的條目，重寫索引時原樣保留
+        self.last_detections = []
+
+        # 搜索區域（ROI）模式：只在上次追蹤到的怪物附近和平台上方進行匹配
+        self.roi_enabled = False
+        self.max_monster_speed = 300     # 怪物最大移動速度（像素/秒）
+        self.platform_band_height = 120  # 平台上方搜索帶的高度
+        self.full_scan_interval = 30     # 每隔多少幀強制全畫面掃描以發現新怪物
+        self.platform_boxes = []
+        self.last_scan_stats = {"full_scan": True, "regions": 0, "area_ratio": 1.0}
+        self._frames_since_full_scan = self.full_scan_interval  # 第一幀總是全畫面掃描
+        self._last_detect_time = None
+
+        # 模板外觀聚類：每幀先以低解析度匹配各聚類的代表模板，
+        # 只有代表模板得分超過預篩閾值的聚類才匹配全部成員
+        self.cluster_similarity = 0.8   # 歸入同一聚類所需的外觀相似度
+        self.prefilter_scale = 0.5      # 預篩時的縮放比例
+        self.prefilter_threshold = 0.5  # 代表模板的預篩閾值
+        self.clusters = []
         
         # 確保模板目錄存在
         os.makedirs(templates_dir, exist_ok=True)
@@ -18,7 +45,7 @@ class TemplateMonsterDetector:
     def add_template(self, template_path=None, template_img=None, name=None):
         """添加模板，可以是圖片路徑或直接提供圖像數據"""
         if template_path and os.path.exists(template_path):
-            template = cv2.imread(template_path)
+            template = self._read_image(template_path)
             template_name = name or os.path.basename(template_path).split('.')[0]
         elif template_img is not None:
             template = template_img
@@ -26,204 +53,552 @@ class TemplateMonsterDetector:
         else:
             print("需要提供有效的模板路徑或圖像數據")
             return False
-        
-        # 儲存模板圖像
-        if not template_path:
-            template_path = os.path.join(self.templates_dir, f"{template_name}.png")
-            cv2.imwrite(template_path, template)
-        
+
+        if template is None or template.size == 0:
+            print("模板圖像無效")
+            return False
+
+        # 內容相同的模板只保存一份
+        key = self._template_key(template)
+        if key in self.templates:
+            print(f"模板已存在，略過: {template_name} (與 {self.template_info[key]['name']} 相同)")
+            return False
+
+        # 儲存模板圖像到模板目錄，索引中只記錄相對路徑
+        relative_path = self._relative_template_path(template_path)
+        if relative_path is None:
+            relative_path = f"{template_name}.png"
+            if os.path.exists(os.path.join(self.templates_dir, relative_path)):
+                relative_path = f"{template_name}_{key[:8]}.png"
+            self._write_image(os.path.join(self.templates_dir, relative_path), template)
+
         # 將模板添加到列表
-        template_info = {
+        self._store_template(key, template, {
             "name": template_name,
-            "path": template_path,
+            "path": relative_path,
             "width": template.shape[1],
             "height": template.shape[0]
-        }
-        
-        self.templates.append(template)
-        self.template_info[len(self.templates)-1] = template_info
-        
-        # 更新模板信息文件
+        })
+
+        # 追加到模板圖集，不重寫既有內容；索引同步更新（保留載入失敗的條目）
+        self._append_to_atlas(key)
         self._save_template_info()
-        
+        self._assign_to_cluster(key)
+
         print(f"已添加模板: {template_name}")
         return True
-    
-    def detect(self, image, threshold=0.7):
-        """在圖像中檢測所有模板"""
-        detections = []
+
+    @property
+    def unique_template_count(self):
+        """去重後實際參與匹配的模板數量"""
+        return len(self.templates)
+
+    def estimate_matching_cost(self, frame_shape):
+        """估算每幀匹配所需的乘加運算量（含水平翻轉）"""
+        frame_h, frame_w = frame_shape[:2]
+        cost = 0
+        for info in self.template_info.values():
+            w, h = info["width"], info["height"]
+            if w > frame_w or h > frame_h:
+                continue
+            cost += (frame_w - w + 1) * (frame_h - h + 1) * w * h
+        return {
+            "templates": self.unique_template_count,
+            "match_passes": self.unique_template_count * 2,
+            "operations": cost * 2
+        }
+
+    def detect(self, image, threshold=0.7, regions=None):
+        """在圖像中檢測所有模板
+
+        regions 可指定搜索區域列表 [(x1, y1, x2, y2), ...]；
+        未指定且啟用ROI模式時，自動根據上次的怪物位置和平台推算搜索區域。
+        """
         img_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # 原始圖像檢測
-        for idx, template in enumerate(self.templates):
-            template_gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY) if len(template.shape) > 2 else template
-            result = cv2.matchTemplate(img_gray, template_gray, cv2.TM_CCOEFF_NORMED)
-            locations = np.where(result >= threshold)
-            for pt in zip(*locations[::-1]):
-                info = self.template_info[str(idx)]
-                w, h = info["width"], info["height"]
-                detections.append({
-                    "class": "monster",
-                    "name": info["name"],
-                    "confidence": float(result[pt[1], pt[0]]),
-                    "box": [pt[0], pt[1], pt[0] + w, pt[1] + h],
-                    "x_center": pt[0] + w/2,
-                    "y_center": pt[1] + h/2,
-                    "width": w,
-                    "height": h
-                })
-        
-        # 水平翻轉圖像檢測
-        flipped_image = cv2.flip(image, 1)
-        flipped_gray = cv2.cvtColor(flipped_image, cv2.COLOR_BGR2GRAY)
-        for idx, template in enumerate(self.templates):
-            template_gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY) if len(template.shape) > 2 else template
-            result = cv2.matchTemplate(flipped_gray, template_gray, cv2.TM_CCOEFF_NORMED)
-            locations = np.where(result >= threshold)
-            for pt in zip(*locations[::-1]):
-                info = self.template_info[str(idx)]
+        frame_h, frame_w = img_gray.shape[:2]
+
+        if regions is None:
+            regions = self._search_regions(frame_w, frame_h)
+        self._update_scan_stats(regions, frame_w, frame_h)
+
+        # 候選框先以數組累積，只有通過NMS的才轉成字典
+        all_boxes = []
+        all_scores = []
+        all_ids = []
+        keys = list(self.templates)
+        key_index = {key: idx for idx, key in enumerate(keys)}
+        evaluated = 0
+
+        for rx1, ry1, rx2, ry2 in regions:
+            search_img = img_gray[ry1:ry2, rx1:rx2]
+            candidate_keys = self._candidate_templates(search_img)
+            evaluated += len(candidate_keys)
+
+            for key in candidate_keys:
+                idx = key_index[key]
+                info = self.template_info[key]
                 w, h = info["width"], info["height"]
-                x = image.shape[1] - pt[0] - w  # 調整x坐標
-                detections.append({
-                    "class": "monster",
-                    "name": info["name"],
-                    "confidence": float(result[pt[1], pt[0]]),
-                    "box": [x, pt[1], x + w, pt[1] + h],
-                    "x_center": x + w/2,
-                    "y_center": pt[1] + h/2,
-                    "width": w,
-                    "height": h
-                })
+                if search_img.shape[0] < h or search_img.shape[1] < w:
+                    continue
+
+                # 原始模板檢測
+                result = cv2.matchTemplate(search_img, self.templates[key], cv2.TM_CCOEFF_NORMED)
+                xs, ys, scores = self._extract_peaks(result, threshold, w, h)
+                xs, ys = xs + rx1, ys + ry1
+                all_boxes.append(np.stack([xs, ys, xs + w, ys + h], axis=1))
+                all_scores.append(scores)
+                all_ids.append(np.full(len(scores), idx))
+
+                # 以翻轉模板檢測朝向相反的怪物，結果座標無需再換算
+                result = cv2.matchTemplate(search_img, self.mirrored_templates[key], cv2.TM_CCOEFF_NORMED)
+                xs, ys, scores = self._extract_peaks(result, threshold, w, h)
+                xs, ys = xs + rx1, ys + ry1
+                all_boxes.append(np.stack([xs, ys, xs + w, ys + h], axis=1))
+                all_scores.append(scores)
+                all_ids.append(np.full(len(scores), idx))
+
+        self.last_scan_stats["templates_evaluated"] = evaluated
+
+        if not all_scores:
+            self.last_detections = []
+            return []
+
+        boxes = np.concatenate(all_boxes)
+        scores = np.concatenate(all_scores)
+        template_ids = np.concatenate(all_ids)
+
+        # 在建立結果字典前應用非極大值抑制
+        keep = self._nms_indices(boxes, scores)
+
+        detections = []
+        for i in keep:
+            info = self.template_info[keys[template_ids[i]]]
+            x1, y1, x2, y2 = (int(v) for v in boxes[i])
+            w, h = info["width"], info["height"]
+            detections.append({
+                "class": "monster",
+                "class_name": "monster",
+                "name": info["name"],
+                "confidence": float(scores[i]),
+                "box": [x1, y1, x2, y2],
+                "bbox": (x1, y1, x2, y2),
+                "x_center": x1 + w/2,
+                "y_center": y1 + h/2,
+                "width": w,
+                "height": h
+            })
         self.last_detections = detections
-        # 在返回結果前應用非極大值抑制
-        detections = self.non_max_suppression(detections)
         return detections
 
-    
+    def set_roi_mode(self, enabled=True):
+        """開啟或關閉搜索區域模式"""
+        self.roi_enabled = enabled
+        self._frames_since_full_scan = self.full_scan_interval
+
+    def set_platforms(self, platform_boxes):
+        """設置已知平台框 [(x1, y1, x2, y2), ...]，用於推算平台上方的搜索帶"""
+        self.platform_boxes = [tuple(int(v) for v in box) for box in platform_boxes]
+
+    def _search_regions(self, frame_w, frame_h):
+        """計算本幀的搜索區域，需要全畫面掃描時返回整個畫面"""
+        now = time.time()
+        dt = 0.0 if self._last_detect_time is None else min(now - self._last_detect_time, 1.0)
+        self._last_detect_time = now
+
+        full_frame = [(0, 0, frame_w, frame_h)]
+        if not self.roi_enabled or not self.templates:
+            return full_frame
+
+        # 定期全畫面掃描，以捕捉新生成的怪物
+        self._frames_since_full_scan += 1
+        if self._frames_since_full_scan >= self.full_scan_interval:
+            self._frames_since_full_scan = 0
+            return full_frame
+
+        # 搜索區域需要容納最大的模板
+        max_w = max(info["width"] for info in self.template_info.values())
+        max_h = max(info["height"] for info in self.template_info.values())
+
+        rects = []
+        # 上次追蹤到的怪物框，按最大速度 × 時間間隔擴張
+        margin = int(self.max_monster_speed * dt)
+        for detection in self.last_detections:
+            x1, y1, x2, y2 = detection["box"]
+            rects.append((x1 - margin, y1 - margin, x2 + margin, y2 + margin))
+
+        # 平台上方的帶狀區域
+        for x1, y1, x2, y2 in self.platform_boxes:
+            rects.append((x1, y1 - self.platform_band_height, x2, y1 + max_h // 2))
+
+        if not rects:
+            self._frames_since_full_scan = 0
+            return full_frame
+
+        regions = []
+        for x1, y1, x2, y2 in rects:
+            # 保證區域不小於模板尺寸，並裁剪到畫面範圍內
+            pad_x = max(0, max_w - (x2 - x1))
+            pad_y = max(0, max_h - (y2 - y1))
+            x1 = max(0, int(x1 - pad_x // 2 - 1))
+            y1 = max(0, int(y1 - pad_y // 2 - 1))
+            x2 = min(frame_w, int(x2 + pad_x // 2 + 1))
+            y2 = min(frame_h, int(y2 + pad_y // 2 + 1))
+            if x2 > x1 and y2 > y1:
+                regions.append((x1, y1, x2, y2))
+
+        return self._merge_regions(regions) or full_frame
+
+    def _merge_regions(self, regions):
+        """合併互相重疊的搜索區域，避免同一區域重複匹配"""
+        merged = list(regions)
+        changed = True
+        while changed:
+            changed = False
+            result = []
+            for region in merged:
+                for i, other in enumerate(result):
+                    if (region[0] <= other[2] and region[2] >= other[0] and
+                            region[1] <= other[3] and region[3] >= other[1]):
+                        result[i] = (min(region[0], other[0]), min(region[1], other[1]),
+                                     max(region[2], other[2]), max(region[3], other[3]))
+                        changed = True
+                        break
+                else:
+                    result.append(region)
+            merged = result
+        return merged
+
+    def _update_scan_stats(self, regions, frame_w, frame_h):
+        """記錄本幀實際匹配的面積比例"""
+        area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions)
+        self.last_scan_stats = {
+            "full_scan": regions == [(0, 0, frame_w, frame_h)],
+            "regions": len(regions),
+            "area_ratio": area / float(frame_w * frame_h)
+        }
+
+    def _build_clusters(self):
+        """將所有模板按外觀重新聚類"""
+        self.clusters = []
+        for key in self.templates:
+            self._assign_to_cluster(key)
+        print(f"模板聚類完成: {len(self.clusters)} 個聚類")
+
+    def _assign_to_cluster(self, key):
+        """將模板歸入最相似的聚類，沒有足夠相似的聚類時自成一類"""
+        template = self.templates[key]
+        descriptor = self._appearance_descriptor(template)
+        h, w = template.shape[:2]
+
+        best_cluster = None
+        best_similarity = self.cluster_similarity
+        for cluster in self.clusters:
+            # 尺寸差異過大的模板不能共用代表模板
+            rep_h, rep_w = cluster["size"]
+            if not (0.8 <= w / rep_w <= 1.25 and 0.8 <= h / rep_h <= 1.25):
+                continue
+            similarity = float(np.dot(descriptor, cluster["descriptor"]))
+            if similarity >= best_similarity:
+                best_cluster = cluster
+                best_similarity = similarity
+
+        if best_cluster is not None:
+            best_cluster["members"].append(key)
+            return
+
+        # 新聚類以此模板為代表，預先生成低解析度版本
+        small = cv2.resize(template, None, fx=self.prefilter_scale, fy=self.prefilter_scale,
+                           interpolation=cv2.INTER_AREA)
+        self.clusters.append({
+            "representative": key,
+            "members": [key],
+            "size": (h, w),
+            "descriptor": descriptor,
+            "small": small,
+            "small_mirrored": cv2.flip(small, 1)
+        })
+
+    def _appearance_descriptor(self, template):
+        """將模板縮放為固定大小並正規化，用於比較外觀相似度"""
+        small = cv2.resize(template, (16, 16), interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+        small -= small.mean()
+        norm = np.linalg.norm(small)
+        return small / norm if norm > 0 else small
+
+    def _candidate_templates(self, search_img):
+        """以代表模板預篩聚類，返回需要完整匹配的模板鍵"""
+        candidates = []
+        small_img = None
+        for cluster in self.clusters:
+            members = cluster["members"]
+            # 單一成員的聚類預篩沒有收益，直接匹配
+            if len(members) == 1:
+                candidates.extend(members)
+                continue
+
+            if small_img is None:
+                small_img = cv2.resize(search_img, None, fx=self.prefilter_scale, fy=self.prefilter_scale,
+                                       interpolation=cv2.INTER_AREA)
+            if self._cluster_score(cluster, small_img) >= self.prefilter_threshold:
+                candidates.extend(members)
+        return candidates
+
+    def _cluster_score(self, cluster, small_img):
+        """代表模板（含翻轉）在低解析度圖像上的最高匹配分數"""
+        best = -1.0
+        for small_template in (cluster["small"], cluster["small_mirrored"]):
+            th, tw = small_template.shape[:2]
+            # 縮小後太小或搜索區域不足時無法預篩，視為通過
+            if th < 4 or tw < 4 or small_img.shape[0] < th or small_img.shape[1] < tw:
+                return 1.0
+            result = cv2.matchTemplate(small_img, small_template, cv2.TM_CCOEFF_NORMED)
+            best = max(best, cv2.minMaxLoc(result)[1])
+        return best
+
+    def _extract_peaks(self, result, threshold, width, height):
+        """從匹配響應圖中提取局部極大值，每個響應區塊只保留一個候選點"""
+        # 膨脹核取模板一半大小，確保同一個目標周圍的像素不會各自成為候選
+        kernel_w = max(3, (width // 2) | 1)
+        kernel_h = max(3, (height // 2) | 1)
+        kernel = np.ones((kernel_h, kernel_w), np.uint8)
+        dilated = cv2.dilate(result, kernel)
+
+        peak_mask = (result >= threshold) & (result == dilated)
+        ys, xs = np.nonzero(peak_mask)
+        return xs, ys, result[ys, xs]
+
     def load_templates(self):
-        """載入所有保存的模板"""
+        """載入所有保存的模板
+
+        優先從模板圖集一次讀入預處理好的灰度與翻轉數組；
+        圖集不存在或缺少索引中的條目時，才從 templates_info.json 和PNG檔案遷移，並生成圖集。
+        """
+        self.templates = {}
+        self.mirrored_templates = {}
+        self.template_info = {}
+        self._unloaded_info = {}
+
         info_file = os.path.join(self.templates_dir, "templates_info.json")
-        
-        # 載入模板信息
+        stored_info = None
         if os.path.exists(info_file):
-            with open(info_file, 'r') as f:
-                self.template_info = json.load(f)
-        else:
-        # 如果JSON檔案不存在，創建一個空的並保存
+            with open(info_file, 'r', encoding='utf-8') as f:
+                stored_info = json.load(f)
+
+        if os.path.exists(self.atlas_file):
+            try:
+                self._load_atlas()
+                # 索引中有圖集沒有的條目（例如之前載入失敗的模板）時，從索引重新載入
+                missing = [key for key in stored_info or {} if key not in self.template_info]
+                if not missing:
+                    self._build_clusters()
+                    print(f"已從圖集載入 {self.unique_template_count} 個模板")
+                    return
+                print(f"索引中有 {len(missing)} 個模板不在圖集中，改為從索引重建")
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+                print(f"模板圖集損壞，改為從索引重建: {str(e)}")
+            self.templates = {}
+            self.mirrored_templates = {}
             self.template_info = {}
+
+        # 載入模板信息
+        if stored_info is None:
+        # 如果JSON檔案不存在，創建一個空的並保存
             self._save_template_info()
+            return
+
+        # 載入模板圖像，內容重複的模板在載入時合併
+        duplicates = 0
+        for stored_key, info in stored_info.items():
+            path = self._resolve_template_path(info["path"])
+            if path is None:
+                print(f"警告: 模板文件不存在 {info['path']}")
+                self._unloaded_info[stored_key] = info
+                continue
+
+            template = self._read_image(path)
+            if template is None:
+                print(f"警告: 無法讀取模板文件 {path}")
+                self._unloaded_info[stored_key] = info
+                continue
+
+            key = self._template_key(template)
+            if key in self.templates:
+                duplicates += 1
+                continue
+
+            self._store_template(key, template, {
+                "name": info["name"],
+                "path": self._relative_template_path(path) or path,
+                "width": template.shape[1],
+                "height": template.shape[0]
+            })
+
+        # 合併重複項或轉換舊格式（數字索引、絕對路徑）時重寫索引，載入失敗的條目原樣保留
+        if duplicates or (not self._unloaded_info and stored_info != self.template_info):
+            self._save_template_info()
+        # 有條目載入失敗時不生成圖集，下次啟動仍從索引重新嘗試
+        if self._unloaded_info:
+            print(f"警告: {len(self._unloaded_info)} 個模板無法載入，已保留在索引中")
+        else:
+            self._write_atlas()
+        self._build_clusters()
+
+        print(f"已載入 {self.unique_template_count} 個模板（合併 {duplicates} 個重複項）")
 
-        # 載入模板圖像
-        self.templates = []
-        for idx in sorted([int(k) for k in self.template_info.keys()]):
-            idx_str = str(idx)
-            if idx_str in self.template_info:
-                path = self.template_info[idx_str]["path"]
-                if os.path.exists(path):
-                    template = cv2.imread(path)
-                    self.templates.append(template)
-                else:
-                    print(f"警告: 模板文件不存在 {path}")
-    
     def clear_templates(self):
         """清除所有模板"""
-        self.templates = []
+        self.templates = {}
+        self.mirrored_templates = {}
         self.template_info = {}
+        self._unloaded_info = {}
+        self.clusters = []
         self._save_template_info()
+        if os.path.exists(self.atlas_file):
+            os.remove(self.atlas_file)
         print("已清除所有模板")
 
 
     def _save_template_info(self):
         """保存模板信息到JSON文件"""
-        # 重新整理索引
-        new_template_info = {}
-        for i, idx in enumerate(sorted([int(k) for k in self.template_info.keys()])):
-            new_template_info[str(i)] = self.template_info[str(idx)]
-    
-        self.template_info = new_template_info
-    
         info_file = os.path.join(self.templates_dir, "templates_info.json")
-        with open(info_file, 'w') as f:
-            json.dump(self.template_info, f, indent=2)
-        
-    def add_template(self, template_path=None, template_img=None, name=None):
-        """添加模板，可以是圖片路徑或直接提供圖像數據"""
-        if template_path and os.path.exists(template_path):
-            template = cv2.imread(template_path)
-            template_name = name or os.path.basename(template_path).split('.')[0]
-        elif template_img is not None:
-            template = template_img
-            template_name = name or f"template_{len(self.templates)}"
-        else:
-            print("需要提供有效的模板路徑或圖像數據")
-            return False
-    
-        # 儲存模板圖像
-        if not template_path:
-            template_path = os.path.join(self.templates_dir, f"{template_name}.png")
-            cv2.imwrite(template_path, template)
-    
-        # 將模板添加到列表
-        template_info = {
-            "name": template_name,
-            "path": template_path,
-            "width": template.shape[1],
-            "height": template.shape[0]
-        }
-    
-        self.templates.append(template)
-        new_idx = str(len(self.template_info))  # 使用新的索引
-        self.template_info[new_idx] = template_info
-    
-        # 更新模板信息文件
-        self._save_template_info()
-    
-        print(f"已添加模板: {template_name}")
-        return True      
+        with open(info_file, 'w', encoding='utf-8') as f:
+            json.dump({**self._unloaded_info, **self.template_info}, f, indent=2)
+
+    def _read_image(self, path):
+        """讀取圖像（支援非ASCII路徑），失敗時返回None"""
+        try:
+            data = np.fromfile(path, dtype=np.uint8)
+        except OSError:
+            return None
+        return cv2.imdecode(data, cv2.IMREAD_COLOR) if data.size else None
+
+    def _write_image(self, path, image):
+        """寫入圖像（支援非ASCII路徑）"""
+        ok, buffer = cv2.imencode(os.path.splitext(path)[1] or ".png", image)
+        if ok:
+            buffer.tofile(path)
+        return ok
+
+    def _store_template(self, key, template, info):
+        """預處理模板並放入記憶體中的模板庫"""
+        template_gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY) if len(template.shape) > 2 else template
+        self.templates[key] = np.ascontiguousarray(template_gray)
+        self.mirrored_templates[key] = np.ascontiguousarray(cv2.flip(template_gray, 1))
+        self.template_info[key] = info
+
+    def _load_atlas(self):
+        """一次讀入整個圖集檔案並還原模板數組與信息"""
+        with open(self.atlas_file, 'rb') as f:
+            data = f.read()
+
+        with np.load(io.BytesIO(data), allow_pickle=False) as atlas:
+            for member in atlas.files:
+                key, field = member.rsplit(".", 1)
+                if field == "meta":
+                    self.template_info[key] = json.loads(atlas[member].tobytes().decode('utf-8'))
+                elif field == "gray":
+                    self.templates[key] = atlas[member]
+                elif field == "mirrored":
+                    self.mirrored_templates[key] = atlas[member]
+
+        # 缺少任何一部分的條目視為不完整，直接捨棄
+        for key in list(self.template_info):
+            if key not in self.templates or key not in self.mirrored_templates:
+                del self.template_info[key]
+                self.templates.pop(key, None)
+                self.mirrored_templates.pop(key, None)
+
+    def _write_atlas(self):
+        """將所有模板重新寫入圖集（遷移或圖集尚不存在時使用）"""
+        with zipfile.ZipFile(self.atlas_file, 'w', zipfile.ZIP_STORED) as atlas:
+            for key in self.templates:
+                self._write_atlas_entry(atlas, key)
+
+    def _append_to_atlas(self, key):
+        """將單個模板追加到圖集末尾，圖集尚不存在時寫入完整圖集"""
+        if not os.path.exists(self.atlas_file):
+            self._write_atlas()
+            return
+        with zipfile.ZipFile(self.atlas_file, 'a', zipfile.ZIP_STORED) as atlas:
+            self._write_atlas_entry(atlas, key)
+
+    def _write_atlas_entry(self, atlas, key):
+        """寫入單個模板的信息、灰度圖和翻轉圖"""
+        meta = np.frombuffer(json.dumps(self.template_info[key]).encode('utf-8'), dtype=np.uint8)
+        entries = (("meta", meta), ("gray", self.templates[key]), ("mirrored", self.mirrored_templates[key]))
+        for field, array in entries:
+            with atlas.open(f"{key}.{field}.npy", 'w') as f:
+                np.lib.format.write_array(f, array, allow_pickle=False)
+
+    def _template_key(self, template):
+        """以圖像尺寸和像素內容計算模板的雜湊鍵"""
+        digest = hashlib.sha1(str(template.shape).encode())
+        digest.update(np.ascontiguousarray(template).tobytes())
+        return digest.hexdigest()[:16]
+
+    def _resolve_template_path(self, path):
+        """解析索引中的模板路徑，兼容舊版的絕對路徑和Windows分隔符"""
+        normalized = path.replace("\\", "/")
+        candidates = [
+            os.path.join(self.templates_dir, normalized),
+            normalized,
+            os.path.join(self.templates_dir, os.path.basename(normalized))
+        ]
+        for candidate in candidates:
+            if os.path.exists(candidate):
+                return candidate
+        return None
+
+    def _relative_template_path(self, path):
+        """返回相對於模板目錄的路徑，不在模板目錄內則返回None"""
+        if not path:
+            return None
+        templates_root = os.path.abspath(self.templates_dir)
+        absolute_path = os.path.abspath(path)
+        if os.path.dirname(absolute_path) != templates_root:
+            return None
+        return os.path.basename(absolute_path)
 
     def non_max_suppression(self, detections, overlap_thresh=0.3):
         """應用非極大值抑制來減少重複檢測"""
         if len(detections) == 0:
             return []
-    
-        # 轉換為numpy數組以便處理
+
         boxes = np.array([d["box"] for d in detections])
         scores = np.array([d["confidence"] for d in detections])
-    
+        keep = self._nms_indices(boxes, scores, overlap_thresh)
+
+        # 返回保留的檢測結果
+        return [detections[i] for i in keep]
+
+    def _nms_indices(self, boxes, scores, overlap_thresh=0.3):
+        """以數組形式執行非極大值抑制，返回保留框的索引（按置信度由高到低）"""
+        if len(scores) == 0:
+            return []
+
+        # 按照置信度排序
+        order = np.argsort(-scores, kind="stable")
+        boxes = boxes[order].astype(np.float64)
+
         # 計算每個框的面積
         x1 = boxes[:, 0]
         y1 = boxes[:, 1]
         x2 = boxes[:, 2]
         y2 = boxes[:, 3]
         area = (x2 - x1 + 1) * (y2 - y1 + 1)
-    
-        # 按照置信度排序
-        idxs = np.argsort(scores)
-    
-        # 保留的檢測結果
-        pick = []
-    
-        while len(idxs) > 0:
-            # 取最高置信度的框
-            last = len(idxs) - 1
-            i = idxs[last]
-            pick.append(i)
-        
-            # 找出與當前框重疊的所有框
-            xx1 = np.maximum(x1[i], x1[idxs[:last]])
-            yy1 = np.maximum(y1[i], y1[idxs[:last]])
-            xx2 = np.minimum(x2[i], x2[idxs[:last]])
-            yy2 = np.minimum(y2[i], y2[idxs[:last]])
-        
-            # 計算重疊區域的寬高
-            w = np.maximum(0, xx2 - xx1 + 1)
-            h = np.maximum(0, yy2 - yy1 + 1)
-        
-            # 計算重疊比例
-            overlap = (w * h) / area[idxs[:last]]
-        
-            # 刪除重疊比例大於閾值的框
-            idxs = np.delete(idxs, np.concatenate(([last], np.where(overlap > overlap_thresh)[0])))
-    
-        # 返回保留的檢測結果
-        return [detections[i] for i in pick]  
\ No newline at end of file
+
+        # 一次計算所有框之間的重疊比例（相對於被抑制框的面積）
+        w = np.maximum(0, np.minimum(x2[:, None], x2[None, :]) - np.maximum(x1[:, None], x1[None, :]) + 1)
+        h = np.maximum(0, np.minimum(y2[:, None], y2[None, :]) - np.maximum(y1[:, None], y1[None, :]) + 1)
+        overlap = (w * h) / area[None, :]
+
+        # 依序保留最高置信度的框，並抑制與其重疊過多的框
+        suppressed = np.zeros(len(order), dtype=bool)
+        keep = []
+        for i in range(len(order)):
+            if suppressed[i]:
+                continue
+            keep.append(order[i])
+            suppressed |= overlap[i] > overlap_thresh
+
+        return keep
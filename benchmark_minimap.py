@@ -0,0 +1,117 @@
+# benchmark_minimap.py - 比較傳統小地圖檢測與小地圖YOLO模型的準確度和延遲
+import argparse
+import glob
+import os
+import time
+import cv2
+import numpy as np
+from detection import YOLODetector
+from minimap_engine import ClassicalMinimapDetector
+
+
+def load_minimaps(image_dir):
+    """讀取錄製的小地圖截圖"""
+    paths = []
+    for pattern in ("*.png", "*.jpg", "*.jpeg"):
+        paths.extend(glob.glob(os.path.join(image_dir, pattern)))
+
+    images = []
+    for path in sorted(paths):
+        image = cv2.imread(path)
+        if image is None:
+            print(f"警告: 無法讀取圖像 {path}")
+            continue
+        images.append((path, image))
+    return images
+
+
+def timed_detect(detect, image):
+    """執行一次檢測並返回結果與耗時（毫秒）"""
+    start = time.perf_counter()
+    detections = detect(image)
+    return detections, (time.perf_counter() - start) * 1000
+
+
+def match_detections(reference, candidates, max_distance):
+    """按類別以中心點距離配對，返回 {類別: [配對數, 參考數, 候選數]}"""
+    stats = {}
+    classes = {d["class_name"] for d in reference} | {d["class_name"] for d in candidates}
+    for class_name in classes:
+        ref = np.array([_center(d) for d in reference if d["class_name"] == class_name]).reshape(-1, 2)
+        cand = np.array([_center(d) for d in candidates if d["class_name"] == class_name]).reshape(-1, 2)
+
+        matched = 0
+        if len(ref) and len(cand):
+            distances = np.linalg.norm(ref[:, None, :] - cand[None, :, :], axis=2)
+            # 貪婪配對：每次取距離最近的一對
+            while distances.size and distances.min() <= max_distance:
+                i, j = np.unravel_index(np.argmin(distances), distances.shape)
+                matched += 1
+                distances[i, :] = np.inf
+                distances[:, j] = np.inf
+
+        stats[class_name] = [matched, len(ref), len(cand)]
+    return stats
+
+
+def _center(detection):
+    x1, y1, x2, y2 = detection["bbox"]
+    return ((x1 + x2) / 2, (y1 + y2) / 2)
+
+
+def summarize_latency(name, latencies):
+    latencies = np.array(latencies)
+    print(f"{name}: 平均 {latencies.mean():.2f} ms, 中位數 {np.median(latencies):.2f} ms, "
+          f"P95 {np.percentile(latencies, 95):.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較傳統小地圖檢測與YOLO小地圖模型")
+    parser.add_argument("images", help="錄製的小地圖截圖目錄")
+    parser.add_argument("--model", default="MODELS/SmallObjects.pt", help="小地圖YOLO模型路徑")
+    parser.add_argument("--conf", type=float, default=0.5, help="YOLO置信度閾值")
+    parser.add_argument("--max-distance", type=float, default=4.0, help="中心點配對的最大距離（像素）")
+    args = parser.parse_args()
+
+    images = load_minimaps(args.images)
+    if not images:
+        print(f"錯誤: {args.images} 中沒有可用的小地圖截圖")
+        return
+
+    yolo = YOLODetector(minimap_model_path=args.model, confidence_threshold=args.conf)
+    if yolo.minimap_model is None:
+        print(f"錯誤: 無法載入小地圖模型 {args.model}")
+        return
+    classical = ClassicalMinimapDetector()
+
+    # 預熱，避免首次推論的初始化時間影響結果
+    yolo.detect(images[0][1], model_type='minimap')
+    classical.detect(images[0][1])
+
+    yolo_latencies = []
+    classical_latencies = []
+    totals = {}
+    for path, image in images:
+        reference, yolo_ms = timed_detect(lambda img: yolo.detect(img, model_type='minimap'), image)
+        candidates, classical_ms = timed_detect(classical.detect, image)
+        yolo_latencies.append(yolo_ms)
+        classical_latencies.append(classical_ms)
+
+        for class_name, counts in match_detections(reference, candidates, args.max_distance).items():
+            total = totals.setdefault(class_name, [0, 0, 0])
+            for i in range(3):
+                total[i] += counts[i]
+
+    print(f"共 {len(images)} 張小地圖，以YOLO結果作為參考")
+    for class_name, (matched, ref_count, cand_count) in sorted(totals.items()):
+        recall = matched / ref_count if ref_count else float("nan")
+        precision = matched / cand_count if cand_count else float("nan")
+        print(f"  {class_name}: 召回率 {recall:.3f} ({matched}/{ref_count}), "
+              f"精確率 {precision:.3f} ({matched}/{cand_count})")
+
+    summarize_latency("YOLO", yolo_latencies)
+    summarize_latency("傳統檢測", classical_latencies)
+
+
+if __name__ == "__main__":
+    main()
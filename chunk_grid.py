@@ -0,0 +1,185 @@
+import numpy as np
+
+# 格子旗標（同一格可同時具有多個旗標）
+FLAG_EXPLORED = 1
+FLAG_PLATFORM = 2
+FLAG_OBSTACLE = 4
+FLAG_GAP = 8
+
+
+class ChunkedGrid:
+    """分塊的整數座標網格
+
+    每個區塊是 chunk_size × chunk_size 的 NumPy 陣列（uint8 旗標層與 float64 最後觀測時間層（時間戳需要 float64 精度）），
+    只在第一次寫入時分配，以區塊座標 (chunk_x, chunk_y) 為鍵。讀寫都以格座標數組批量進行。
+    被修改的區塊記錄在 dirty 中供增量保存；pending 中的區塊在第一次存取時才由 loader 從磁碟載入。
+    """
+
+    def __init__(self, chunk_size=64):
+        self.chunk_size = chunk_size
+        self.chunks = {}  # (chunk_x, chunk_y) -> {"flags": uint8陣列, "last_seen": float64陣列}
+        self.dirty = set()     # 自上次保存後修改過的區塊
+        self.pending = set()   # 磁碟上存在但尚未載入的區塊
+        self.loader = None     # loader(區塊鍵) -> 區塊字典
+
+    def __len__(self):
+        return len(self.chunks) + len(self.pending)
+
+    def _get_chunk(self, key, create=False):
+        """取得區塊，必要時從磁碟載入或建立"""
+        chunk = self.chunks.get(key)
+        if chunk is None and key in self.pending:
+            self.pending.discard(key)
+            chunk = self.loader(key) if self.loader else None
+            if chunk is not None:
+                self.chunks[key] = chunk
+        if chunk is None and create:
+            chunk = self.chunks[key] = self._new_chunk()
+        return chunk
+
+    def load_all(self):
+        """載入所有尚未載入的區塊"""
+        for key in list(self.pending):
+            self._get_chunk(key)
+
+    def _new_chunk(self):
+        size = self.chunk_size
+        return {
+            "flags": np.zeros((size, size), dtype=np.uint8),
+            "last_seen": np.zeros((size, size), dtype=np.float64)
+        }
+
+    def _split(self, cells):
+        """格座標 -> (區塊座標, 區塊內座標)"""
+        cells = np.asarray(cells, dtype=np.int64).reshape(-1, 2)
+        chunk = np.floor_divide(cells, self.chunk_size)
+        local = cells - chunk * self.chunk_size
+        return chunk, local
+
+    def _groups(self, cells):
+        """按區塊分組，逐一產生 (區塊鍵, 該組在輸入中的索引, 區塊內座標)"""
+        chunk, local = self._split(cells)
+        if not len(chunk):
+            return
+        keys, inverse = np.unique(chunk, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.searchsorted(inverse[order], np.arange(len(keys) + 1))
+        for i, (cx, cy) in enumerate(keys):
+            indices = order[bounds[i]:bounds[i + 1]]
+            yield (int(cx), int(cy)), indices, local[indices]
+
+    def set_flags(self, cells, flags, timestamp=None):
+        """為多個格子加上旗標；flags 為 0 時只更新觀測時間"""
+        for key, _, local in self._groups(cells):
+            chunk = self._get_chunk(key, create=True)
+            if flags:
+                chunk["flags"][local[:, 1], local[:, 0]] |= flags
+            if timestamp is not None:
+                chunk["last_seen"][local[:, 1], local[:, 0]] = timestamp
+            # 修改完成後才標記，保存線程取走標記後的修改會在下次保存
+            self.dirty.add(key)
+
+    def clear_flags(self, cells, flags):
+        """移除多個格子的旗標"""
+        for key, _, local in self._groups(cells):
+            chunk = self._get_chunk(key)
+            if chunk is not None:
+                chunk["flags"][local[:, 1], local[:, 0]] &= np.uint8(~flags & 0xFF)
+                self.dirty.add(key)
+
+    def get_flags(self, cells):
+        """讀取多個格子的旗標，未分配的區塊為 0"""
+        cells = np.asarray(cells, dtype=np.int64).reshape(-1, 2)
+        result = np.zeros(len(cells), dtype=np.uint8)
+        for key, indices, local in self._groups(cells):
+            chunk = self._get_chunk(key)
+            if chunk is not None:
+                result[indices] = chunk["flags"][local[:, 1], local[:, 0]]
+        return result
+
+    def get_last_seen(self, cells):
+        """讀取多個格子的最後觀測時間，未觀測為 0"""
+        cells = np.asarray(cells, dtype=np.int64).reshape(-1, 2)
+        result = np.zeros(len(cells), dtype=np.float64)
+        for key, indices, local in self._groups(cells):
+            chunk = self._get_chunk(key)
+            if chunk is not None:
+                result[indices] = chunk["last_seen"][local[:, 1], local[:, 0]]
+        return result
+
+    def has_flag(self, cell, flag):
+        """單一格子是否具有旗標"""
+        chunk_x, local_x = divmod(int(cell[0]), self.chunk_size)
+        chunk_y, local_y = divmod(int(cell[1]), self.chunk_size)
+        chunk = self._get_chunk((chunk_x, chunk_y))
+        return chunk is not None and bool(chunk["flags"][local_y, local_x] & flag)
+
+    def read_region(self, x1, y1, x2, y2, layer="flags"):
+        """讀取格座標範圍 [x1, x2] × [y1, y2] 的稠密陣列（列為 y）"""
+        dtype = np.uint8 if layer == "flags" else np.float64
+        region = np.zeros((y2 - y1 + 1, x2 - x1 + 1), dtype=dtype)
+        size = self.chunk_size
+        for cy in range(y1 // size, y2 // size + 1):
+            for cx in range(x1 // size, x2 // size + 1):
+                chunk = self._get_chunk((cx, cy))
+                if chunk is None:
+                    continue
+                gx1, gy1 = max(x1, cx * size), max(y1, cy * size)
+                gx2, gy2 = min(x2, cx * size + size - 1), min(y2, cy * size + size - 1)
+                region[gy1 - y1:gy2 - y1 + 1, gx1 - x1:gx2 - x1 + 1] = \
+                    chunk[layer][gy1 - cy * size:gy2 - cy * size + 1, gx1 - cx * size:gx2 - cx * size + 1]
+        return region
+
+    def write_region(self, x1, y1, values, layer="flags", mode="set"):
+        """把稠密陣列寫入以 (x1, y1) 為左上角的格子範圍；mode 為 "set" 或 "or"（僅旗標層）"""
+        values = np.asarray(values)
+        y2, x2 = y1 + values.shape[0] - 1, x1 + values.shape[1] - 1
+        size = self.chunk_size
+        for cy in range(y1 // size, y2 // size + 1):
+            for cx in range(x1 // size, x2 // size + 1):
+                gx1, gy1 = max(x1, cx * size), max(y1, cy * size)
+                gx2, gy2 = min(x2, cx * size + size - 1), min(y2, cy * size + size - 1)
+                source = values[gy1 - y1:gy2 - y1 + 1, gx1 - x1:gx2 - x1 + 1]
+                chunk = self._get_chunk((cx, cy), create=bool(source.any()))
+                if chunk is None:
+                    continue
+                target = chunk[layer][gy1 - cy * size:gy2 - cy * size + 1, gx1 - cx * size:gx2 - cx * size + 1]
+                if mode == "or":
+                    target |= source.astype(target.dtype)
+                else:
+                    target[...] = source
+                self.dirty.add((cx, cy))
+
+    def cells_with(self, flag, exact=False):
+        """返回具有旗標的所有格座標 (N×2)；exact 為 True 時旗標必須完全相等"""
+        self.load_all()
+        found = []
+        for (cx, cy), chunk in list(self.chunks.items()):
+            flags = chunk["flags"]
+            mask = flags == flag if exact else (flags & flag) != 0
+            ys, xs = np.nonzero(mask)
+            if len(xs):
+                found.append(np.stack([xs + cx * self.chunk_size, ys + cy * self.chunk_size], axis=1))
+        return np.concatenate(found) if found else np.zeros((0, 2), dtype=np.int64)
+
+    def clear(self):
+        self.chunks.clear()
+        self.dirty.clear()
+        self.pending.clear()
+
+    def take_dirty(self):
+        """取走需要保存的區塊，返回 {區塊鍵: 區塊陣列的副本}"""
+        keys, self.dirty = self.dirty, set()
+        snapshot = {}
+        for key in keys:
+            chunk = self.chunks.get(key)
+            if chunk is not None:
+                snapshot[key] = {name: layer.copy() for name, layer in chunk.items()}
+        return snapshot
+
+    def set_pending(self, keys, loader):
+        """清空網格，改為延遲載入磁碟上的區塊"""
+        self.clear()
+        self.pending = set(keys)
+        self.loader = loader
@@ -0,0 +1,170 @@
+import math
+import cv2
+import numpy as np
+
+# 柵格類別編號，數值越大優先權越高（重疊時保留較大者）
+CELL_EMPTY = 0      # 未知或空氣
+CELL_WALKABLE = 1   # 已探索、可通行
+CELL_PLATFORM = 2   # 平台/地面
+CELL_OBSTACLE = 3   # 障礙物
+
+WALKABLE_CELLS = (CELL_WALKABLE, CELL_PLATFORM)
+
+
+class CollisionLayer:
+    """單一地圖的碰撞柵格（世界座標），每格一個 uint8 類別編號
+
+    地形檢測與地圖記憶把外框蓋印到柵格上；點查詢為直接索引，
+    外框查詢使用各類別的積分圖（summed-area table），線段查詢一次取樣整條線。
+    柵格在蓋印超出範圍時自動擴大。
+    """
+
+    def __init__(self, resolution=10, grow_margin=64):
+        self.resolution = resolution      # 每格代表的世界像素
+        self.grow_margin = grow_margin    # 擴大柵格時額外保留的格數
+        self.origin = (0, 0)              # grid[0, 0] 對應的格座標
+        self.grid = np.zeros((0, 0), dtype=np.uint8)
+        self.version = 0                  # 每次修改遞增，供增量保存判斷是否需要寫入
+        self._integrals = {}
+
+    @property
+    def bounds(self):
+        """柵格覆蓋的世界範圍 (x1, y1, x2, y2)"""
+        ox, oy = self.origin
+        h, w = self.grid.shape
+        r = self.resolution
+        return (ox * r, oy * r, (ox + w) * r, (oy + h) * r)
+
+    def _cell_range(self, box):
+        x1, y1, x2, y2 = box
+        r = self.resolution
+        return (math.floor(x1 / r), math.floor(y1 / r), math.floor(x2 / r), math.floor(y2 / r))
+
+    def _ensure(self, cx1, cy1, cx2, cy2):
+        """確保格座標範圍在柵格內，必要時擴大柵格"""
+        ox, oy = self.origin
+        h, w = self.grid.shape
+        if self.grid.size and cx1 >= ox and cy1 >= oy and cx2 < ox + w and cy2 < oy + h:
+            return
+
+        m = self.grow_margin
+        if self.grid.size:
+            nx1, ny1 = min(cx1 - m, ox), min(cy1 - m, oy)
+            nx2, ny2 = max(cx2 + m, ox + w - 1), max(cy2 + m, oy + h - 1)
+        else:
+            nx1, ny1, nx2, ny2 = cx1 - m, cy1 - m, cx2 + m, cy2 + m
+
+        grid = np.zeros((ny2 - ny1 + 1, nx2 - nx1 + 1), dtype=np.uint8)
+        if self.grid.size:
+            grid[oy - ny1:oy - ny1 + h, ox - nx1:ox - nx1 + w] = self.grid
+        self.grid = grid
+        self.origin = (nx1, ny1)
+        self._integrals.clear()
+
+    def stamp_box(self, box, class_id):
+        """把世界座標外框蓋印為指定類別（不會覆蓋優先權更高的類別）"""
+        cx1, cy1, cx2, cy2 = self._cell_range(box)
+        if cx2 < cx1 or cy2 < cy1:
+            return
+        self._ensure(cx1, cy1, cx2, cy2)
+        ox, oy = self.origin
+        region = self.grid[cy1 - oy:cy2 - oy + 1, cx1 - ox:cx2 - ox + 1]
+        np.maximum(region, class_id, out=region)
+        self._integrals.clear()
+        self.version += 1
+
+    def stamp_boxes(self, boxes, class_id):
+        """蓋印多個外框"""
+        for box in np.asarray(boxes, dtype=np.float64).reshape(-1, 4):
+            self.stamp_box(box, class_id)
+
+    def clear(self):
+        self.origin = (0, 0)
+        self.grid = np.zeros((0, 0), dtype=np.uint8)
+        self._integrals.clear()
+        self.version += 1
+
+    def _indices(self, points):
+        """世界座標點 -> (列, 行, 是否在柵格內)"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        cols = np.floor(points[:, 0] / self.resolution).astype(np.int64) - self.origin[0]
+        rows = np.floor(points[:, 1] / self.resolution).astype(np.int64) - self.origin[1]
+        h, w = self.grid.shape
+        inside = (cols >= 0) & (cols < w) & (rows >= 0) & (rows < h)
+        return np.where(inside, rows, 0), np.where(inside, cols, 0), inside
+
+    def values_at(self, points):
+        """一次查詢多個世界座標點的類別，柵格外為 CELL_EMPTY"""
+        rows, cols, inside = self._indices(points)
+        if not self.grid.size:
+            return np.zeros(len(rows), dtype=np.uint8)
+        return np.where(inside, self.grid[rows, cols], CELL_EMPTY).astype(np.uint8)
+
+    def value_at(self, point):
+        """查詢單一世界座標點的類別"""
+        return int(self.values_at(point)[0])
+
+    def _integral(self, classes):
+        key = tuple(sorted(classes))
+        integral = self._integrals.get(key)
+        if integral is None:
+            mask = np.isin(self.grid, key).astype(np.uint8)
+            integral = cv2.integral(mask, sdepth=cv2.CV_32S)
+            self._integrals[key] = integral
+        return integral
+
+    def count_in_box(self, box, classes):
+        """以積分圖計算外框內屬於 classes 的格數"""
+        if not self.grid.size:
+            return 0
+        cx1, cy1, cx2, cy2 = self._cell_range(box)
+        ox, oy = self.origin
+        h, w = self.grid.shape
+        c1, r1 = max(cx1 - ox, 0), max(cy1 - oy, 0)
+        c2, r2 = min(cx2 - ox + 1, w), min(cy2 - oy + 1, h)
+        if c2 <= c1 or r2 <= r1:
+            return 0
+        integral = self._integral(classes)
+        return int(integral[r2, c2] - integral[r1, c2] - integral[r2, c1] + integral[r1, c1])
+
+    def box_contains(self, box, classes):
+        """外框內是否有任何屬於 classes 的格"""
+        return self.count_in_box(box, classes) > 0
+
+    def sample_line(self, start, end):
+        """以半格間距取樣線段，返回 (取樣點 N×2, 類別 N)"""
+        start = np.asarray(start, dtype=np.float64)
+        end = np.asarray(end, dtype=np.float64)
+        length = float(np.linalg.norm(end - start))
+        count = max(2, int(math.ceil(length / (self.resolution * 0.5))) + 1)
+        t = np.linspace(0.0, 1.0, count)[:, None]
+        points = start + (end - start) * t
+        return points, self.values_at(points)
+
+    def line_all(self, start, end, classes):
+        """線段上的所有取樣點是否都屬於 classes"""
+        _, values = self.sample_line(start, end)
+        return bool(np.isin(values, classes).all())
+
+    def cast_ray(self, origin, direction, max_distance, classes):
+        """沿方向取樣，返回第一個屬於 classes 的點的距離，射程內沒有時返回 inf"""
+        direction = np.asarray(direction, dtype=np.float64)
+        direction = direction / max(np.linalg.norm(direction), 1e-9)
+        origin = np.asarray(origin, dtype=np.float64)
+        points, values = self.sample_line(origin, origin + direction * max_distance)
+        hits = np.nonzero(np.isin(values, classes))[0]
+        if not len(hits):
+            return float("inf")
+        return float(np.linalg.norm(points[hits[0]] - origin))
+
+    def to_dict(self):
+        """轉換為可保存的字典"""
+        return {"resolution": self.resolution, "origin": self.origin, "grid": self.grid}
+
+    def load_dict(self, data):
+        """從保存的字典還原"""
+        self.resolution = data.get("resolution", self.resolution)
+        self.origin = tuple(data.get("origin", (0, 0)))
+        self.grid = np.asarray(data.get("grid", np.zeros((0, 0))), dtype=np.uint8)
+        self._integrals.clear()
+        self.version += 1
@@ -1,19 +1,196 @@
+import cv2
+import numpy as np
+
+
+class CameraMotionEstimator:
+    """以相位相關估計相鄰兩幀之間的鏡頭位移
+
+    只使用縮小後的畫面中段（上方小地圖與下方狀態欄固定不動，會把結果拉向零位移）。
+    """
+
+    def __init__(self, downscale=0.25, min_response=0.1, exclude_top=0.2, exclude_bottom=0.12):
+        self.downscale = downscale            # 縮小比例，越小越快但精度越低
+        self.min_response = min_response      # 相位相關峰值低於此值時視為不可靠
+        self.exclude_top = exclude_top        # 忽略畫面上方的比例
+        self.exclude_bottom = exclude_bottom  # 忽略畫面下方的比例
+        self.last_response = 0.0
+        self._previous = None
+        self._window = None
+
+    def _prepare(self, frame):
+        h = frame.shape[0]
+        band = frame[int(h * self.exclude_top):int(h * (1 - self.exclude_bottom))]
+        gray = cv2.cvtColor(band, cv2.COLOR_BGR2GRAY) if band.ndim == 3 else band
+        small = cv2.resize(gray, None, fx=self.downscale, fy=self.downscale, interpolation=cv2.INTER_AREA)
+        return small.astype(np.float32)
+
+    def update(self, frame):
+        """加入新的一幀，返回鏡頭自上一幀以來的位移（螢幕像素），無法估計時返回None"""
+        current = self._prepare(frame)
+        previous = self._previous
+        self._previous = current
+        if previous is None or previous.shape != current.shape:
+            return None
+
+        if self._window is None or self._window.shape != current.shape:
+            self._window = cv2.createHanningWindow(current.shape[::-1], cv2.CV_32F)
+
+        (dx, dy), response = cv2.phaseCorrelate(previous, current, self._window)
+        self.last_response = response
+        if response < self.min_response:
+            return None
+
+        # 畫面內容向左移動代表鏡頭向右移動
+        return (-dx / self.downscale, -dy / self.downscale)
+
+    def reset(self):
+        self._previous = None
+        self.last_response = 0.0
+
+
+class AffineTransform:
+    """二維仿射變換 dst = A·src + b（2×3矩陣），可一次套用於任意數量的點"""
+
+    def __init__(self, matrix=None):
+        self.matrix = np.eye(2, 3) if matrix is None else np.asarray(matrix, dtype=np.float64).reshape(2, 3)
+
+    @classmethod
+    def from_scale_offset(cls, scale, offset):
+        """由每軸縮放與偏移建立（無旋轉、無剪切）"""
+        sx, sy = scale
+        ox, oy = offset
+        return cls([[sx, 0.0, ox], [0.0, sy, oy]])
+
+    def apply(self, points):
+        """轉換單點 (x, y) 或 N×2 數組，返回與輸入相同形狀的數組"""
+        points = np.asarray(points, dtype=np.float64)
+        flat = points.reshape(-1, 2)
+        return (flat @ self.matrix[:, :2].T + self.matrix[:, 2]).reshape(points.shape)
+
+    def apply_boxes(self, boxes):
+        """轉換 N×4 的 (x1, y1, x2, y2) 邊界框，返回轉換後兩角點的外接框"""
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        corners = self.apply(boxes.reshape(-1, 2, 2))
+        return np.hstack([corners.min(axis=1), corners.max(axis=1)])
+
+    def inverse(self):
+        A = np.linalg.inv(self.matrix[:, :2])
+        return AffineTransform(np.hstack([A, (-A @ self.matrix[:, 2])[:, None]]))
+
+
+class AffineFitter:
+    """以累積的配對觀測增量估計每軸 縮放+偏移 的仿射變換
+
+    只保存每軸的 n, Σs, Σd, Σs², Σsd，加入觀測與求解都是常數時間。
+    某軸的來源座標分佈不足（例如只在水平移動）時，該軸沿用預設縮放只估計偏移。
+    """
+
+    def __init__(self, prior_scale=1.0, min_pairs=5, min_spread=2.0):
+        self.prior_scale = prior_scale
+        self.min_pairs = min_pairs
+        self.min_spread = min_spread  # 來源座標的最小標準差
+        self._sums = np.zeros((2, 5))
+
+    @property
+    def count(self):
+        return int(self._sums[0, 0])
+
+    def add(self, src, dst):
+        """加入一組或多組 (來源, 目標) 配對"""
+        src = np.asarray(src, dtype=np.float64).reshape(-1, 2)
+        dst = np.asarray(dst, dtype=np.float64).reshape(-1, 2)
+        self._sums += np.stack([
+            np.full(2, len(src)), src.sum(axis=0), dst.sum(axis=0),
+            (src * src).sum(axis=0), (src * dst).sum(axis=0)
+        ], axis=1)
+
+    def _fit_scale(self):
+        """返回 (每軸縮放, 每軸是否由觀測擬合)"""
+        n, sum_s, sum_d, sum_ss, sum_sd = self._sums.T
+        scale = np.full(2, self.prior_scale, dtype=np.float64)
+        variance = n * sum_ss - sum_s * sum_s  # n² 倍的方差
+        fit_scale = (n >= self.min_pairs) & (variance > n * n * self.min_spread ** 2)
+        scale[fit_scale] = ((n * sum_sd - sum_s * sum_d) / np.where(fit_scale, variance, 1.0))[fit_scale]
+        return scale, fit_scale
+
+    def fitted_scale(self):
+        """兩軸縮放都已由觀測擬合時返回 (sx, sy)，否則返回None"""
+        scale, fit_scale = self._fit_scale()
+        return (float(scale[0]), float(scale[1])) if fit_scale.all() else None
+
+    def solve(self):
+        """返回擬合的 AffineTransform，尚無觀測時返回None"""
+        n, sum_s, sum_d, _, _ = self._sums.T
+        if n[0] == 0:
+            return None
+
+        scale, _ = self._fit_scale()
+        offset = (sum_d - scale * sum_s) / n
+        return AffineTransform.from_scale_offset(scale, offset)
+
+    def reset(self):
+        self._sums[:] = 0
+
+
 class CoordinateTransformer:
     def __init__(self, minimap_rect=(1920, 1080)):
         self.minimap_x, self.minimap_y, self.map_w, self.map_h = minimap_rect
-        self.map_scale = 0.2
-        
+        self.x_scale = 1.0  # 調整為合適的值
+        self.y_scale = 1.0  # 調整為合適的值
+
+        # 鏡頭左上角在世界中的位置（螢幕像素單位），由相鄰幀的位移累積
+        self.camera_x = 0.0
+        self.camera_y = 0.0
+        self.camera_estimator = CameraMotionEstimator()
+
+    def update_camera(self, frame):
+        """以新的一幀更新鏡頭位置，返回本幀估計的位移"""
+        shift = self.camera_estimator.update(frame)
+        if shift is not None:
+            self.camera_x += shift[0]
+            self.camera_y += shift[1]
+        return shift
+
+    def reset_camera(self):
+        """重置鏡頭位置（例如切換地圖後），世界原點回到目前畫面的左上角"""
+        self.camera_x = 0.0
+        self.camera_y = 0.0
+        self.camera_estimator.reset()
+
+    def anchor_camera(self, screen_pos, world_pos):
+        """設定鏡頭位置，使螢幕上的 screen_pos 對應到已知的世界座標 world_pos"""
+        self.camera_x = world_pos[0] / self.x_scale - screen_pos[0]
+        self.camera_y = world_pos[1] / self.y_scale - screen_pos[1]
+
+    @property
+    def screen_transform(self):
+        """螢幕 -> 世界的仿射變換（包含目前的鏡頭位置）"""
+        return AffineTransform.from_scale_offset(
+            (self.x_scale, self.y_scale),
+            (self.camera_x * self.x_scale, self.camera_y * self.y_scale))
+
+    def screen_to_world_array(self, points):
+        """轉換單點 (x, y) 或一次轉換 N×2 螢幕座標"""
+        return self.screen_transform.apply(points)
+
+    def world_to_screen_array(self, points):
+        """轉換單點 (x, y) 或一次轉換 N×2 世界座標"""
+        return self.screen_transform.inverse().apply(points)
+
+    def screen_boxes_to_world(self, boxes):
+        """一次轉換 N×4 螢幕邊界框"""
+        return self.screen_transform.apply_boxes(boxes)
+
+    def world_boxes_to_screen(self, boxes):
+        """一次轉換 N×4 世界邊界框"""
+        return self.screen_transform.inverse().apply_boxes(boxes)
+
     def screen_to_world(self, screen_pos):
         """將屏幕坐標轉換為遊戲世界坐標"""
-        x_scale = 1.0  # 調整為合適的值
-        y_scale = 1.0  # 調整為合適的值
-        world_x = screen_pos[0] * x_scale
-        world_y = screen_pos[1] * y_scale
-        return (world_x, world_y)
-        
+        world_x, world_y = self.screen_to_world_array(screen_pos)
+        return (float(world_x), float(world_y))
+
     def world_to_screen(self, world_pos):
-        """將遊戲世界坐標轉換為屏幕坐標"""
-        return (
-            int(world_pos[0] / self.map_scale),
-            int(world_pos[1] / self.map_scale)
-        )
+        """將遊戲世界坐標轉換為屏幕坐標（screen_to_world 的逆轉換）"""
+        screen_x, screen_y = self.world_to_screen_array(world_pos)
+        return (float(screen_x), float(screen_y))
@@ -2,17 +2,28 @@ import cv2
 import numpy as np
 from ultralytics import YOLO
 import os
+from minimap_engine import ClassicalMinimapDetector
 
 class YOLODetector:
-    def __init__(self, minimap_model_path=None, terrain_model_path=None, confidence_threshold=0.25):
-        """初始化YOLO檢測器，支援兩個不同的模型"""
+    def __init__(self, minimap_model_path=None, terrain_model_path=None, confidence_threshold=0.25,
+                 minimap_engine="yolo"):
+        """初始化YOLO檢測器，支援兩個不同的模型
+
+        minimap_engine 選擇小地圖檢測方式："yolo" 使用小地圖模型，
+        "classical" 使用顏色/形狀規則檢測，不載入小地圖模型。
+        """
         self.confidence_threshold = confidence_threshold
         self.last_detections = []
         self.minimap_model = None
         self.terrain_model = None
+        self.minimap_engine = minimap_engine
+        self.classical_minimap_detector = None
         
         # 載入小地圖模型
-        if minimap_model_path and os.path.exists(minimap_model_path):
+        if minimap_engine == "classical":
+            self.classical_minimap_detector = ClassicalMinimapDetector()
+            print("小地圖使用傳統顏色/形狀檢測")
+        elif minimap_model_path and os.path.exists(minimap_model_path):
             self.minimap_model = self._safe_load_model(minimap_model_path)
             print(f"成功載入小地圖模型: {minimap_model_path}")
             
@@ -32,8 +43,23 @@ class YOLODetector:
             traceback.print_exc()
             return None
     
-    def detect(self, image, model_type='terrain'):
-        """使用指定的模型類型檢測圖像中的物體"""
+    def class_ids(self, model_type='terrain', exclude=()):
+        """返回模型中名稱不在 exclude 內的類別編號，模型未載入時返回None"""
+        model = self.terrain_model if model_type == 'terrain' else self.minimap_model
+        if model is None:
+            return None
+        return [class_id for class_id, name in model.names.items() if name not in exclude]
+
+    def detect(self, image, model_type='terrain', classes=None):
+        """使用指定的模型類型檢測圖像中的物體
+
+        classes 為要保留的類別編號列表，None 表示全部類別。
+        """
+        if model_type == 'minimap' and self.classical_minimap_detector:
+            detections = self.classical_minimap_detector.detect(image)
+            self.last_detections = detections
+            return detections
+
         if model_type == 'terrain' and self.terrain_model:
             model = self.terrain_model
         elif model_type == 'minimap' and self.minimap_model:
@@ -44,7 +70,7 @@ class YOLODetector:
         
         try:
             # 使用YOLO模型進行預測
-            results = model.predict(source=image, conf=self.confidence_threshold)
+            results = model.predict(source=image, conf=self.confidence_threshold, classes=classes)
             
             # 處理結果
             detections = []
@@ -98,9 +124,11 @@ class ObjectTracker:
                 x_center = (x1 + x2) / 2
                 y_center = (y1 + y2) / 2
                 
-                # 檢查是否為已追蹤的物體
+                # 檢查是否為已追蹤的物體（只與同類別、本幀尚未配對的物體比較）
                 matched = False
                 for obj_id, obj in self.tracked_objects.items():
+                    if obj['class_name'] != detection['class_name'] or obj_id in current_ids:
+                        continue
                     # 計算中心點距離
                     dist = np.sqrt((x_center - obj['x_center'])**2 + (y_center - obj['y_center'])**2)
                     if dist < 50:  # 距離閾值，可調整
@@ -111,6 +139,7 @@ class ObjectTracker:
                         obj['class_name'] = detection['class_name']
                         obj['confidence'] = detection['confidence']
                         obj['last_seen'] = 0
+                        detection['track_id'] = obj_id
                         matched = True
                         current_ids.append(obj_id)
                         break
@@ -125,6 +154,7 @@ class ObjectTracker:
                         'confidence': detection['confidence'],
                         'last_seen': 0
                     }
+                    detection['track_id'] = self.next_id
                     current_ids.append(self.next_id)
                     self.next_id += 1
             except Exception as e:
@@ -138,4 +168,8 @@ class ObjectTracker:
                 if self.tracked_objects[obj_id]['last_seen'] > 10:  # 可調整
                     del self.tracked_objects[obj_id]
         
-        return self.tracked_objects
\ No newline at end of file
+        return self.tracked_objects
+
+    def reset(self):
+        """清除所有追蹤（例如切換地圖後）"""
+        self.tracked_objects = {}
\ No newline at end of file
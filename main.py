@@ -17,7 +17,8 @@ from MapleUI import MapleUI
 
 # 自動尋路系統
 from window_capture import WindowCapture
-from detection import YOLODetector
+from detection import YOLODetector, ObjectTracker
+from terrain_model import TERRAIN_CLASSES
 from coordinate_system import CoordinateTransformer
 from quadtree import QuadTree, Rectangle, Point
 from MapMemory import MapMemory
@@ -25,6 +26,8 @@ from CollisionSystem import CollisionSystem
 from AutoBattleSystem import AutoBattleSystem, MinimapAnalyzer
 from MonsterDetection import TemplateMonsterDetector
 from path_planner import PathPlanner
+from player_state_estimator import PlayerStateEstimator
+from map_identifier import MapIdentifier
 
 class MapleController:
     def __init__(self, root):
@@ -35,14 +38,21 @@ class MapleController:
         self.coordinate_transformer = None
         self.quad_tree = None
         self.map_memory = MapMemory()
+        self.map_identifier = MapIdentifier(self.map_memory.save_path)
         self.collision_system = CollisionSystem(self.map_memory)
+        self.object_tracker = ObjectTracker()  # 為地形物件分配跨幀的追蹤編號
         self.auto_battle = None
         self.monster_detector = None
         self.facing_direction = "right" 
+        # 融合小地圖與主畫面觀測的玩家狀態，供戰鬥與路徑規劃使用
+        self.player_state = PlayerStateEstimator()
+        self.camera_anchor_pending = False  # 切換地圖後等待以小地圖確定世界原點
 
         # 直接指定模型路徑
         self.minimap_model_path = "MODELS/SmallObjects.pt"
         self.terrain_model_path = "MODELS/QuadRecognizer.pt"
+        # 小地圖檢測引擎："yolo" 使用 SmallObjects.pt，"classical" 使用顏色/形狀規則
+        self.minimap_engine = "yolo"
         
         # 新增：設置按鍵監聽
         self.keyboard_listener = keyboard.Listener(on_press=self.on_key_press)
@@ -51,6 +61,8 @@ class MapleController:
         # 控制變量
         self.running = False
         self.detection_thread = None
+        self.minimap_thread = None
+        self.minimap_tracking_interval = 1 / 60  # 小地圖追蹤頻率
         self.monster_detection_enabled = False
         
         # 初始化UI
@@ -139,7 +151,8 @@ class MapleController:
             self.detector = YOLODetector(
                 minimap_model_path=self.minimap_model_path,
                 terrain_model_path=self.terrain_model_path,
-                confidence_threshold=0.5
+                confidence_threshold=0.5,
+                minimap_engine=self.minimap_engine
             )
             
             # 更新檢測按鈕狀態
@@ -148,6 +161,9 @@ class MapleController:
             # 設置運行標誌
             self.running = True
             
+            # 載入怪物模板，檢測循環以地形平台限制模板匹配的搜索區域
+            self._ensure_monster_detector()
+
             # 初始化小地圖分析器
             self.ui.log("初始化小地圖分析器")
             minimap_analyzer = MinimapAnalyzer()
@@ -165,6 +181,14 @@ class MapleController:
             # 啟動檢測線程
             self.detection_thread = threading.Thread(target=self.detection_loop, daemon=True)
             self.detection_thread.start()
+
+            # 啟動高頻小地圖追蹤線程
+            self.player_state.reset()
+            self.minimap_thread = threading.Thread(target=self.minimap_tracking_loop, daemon=True)
+            self.minimap_thread.start()
+
+            # 啟動地圖記憶的背景保存
+            self.map_memory.start_autosave()
             self.ui.log("開始檢測過程")
             
         except Exception as e:
@@ -182,6 +206,12 @@ class MapleController:
         
         if self.detection_thread and self.detection_thread.is_alive():
             self.detection_thread.join(timeout=1.0)
+
+        if self.minimap_thread and self.minimap_thread.is_alive():
+            self.minimap_thread.join(timeout=1.0)
+
+        # 停止背景保存並寫入剩餘的地圖記憶
+        self.map_memory.stop_autosave()
         
         self.ui.update_detection_buttons(False)
         self.ui.log("停止檢測過程")
@@ -196,27 +226,44 @@ class MapleController:
                     self.ui.log("無法捕獲視窗畫面，將在0.5秒後重試")
                     time.sleep(0.5)
                     continue
+                frame_time = time.time()
+
+                # 估計鏡頭位移，使檢測結果轉換到穩定的世界座標
+                self.coordinate_transformer.update_camera(screen)
 
                 # 保存原始畫面以便展示
                 visualization_img = screen.copy()
 
-                # 執行檢測
-                all_detections = self.detector.detect(screen)
+                # 執行檢測（地形已學習時只檢測動態物體）
+                all_detections = self.detect_main_screen(screen)
+
+                # 模板怪物檢測（由介面開關啟用）：只搜索上次怪物附近與平台上方（定期全畫面掃描）
+                if self.monster_detection_enabled and self.monster_detector and self.monster_detector.templates:
+                    self.monster_detector.set_platforms(
+                        [d["bbox"] for d in all_detections if d.get("class_name") in TERRAIN_CLASSES])
+                    all_detections.extend(self.monster_detector.detect(screen))
 
                 # 更新物體追蹤系統
-                self.update_object_tracking(all_detections)
+                self.update_object_tracking(all_detections, screen.shape)
 
                 # 檢測並繪製小地圖區域 - 使用模板匹配方法
+                minimap_rect = None
                 if hasattr(self, 'auto_battle') and self.auto_battle and hasattr(self.auto_battle, 'minimap_analyzer'):
                     # 使用模板匹配方法而非顏色檢測
                     minimap_rect = self.auto_battle.minimap_analyzer.locate_minimap_by_template(screen)
-                    if minimap_rect != (0, 0, 200, 200):  # 檢查是否成功找到小地圖
+                    if minimap_rect == (0, 0, 200, 200):
+                        minimap_rect = None
+                    if minimap_rect:  # 檢查是否成功找到小地圖
                         x, y, w, h = minimap_rect
                         cv2.rectangle(visualization_img, (x, y), (x+w, y+h), (0, 255, 0), 2)
 
                         # 裁剪小地圖區域
                         minimap_region = screen[y:y+h, x:x+w]
 
+                        # 以小地圖指紋識別地圖，切換時載入該地圖的快取
+                        if minimap_region.size:
+                            self.update_current_map(minimap_region)
+
                         # 對小地圖區域使用小物體模型進行檢測
                         minimap_detections = self.detector.detect(minimap_region, model_type='minimap')
 
@@ -250,6 +297,9 @@ class MapleController:
                             x1, y1, x2, y2 = bbox
                             main_player_pos = ((x1 + x2) / 2, (y1 + y2) / 2)
                             self.ui.log(f"找到主畫面角色，位置：{main_player_pos}")
+                            # 主畫面觀測較準確但頻率低，小地圖觀測由追蹤線程提供
+                            self.player_state.update_screen(
+                                self.coordinate_transformer.screen_to_world(main_player_pos), frame_time)
 
                     # 記錄小地圖玩家位置（不再用於射線檢測）
                     elif detection.get("class_name") == "minimap_player" or (detection.get("class_name") == "Player" and detection.get("is_minimap", False)):
@@ -259,10 +309,23 @@ class MapleController:
                             minimap_player_pos = ((x1 + x2) / 2, (y1 + y2) / 2)
                             print(f"找到小地圖角色! 位置: {minimap_player_pos}")
 
+                # 進入地圖後以小地圖玩家點確定世界原點，使同一地圖每次的世界座標一致
+                # 縮放必須每張地圖固定：第一次進入時等校正擬合完成再記錄到地圖記憶
+                if self.camera_anchor_pending and main_player_pos and minimap_player_pos and minimap_rect:
+                    scale = self.map_memory.minimap_scale or self.player_state.get_calibrated_scale()
+                    if scale:
+                        self.map_memory.minimap_scale = scale
+                        self.coordinate_transformer.anchor_camera(main_player_pos, (
+                            (minimap_player_pos[0] - minimap_rect[0]) * scale[0],
+                            (minimap_player_pos[1] - minimap_rect[1]) * scale[1]))
+                        # 世界原點已移動，之前的濾波狀態與校正配對屬於舊座標系
+                        self.player_state.reset()
+                        self.camera_anchor_pending = False
+
                 # 提取地形物件（用於碰撞檢測）
                 terrain_objects = []
                 for detection in all_detections:
-                    if detection.get("class_name") in ["Ground", "ground", "platform"] and not detection.get("is_minimap", False):
+                    if detection.get("class_name") in TERRAIN_CLASSES and not detection.get("is_minimap", False):
                         terrain_objects.append(detection)
 
                 # 僅使用主畫面角色進行射線檢測
@@ -301,6 +364,17 @@ class MapleController:
                         terrain_objects=terrain_objects
                     )
 
+                    # 以一次批量射線檢測扇形範圍內的地形，標出各射線的命中點
+                    fan = self.collision_system.cast_fan(
+                        main_player_pos,
+                        (start_angle + end_angle) / 2,
+                        end_angle - start_angle,
+                        max_distance=fan_radius,
+                        terrain_objects=terrain_objects
+                    )
+                    for hit_x, hit_y in fan["points"]:
+                        cv2.circle(visualization_img, (int(hit_x), int(hit_y)), 4, (255, 0, 0), -1)
+
                     # 添加檢測狀態與角色來源資訊
                     status = "檢測到平台間隙!" if gap_info.get("gap", False) else "未檢測到平台間隙"
                     cv2.putText(visualization_img,
@@ -325,12 +399,95 @@ class MapleController:
             self.ui.log(f"檢測循環發生錯誤: {str(e)}")
 
     
+    def _ensure_monster_detector(self):
+        """初始化模板怪物檢測器（如果尚未初始化）並啟用搜索區域模式"""
+        if self.monster_detector is None:
+            self.monster_detector = TemplateMonsterDetector()
+            self.monster_detector.set_roi_mode(True)
+        return self.monster_detector
+
+    def detect_main_screen(self, screen):
+        """檢測主畫面；地形模型穩定後只檢測動態類別，地形改由地圖快取提供"""
+        terrain = self.map_memory.terrain
+        if terrain.needs_full_detection():
+            detections = self.detector.detect(screen)
+
+            # 以完整檢測的地形框學習或驗證地形模型
+            terrain_detections = [d for d in detections if d.get("class_name") in TERRAIN_CLASSES]
+            boxes = self.coordinate_transformer.screen_boxes_to_world(
+                [d["bbox"] for d in terrain_detections])
+            height, width = screen.shape[:2]
+            view_box = self.coordinate_transformer.screen_boxes_to_world([(0, 0, width, height)])[0]
+            # 世界原點尚未確定時的地形框無法與地圖快取對齊
+            if not self.camera_anchor_pending:
+                with self.map_memory.lock:
+                    terrain.observe(boxes, [d["class_name"] for d in terrain_detections], view_box)
+            return detections
+
+        dynamic_classes = self.detector.class_ids('terrain', exclude=TERRAIN_CLASSES)
+        detections = self.detector.detect(screen, classes=dynamic_classes)
+
+        boxes, class_names = terrain.get_boxes()
+        screen_boxes = self.coordinate_transformer.world_boxes_to_screen(boxes)
+        for (x1, y1, x2, y2), class_name in zip(screen_boxes, class_names):
+            detections.append({
+                'bbox': (float(x1), float(y1), float(x2), float(y2)),
+                'confidence': 1.0,
+                'class_id': -1,
+                'class_name': class_name,
+                'from_terrain_cache': True
+            })
+        return detections
+
+    def update_current_map(self, minimap_region):
+        """識別目前地圖，地圖改變時載入對應的地圖記憶與導航數據"""
+        map_id, is_new = self.map_identifier.identify(minimap_region)
+        if not map_id or not self.map_memory.switch_map(map_id):
+            return
+
+        if is_new:
+            self.ui.log(f"進入新地圖: {map_id}")
+        else:
+            self.ui.log(f"識別到已知地圖: {map_id}，已載入地圖記憶")
+
+        self.path_planner.initialize_grid(self.map_memory)
+        self.path_planner.identify_connection_points(self.map_memory)
+        self.player_state.reset()
+        self.collision_system.reset()
+        self.object_tracker.reset()
+        self.coordinate_transformer.reset_camera()
+        self.camera_anchor_pending = True
+
+    def minimap_tracking_loop(self):
+        """高頻小地圖追蹤：只截取已鎖定的小地圖區域並更新玩家狀態估計"""
+        while self.running:
+            start = time.time()
+            try:
+                analyzer = self.auto_battle.minimap_analyzer if self.auto_battle else None
+                rect = analyzer.locked_minimap_rect if analyzer else None
+                window_rect = self.window_capture.get_window_rect() if rect else None
+                if rect and window_rect:
+                    x, y, w, h = rect
+                    # capture() 截取的畫面帶有10像素邊距，換算回螢幕座標
+                    left = window_rect[0] - 10 + x
+                    top = window_rect[1] - 10 + y
+                    minimap = self.window_capture.capture_region((left, top, w, h))
+                    if minimap is not None:
+                        minimap_pos = analyzer.track_player(minimap)
+                        if minimap_pos:
+                            self.player_state.update_minimap(minimap_pos, start)
+            except Exception as e:
+                self.ui.log(f"小地圖追蹤發生錯誤: {str(e)}")
+                time.sleep(0.5)
+
+            time.sleep(max(0.0, self.minimap_tracking_interval - (time.time() - start)))
+
     def _continue_detection_loop(self):
         """繼續檢測循環"""
         if self.running:
             self.detection_loop()
     
-    def update_object_tracking(self, detections):
+    def update_object_tracking(self, detections, frame_shape=None):
         try:
             # 檢查四叉樹是否已初始化
             if self.quad_tree is None:
@@ -348,6 +505,7 @@ class MapleController:
                 self.quad_tree.clear()
             
             # 將檢測到的物體添加到四叉樹和地圖記憶中
+            located = []
             for detection in detections:
                 try:
                     # 檢查是使用 'bbox' 還是 'box' 鍵
@@ -365,31 +523,27 @@ class MapleController:
                     # 為後續處理添加中心點
                     detection["x_center"] = x_center
                     detection["y_center"] = y_center
-                    
-                    # 檢查是使用 'class_name' 還是 'class' 鍵
-                    obj_class = detection.get("class_name", detection.get("class", "unknown"))
-                    
-                    world_pos = self.coordinate_transformer.screen_to_world(
-                        (x_center, y_center)
-                    )
-                    
-                    if world_pos:
-                        # 插入到四叉樹
-                        point = Point(world_pos[0], world_pos[1], detection)
-                        self.quad_tree.insert(point)
-                        
-                        # 更新地圖記憶
-                        if obj_class == "minimap_player":
-                            self.map_memory.update_player_position(world_pos)
-                        elif obj_class in ["game_portal", "minimap_portal"]:
-                            self.map_memory.add_object("portal", world_pos, detection)
-                        elif obj_class == "climbable_object":
-                            self.map_memory.add_object("rope", world_pos, detection)
+                    located.append(detection)
                 except Exception as e:
                     self.ui.log(f"處理單個檢測結果時發生錯誤: {str(e)}")
-            
-            # 更新碰撞系統
-            self.collision_system.update_from_detections(detections, self.coordinate_transformer)
+
+            # 一次把所有中心點轉換到世界座標，再插入到四叉樹
+            if located:
+                centers = [(d["x_center"], d["y_center"]) for d in located]
+                world_points = self.coordinate_transformer.screen_to_world_array(centers)
+                for detection, (world_x, world_y) in zip(located, world_points.tolist()):
+                    self.quad_tree.insert(Point(world_x, world_y, detection))
+            
+            # 為地形物件分配追蹤編號，碰撞系統以 (類型, 追蹤編號) 保持物件
+            self.object_tracker.update([d for d in detections
+                                        if d.get("class_name") in CollisionSystem.OBJECT_CLASSES])
+
+            # 更新碰撞系統（地圖記憶只在碰撞系統出現新物件時寫入）
+            view_box = None
+            if frame_shape is not None:
+                height, width = frame_shape[:2]
+                view_box = tuple(self.coordinate_transformer.screen_boxes_to_world([(0, 0, width, height)])[0])
+            self.collision_system.update_from_detections(detections, self.coordinate_transformer, view_box)
         except Exception as e:
             self.ui.log(f"更新物體追蹤時發生錯誤: {str(e)}")
     
@@ -539,9 +693,7 @@ class MapleController:
                 return
             
             # 初始化怪物檢測器（如果尚未初始化）
-            if not hasattr(self, 'monster_detector') or self.monster_detector is None:
-                from MonsterDetection import TemplateMonsterDetector
-                self.monster_detector = TemplateMonsterDetector()
+            self._ensure_monster_detector()
             
             # 添加模板
             success = self.monster_detector.add_template(template_img=template, name=template_name)
@@ -574,9 +726,7 @@ class MapleController:
                 return
             
             # 初始化怪物檢測器（如果尚未初始化）
-            if not hasattr(self, 'monster_detector') or self.monster_detector is None:
-                from MonsterDetection import TemplateMonsterDetector
-                self.monster_detector = TemplateMonsterDetector()
+            self._ensure_monster_detector()
             
             # 從檔案名稱獲取模板名稱，預設使用檔案名（不含副檔名）
             template_name = os.path.basename(filename).split('.')[0]
@@ -603,6 +753,9 @@ class MapleController:
             if enabled:
                 self.ui.log("已啟用怪物檢測")
             else:
+                # 清除最後一次的模板匹配結果，自動戰鬥不再以舊結果選擇目標
+                if self.monster_detector:
+                    self.monster_detector.last_detections = []
                 self.ui.log("已停用怪物檢測")
                 
         except Exception as e:
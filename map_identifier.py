@@ -0,0 +1,140 @@
+import json
+import os
+import time
+import cv2
+import numpy as np
+from minimap_engine import MinimapEngine, CLASS_PLAYER, CLASS_MONSTER
+
+
+class MapIdentifier:
+    """以小地圖靜態佈局的感知雜湊識別地圖，並維護磁碟上的已知地圖索引"""
+
+    # 會移動的圖示，計算指紋前需要遮蔽
+    DYNAMIC_CLASSES = (CLASS_PLAYER, CLASS_MONSTER)
+
+    def __init__(self, save_path="map_data", max_distance=10, stable_frames=2, register_frames=30,
+                 min_contrast=12.0, engine=None):
+        self.save_path = save_path
+        self.index_file = os.path.join(save_path, "map_index.json")
+        self.max_distance = max_distance        # 視為同一地圖的最大漢明距離
+        self.stable_frames = stable_frames      # 已知地圖的指紋連續穩定多少幀才確認
+        self.register_frames = register_frames  # 未知指紋連續穩定多少幀才登錄為新地圖
+        self.min_contrast = min_contrast        # 灰度標準差低於此值的小地圖（空白、淡入淡出）不計算指紋
+        self.engine = engine or MinimapEngine()
+
+        self.index = {}
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._sizes = np.zeros((0, 2), dtype=np.int32)
+        self._ids = []
+
+        self.current_map_id = None
+        self._last_hash = None
+        self._stable_count = 0
+
+        os.makedirs(save_path, exist_ok=True)
+        self.load_index()
+
+    def load_index(self):
+        """載入已知地圖索引"""
+        if os.path.exists(self.index_file):
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        self._rebuild_arrays()
+
+    def _save_index(self):
+        with open(self.index_file, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, indent=2)
+
+    def _rebuild_arrays(self):
+        """把索引轉成數組，查詢時一次比較所有已知地圖"""
+        self._ids = list(self.index)
+        self._hashes = np.array([int(self.index[i]["hash"], 16) for i in self._ids], dtype=np.uint64)
+        self._sizes = np.array([self.index[i]["size"] for i in self._ids], dtype=np.int32).reshape(-1, 2)
+
+    def fingerprint(self, minimap_image):
+        """計算小地圖靜態佈局的64位感知雜湊（DCT低頻係數與中位數比較），畫面缺乏內容時返回None"""
+        gray = cv2.cvtColor(minimap_image, cv2.COLOR_BGR2GRAY)
+        if gray.std() < self.min_contrast:
+            return None
+
+        # 遮蔽玩家、怪物等動態圖示，以周圍背景的中位數填補
+        labels = self.engine.classify(minimap_image)
+        dynamic = np.isin(labels, self.DYNAMIC_CLASSES).astype(np.uint8)
+        if dynamic.any():
+            dynamic = cv2.dilate(dynamic, np.ones((3, 3), np.uint8)) > 0
+            gray = gray.copy()
+            gray[dynamic] = np.median(gray[~dynamic]) if (~dynamic).any() else 0
+
+        small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+        low = cv2.dct(small)[:8, :8].ravel()
+        bits = low > np.median(low[1:])  # 中位數不計直流分量
+        # 幾乎全為同一位元的雜湊區分不了地圖（例如單色漸層）
+        if not 8 <= int(bits.sum()) <= 56:
+            return None
+        return int(np.packbits(bits).view('>u8')[0])
+
+    def lookup(self, fingerprint, size):
+        """在索引中尋找最接近的地圖，返回 (地圖ID, 漢明距離)，找不到返回 (None, None)"""
+        if not self._ids:
+            return None, None
+
+        # 小地圖尺寸不同的地圖直接排除
+        size_ok = np.all(np.abs(self._sizes - np.array(size)) <= 2, axis=1)
+        xor = np.bitwise_xor(self._hashes, np.uint64(fingerprint))
+        distances = np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+        distances = np.where(size_ok, distances, 65)
+
+        best = int(np.argmin(distances))
+        if distances[best] > self.max_distance:
+            return None, None
+        return self._ids[best], int(distances[best])
+
+    def identify(self, minimap_image):
+        """識別目前所在的地圖
+
+        已知地圖的指紋需連續穩定 stable_frames 幀才確認；未知指紋需穩定 register_frames 幀
+        才登錄為新地圖，以免讀取畫面、介面遮擋或淡入淡出被當成新地圖。
+        返回 (地圖ID, 是否為新地圖)，尚未穩定時返回 (None, False)。
+        """
+        h, w = minimap_image.shape[:2]
+        fingerprint = self.fingerprint(minimap_image)
+        if fingerprint is None:
+            self._last_hash = None
+            self._stable_count = 0
+            return None, False
+
+        # 與這段穩定期的第一個指紋比較，避免緩慢變化的畫面逐幀累積成「穩定」
+        if self._last_hash is not None and self._hamming(fingerprint, self._last_hash) <= self.max_distance // 2:
+            self._stable_count += 1
+        else:
+            self._last_hash = fingerprint
+            self._stable_count = 1
+
+        if self._stable_count < self.stable_frames:
+            return None, False
+
+        map_id, _ = self.lookup(fingerprint, (w, h))
+        if map_id is not None:
+            self.current_map_id = map_id
+            return map_id, False
+
+        if self._stable_count < self.register_frames:
+            return None, False
+
+        map_id = self.register(fingerprint, (w, h))
+        self.current_map_id = map_id
+        return map_id, True
+
+    def register(self, fingerprint, size):
+        """將新地圖加入索引"""
+        map_id = f"map_{len(self.index):04d}"
+        while map_id in self.index:
+            map_id += "_"
+        self.index[map_id] = {"hash": f"{fingerprint:016x}", "size": list(size), "created": time.time()}
+        self._save_index()
+        self._rebuild_arrays()
+        print(f"登錄新地圖: {map_id}")
+        return map_id
+
+    def _hamming(self, a, b):
+        return bin(a ^ b).count("1")
@@ -0,0 +1,204 @@
+import cv2
+import numpy as np
+
+# 小地圖顏色類別編號
+CLASS_BACKGROUND = 0
+CLASS_PLAYER = 1
+CLASS_MONSTER = 2
+CLASS_PORTAL = 3
+CLASS_MINIMAP_BACKGROUND = 4  # 只用於定位小地圖的背景分類器，編號不可與上面的類別重複
+
+# 各類別的HSV範圍 (下界, 上界)
+DEFAULT_COLOR_RULES = {
+    CLASS_PLAYER: ((20, 150, 180), (35, 255, 255)),  # 玩家：黃色圓點（與小地圖的白色背景/邊框區分）
+    CLASS_MONSTER: ((0, 100, 100), (10, 255, 255)),  # 怪物：紅色
+    CLASS_PORTAL: ((100, 120, 150), (130, 255, 255)),  # 傳送點：藍色
+}
+
+# 小地圖背景（用於在畫面中定位小地圖）
+MINIMAP_BACKGROUND_RULES = {
+    CLASS_MINIMAP_BACKGROUND: ((0, 0, 200), (180, 30, 255)),
+}
+
+CLASS_NAMES = {
+    CLASS_PLAYER: "player",
+    CLASS_MONSTER: "monster",
+    CLASS_PORTAL: "portal",
+}
+
+
+class ColorClassifier:
+    """把HSV顏色規則編譯成量化BGR查找表，每幀只需查表，不必轉換顏色空間
+
+    查找表只在規則改變後第一次使用時重新生成；規則重疊時先加入的類別優先。
+    """
+
+    def __init__(self, color_rules, quant_bits=6):
+        self._rules = {class_id: (tuple(lower), tuple(upper))
+                       for class_id, (lower, upper) in color_rules.items()}
+        self.quant_bits = quant_bits
+        self._lut = None
+
+    @property
+    def rules(self):
+        return dict(self._rules)
+
+    def set_rule(self, class_id, lower, upper):
+        """設置類別的HSV範圍，範圍有變化時查找表會在下次使用時重建"""
+        rule = (tuple(lower), tuple(upper))
+        if self._rules.get(class_id) == rule:
+            return
+        self._rules[class_id] = rule
+        self._lut = None
+
+    def remove_rule(self, class_id):
+        """移除類別規則"""
+        if self._rules.pop(class_id, None) is not None:
+            self._lut = None
+
+    @property
+    def lut(self):
+        if self._lut is None:
+            self._lut = self._build_lut()
+        return self._lut
+
+    def _build_lut(self):
+        """建立量化BGR到類別編號的查找表"""
+        levels = 1 << self.quant_bits
+        shift = 8 - self.quant_bits
+
+        # 以每個量化區間的中心值代表該區間的顏色
+        values = (np.arange(levels, dtype=np.uint16) << shift) + (1 << shift >> 1)
+        b, g, r = np.meshgrid(values, values, values, indexing="ij")
+        colors = np.stack([b, g, r], axis=-1).reshape(-1, 1, 3).astype(np.uint8)
+        hsv = cv2.cvtColor(colors, cv2.COLOR_BGR2HSV)
+
+        lut = np.full(len(colors), CLASS_BACKGROUND, dtype=np.uint8)
+        for class_id, (lower, upper) in self._rules.items():
+            mask = cv2.inRange(hsv, np.array(lower), np.array(upper)).ravel() > 0
+            lut[mask & (lut == CLASS_BACKGROUND)] = class_id
+        return lut
+
+    def classify(self, image):
+        """返回與圖像同尺寸的類別編號圖"""
+        shift = 8 - self.quant_bits
+        q = (image >> shift).astype(np.int32)
+        index = (q[:, :, 0] << (2 * self.quant_bits)) | (q[:, :, 1] << self.quant_bits) | q[:, :, 2]
+        return self.lut[index]
+
+    def mask(self, image, class_id):
+        """返回單一類別的二值遮罩（0或255），用法同 cv2.inRange"""
+        return cv2.compare(self.classify(image), class_id, cv2.CMP_EQ)
+
+
+class MinimapEngine:
+    """小地圖分析引擎：一次查表把所有像素映射為顏色類別，再以連通區域取得各類別的位置"""
+
+    def __init__(self, color_rules=None, quant_bits=6):
+        self.classifier = ColorClassifier(color_rules or DEFAULT_COLOR_RULES, quant_bits)
+
+    def set_color_rule(self, class_id, lower, upper):
+        """調整類別的HSV範圍"""
+        self.classifier.set_rule(class_id, lower, upper)
+
+    def classify(self, minimap_image):
+        """返回與小地圖同尺寸的類別編號圖"""
+        return self.classifier.classify(minimap_image)
+
+    def analyze(self, minimap_image, include_platforms=True):
+        """分析小地圖，返回各類別的質心、面積、外框以及平台邊緣"""
+        labels = self.classify(minimap_image)
+
+        result = {}
+        for class_id, name in CLASS_NAMES.items():
+            result[name] = self._components(cv2.compare(labels, class_id, cv2.CMP_EQ))
+
+        if include_platforms:
+            result["platforms"] = self._platform_edges(minimap_image)
+        return result
+
+    def _components(self, mask):
+        """對單一類別的遮罩做連通區域分析"""
+        count, _, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        # 第0個連通區域是背景
+        stats = stats[1:count]
+        return {
+            "centroids": centroids[1:count],
+            "areas": stats[:, cv2.CC_STAT_AREA],
+            "boxes": np.stack([
+                stats[:, cv2.CC_STAT_LEFT],
+                stats[:, cv2.CC_STAT_TOP],
+                stats[:, cv2.CC_STAT_LEFT] + stats[:, cv2.CC_STAT_WIDTH],
+                stats[:, cv2.CC_STAT_TOP] + stats[:, cv2.CC_STAT_HEIGHT],
+            ], axis=1)
+        }
+
+    def _platform_edges(self, minimap_image):
+        """以水平邊緣的連通區域找出平台，返回 (x1, y1, x2, y2) 數組"""
+        gray = cv2.cvtColor(minimap_image, cv2.COLOR_BGR2GRAY)
+        edges = cv2.Canny(gray, 50, 150)
+        horizontal_kernel = np.ones((1, 7), np.uint8)
+        horizontal_edges = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, horizontal_kernel)
+
+        count, _, stats, _ = cv2.connectedComponentsWithStats(horizontal_edges, connectivity=8)
+        stats = stats[1:count]
+        x = stats[:, cv2.CC_STAT_LEFT]
+        y = stats[:, cv2.CC_STAT_TOP]
+        w = stats[:, cv2.CC_STAT_WIDTH]
+        h = stats[:, cv2.CC_STAT_HEIGHT]
+
+        # 只保留足夠長的水平線段
+        keep = (w * h > 50) & (w > h * 3) & (w > 20)
+        return np.stack([x[keep], y[keep], x[keep] + w[keep], y[keep] + h[keep]], axis=1)
+
+
+class ClassicalMinimapDetector:
+    """以顏色和形狀規則檢測小地圖元素，輸出格式與 YOLODetector.detect 相同，可取代小地圖YOLO模型"""
+
+    # 引擎類別 -> (YOLO類別編號, YOLO類別名稱)，與 SmallObjects.pt 的類別對應
+    OUTPUT_CLASSES = {
+        "player": (2, "minimap_player"),
+        "portal": (3, "minimap_portal"),
+    }
+
+    def __init__(self, engine=None, min_area=4, max_area=400, max_aspect=3.0):
+        self.engine = engine or MinimapEngine()
+        self.min_area = min_area        # 色塊的最小像素數，過濾雜點
+        self.max_area = max_area        # 色塊的最大像素數，過濾大片同色區域
+        self.max_aspect = max_aspect    # 圖示近似方形，過長的色塊不是圖示
+
+    def detect(self, minimap_image):
+        """檢測小地圖中的玩家與傳送點"""
+        result = self.engine.analyze(minimap_image, include_platforms=False)
+
+        detections = []
+        for name, (class_id, class_name) in self.OUTPUT_CLASSES.items():
+            components = result[name]
+            boxes = components["boxes"]
+            areas = components["areas"]
+            if len(areas) == 0:
+                continue
+
+            widths = boxes[:, 2] - boxes[:, 0]
+            heights = boxes[:, 3] - boxes[:, 1]
+            aspect = np.maximum(widths, heights) / np.maximum(1, np.minimum(widths, heights))
+            keep = (areas >= self.min_area) & (areas <= self.max_area) & (aspect <= self.max_aspect)
+
+            # 以填充率作為置信度：圖示是實心色塊，雜點和線段填充率較低
+            fill_ratio = areas / np.maximum(1, widths * heights)
+            indices = np.nonzero(keep)[0]
+
+            # 小地圖上只會有一個自己的角色，保留面積最大的
+            if name == "player" and len(indices) > 1:
+                indices = indices[[np.argmax(areas[indices])]]
+
+            for i in indices:
+                x1, y1, x2, y2 = (float(v) for v in boxes[i])
+                detections.append({
+                    'bbox': (x1, y1, x2, y2),
+                    'confidence': float(min(1.0, fill_ratio[i])),
+                    'class_id': class_id,
+                    'class_name': class_name
+                })
+
+        return detections
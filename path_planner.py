@@ -1,26 +1,17 @@
 import math
 from queue import PriorityQueue
+from collision_layer import CollisionLayer, WALKABLE_CELLS, CELL_PLATFORM
 
 class PathPlanner:
     def __init__(self):
-        self.grid = {}
+        self.layer = CollisionLayer()
         self.cell_size = 1
         self.connection_points = []
 
     def initialize_grid(self, map_memory):
-        """初始化地圖網格"""
+        """初始化地圖網格：直接使用地圖記憶的碰撞柵格（已探索、平台與障礙物都蓋印在上面）"""
         self.cell_size = map_memory.cell_size
-        
-        # 從地圖記憶中獲取已探索區域
-        for cell in map_memory.explored_cells:
-            x, y = cell
-            self.grid[(x, y)] = {"type": "walkable"}
-        
-        # 標記障礙物
-        for key, value in map_memory.map_grid.items():
-            if value["type"] == "obstacle":
-                x, y = map(int, key.split(','))
-                self.grid[(x, y)] = {"type": "obstacle"}
+        self.layer = map_memory.collision_layer
 
     def identify_connection_points(self, map_memory):
         """識別連接不同高度平台的特殊點"""
@@ -118,9 +109,7 @@ class PathPlanner:
 
     def _is_walkable(self, position):
         """檢查位置是否可行走"""
-        x, y = position
-        cell = (int(x / self.cell_size), int(y / self.cell_size))
-        return cell in self.grid and self.grid[cell]["type"] != "obstacle"
+        return self.layer.value_at(position) in WALKABLE_CELLS
 
     def _can_jump_from(self, position):
         """檢查是否可以從當前位置跳躍"""
@@ -138,13 +127,10 @@ class PathPlanner:
     def _is_platform(self, position):
         """檢查位置是否為平台"""
         x, y = position
-        cell = (int(x / self.cell_size), int(y / self.cell_size))
         
-        # 如果該位置是可行走區域但下方是空氣，則為平台
-        if cell in self.grid and self.grid[cell]["type"] == "walkable":
-            below = (int(x / self.cell_size), int(y / self.cell_size) + 1)
-            return below not in self.grid or self.grid[below]["type"] != "walkable"
-        return False
+        # 已標記為平台，或該位置可行走但下方不可行走，則為平台
+        here, below = self.layer.values_at([(x, y), (x, y + self.cell_size)])
+        return here == CELL_PLATFORM or (here in WALKABLE_CELLS and below not in WALKABLE_CELLS)
 
     def _find_rope_at(self, position):
         """在指定位置查找繩索"""
@@ -215,31 +201,8 @@ class PathPlanner:
         return result
 
     def has_clear_line(self, start, end):
-        """檢查兩點之間是否有清晰的視線"""
-        x1, y1 = start
-        x2, y2 = end
-        dx = abs(x2 - x1)
-        dy = abs(y2 - y1)
-        x = x1
-        y = y1
-        n = 1 + dx + dy
-        x_inc = 1 if x2 > x1 else -1
-        y_inc = 1 if y2 > y1 else -1
-        error = dx - dy
-        dx *= 2
-        dy *= 2
-
-        for _ in range(n):
-            if not self._is_walkable((x, y)):
-                return False
-            if error > 0:
-                x += x_inc
-                error -= dy
-            else:
-                y += y_inc
-                error += dx
-
-        return True
+        """檢查兩點之間是否有清晰的視線（整條線段都可行走）"""
+        return self.layer.line_all(start, end, WALKABLE_CELLS)
 
     def _to_grid_coords(self, position):
         """將世界坐標轉換為網格坐標"""
@@ -388,13 +351,8 @@ class PathPlanner:
     def _is_region_walkable(self, region):
         """檢查區域是否可行走（至少有一個可行走的網格）"""
         region_size = 10
-        for dx in range(region_size):
-            for dy in range(region_size):
-                grid_x = region[0] * region_size + dx
-                grid_y = region[1] * region_size + dy
-                if self._is_walkable((grid_x, grid_y)):
-                    return True
-        return False
+        x1, y1 = region[0] * region_size, region[1] * region_size
+        return self.layer.box_contains((x1, y1, x1 + region_size - 1, y1 + region_size - 1), WALKABLE_CELLS)
 
     def _reconstruct_region_path(self, came_from, current):
         """重建區域路徑"""
@@ -0,0 +1,135 @@
+import threading
+import time
+import numpy as np
+from coordinate_system import AffineFitter
+
+
+class PlayerStateEstimator:
+    """融合小地圖玩家點（高頻、低精度）與主畫面玩家框（低頻、高精度）的等速卡爾曼濾波器
+
+    狀態為世界座標中的 [x, y, vx, vy]。小地圖觀測經由仿射校正轉換到世界座標，
+    校正由同時出現的小地圖點與主畫面框配對以最小二乘法估計（見 AffineFitter）。
+    """
+
+    def __init__(self, minimap_scale=1.0, accel_noise=2000.0, screen_noise=5.0, minimap_noise=15.0,
+                 max_pair_interval=0.1, min_calibration_pairs=5):
+        self.minimap_scale = minimap_scale          # 未完成校正前使用的小地圖到世界的縮放
+        self.accel_noise = accel_noise              # 過程噪聲（加速度標準差，像素/秒²）
+        self.screen_noise = screen_noise            # 主畫面觀測標準差（像素）
+        self.minimap_noise = minimap_noise          # 小地圖觀測轉換後的標準差（像素）
+        self.max_pair_interval = max_pair_interval  # 配對校正時兩種觀測允許的最大時間差
+        self.min_calibration_pairs = min_calibration_pairs
+
+        self.lock = threading.Lock()
+        self.state = None       # [x, y, vx, vy]
+        self.covariance = None
+        self.timestamp = None
+
+        # 小地圖 -> 世界的仿射校正
+        self.calibration = AffineFitter(minimap_scale, min_calibration_pairs)
+        self.minimap_transform = None   # 尚未配對過時為None
+        self._last_minimap = None       # (時間, 小地圖座標)
+
+    def update_screen(self, world_pos, timestamp=None):
+        """加入主畫面玩家框觀測（已轉換為世界座標）"""
+        timestamp = time.time() if timestamp is None else timestamp
+        z = np.asarray(world_pos, dtype=np.float64)
+        with self.lock:
+            self._add_calibration_pair(z, timestamp)
+            self._update(z, self.screen_noise, timestamp)
+
+    def update_minimap(self, minimap_pos, timestamp=None):
+        """加入小地圖玩家點觀測（小地圖座標）"""
+        timestamp = time.time() if timestamp is None else timestamp
+        m = np.asarray(minimap_pos, dtype=np.float64)
+        with self.lock:
+            self._last_minimap = (timestamp, m)
+            if self.minimap_transform is None:
+                # 尚未與主畫面配對過，無法得知小地圖在世界中的位置
+                return
+            z = self.minimap_transform.apply(m)
+            self._update(z, self.minimap_noise, timestamp)
+
+    def get_state(self, timestamp=None):
+        """返回濾波後的位置、速度與對應時間；指定時間時外推到該時間"""
+        with self.lock:
+            if self.state is None:
+                return None
+            state = self.state
+            t = self.timestamp
+            if timestamp is not None and timestamp > t:
+                state = self._transition(timestamp - t) @ state
+                t = timestamp
+            return {
+                "position": (float(state[0]), float(state[1])),
+                "velocity": (float(state[2]), float(state[3])),
+                "timestamp": t
+            }
+
+    def get_position(self, timestamp=None):
+        """返回濾波後的位置，尚無觀測時返回None"""
+        state = self.get_state(timestamp)
+        return state["position"] if state else None
+
+    def get_calibrated_scale(self):
+        """返回已擬合的小地圖 -> 世界每軸縮放，兩軸尚未校正完成時返回None"""
+        with self.lock:
+            return self.calibration.fitted_scale()
+
+    def reset(self):
+        """清除濾波狀態與校正配對（例如切換地圖或世界原點改變後）"""
+        with self.lock:
+            self.state = None
+            self.covariance = None
+            self.timestamp = None
+            self.calibration.reset()
+            self.minimap_transform = None
+            self._last_minimap = None
+
+    def _update(self, z, noise, timestamp):
+        """預測到觀測時間並以觀測更新狀態"""
+        if self.state is None:
+            self.state = np.array([z[0], z[1], 0.0, 0.0])
+            self.covariance = np.diag([noise ** 2, noise ** 2, 500.0 ** 2, 500.0 ** 2])
+            self.timestamp = timestamp
+            return
+
+        # 亂序到達的舊觀測視為與當前狀態同時
+        dt = max(0.0, timestamp - self.timestamp)
+        if dt > 0:
+            F = self._transition(dt)
+            self.state = F @ self.state
+            self.covariance = F @ self.covariance @ F.T + self._process_noise(dt)
+            self.timestamp = timestamp
+
+        # 只觀測位置
+        innovation = z - self.state[:2]
+        S = self.covariance[:2, :2] + np.eye(2) * noise ** 2
+        K = self.covariance[:, :2] @ np.linalg.inv(S)
+        self.state = self.state + K @ innovation
+        self.covariance = (np.eye(4) - K @ np.hstack([np.eye(2), np.zeros((2, 2))])) @ self.covariance
+
+    def _transition(self, dt):
+        F = np.eye(4)
+        F[0, 2] = F[1, 3] = dt
+        return F
+
+    def _process_noise(self, dt):
+        q = self.accel_noise ** 2
+        dt2, dt3, dt4 = dt * dt, dt ** 3, dt ** 4
+        Q = np.zeros((4, 4))
+        Q[0, 0] = Q[1, 1] = dt4 / 4 * q
+        Q[0, 2] = Q[2, 0] = Q[1, 3] = Q[3, 1] = dt3 / 2 * q
+        Q[2, 2] = Q[3, 3] = dt2 * q
+        return Q
+
+    def _add_calibration_pair(self, world, timestamp):
+        """以時間相近的小地圖點與主畫面觀測更新小地圖 -> 世界的校正"""
+        if self._last_minimap is None:
+            return
+        minimap_time, m = self._last_minimap
+        if abs(timestamp - minimap_time) > self.max_pair_interval:
+            return
+
+        self.calibration.add(m, world)
+        self.minimap_transform = self.calibration.solve()
@@ -0,0 +1,166 @@
+import math
+
+
+class SpatialHashGrid:
+    """均勻網格空間雜湊：以 (x1, y1, x2, y2) 外框把物件放入所有覆蓋到的網格
+
+    查詢只檢查範圍內的網格，結果可按物件類型過濾。物件本身作為鍵，需為可雜湊對象。
+    """
+
+    def __init__(self, cell_size=100):
+        self.cell_size = cell_size
+        self.cells = {}   # (cx, cy) -> 物件集合
+        self.items = {}   # 物件 -> (外框, 類型, 網格範圍)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.items
+
+    def _cell_range(self, box):
+        x1, y1, x2, y2 = box
+        size = self.cell_size
+        return (math.floor(x1 / size), math.floor(y1 / size),
+                math.floor(x2 / size), math.floor(y2 / size))
+
+    def insert(self, item, box, item_type=None):
+        """加入物件；已存在時等同 update"""
+        if item in self.items:
+            self.update(item, box, item_type)
+            return
+
+        cell_range = self._cell_range(box)
+        cx1, cy1, cx2, cy2 = cell_range
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                self.cells.setdefault((cx, cy), set()).add(item)
+        self.items[item] = (tuple(box), item_type, cell_range)
+
+    def remove(self, item):
+        """移除物件，不存在時忽略"""
+        entry = self.items.pop(item, None)
+        if entry is None:
+            return
+        cx1, cy1, cx2, cy2 = entry[2]
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                bucket = self.cells.get((cx, cy))
+                if bucket is not None:
+                    bucket.discard(item)
+                    if not bucket:
+                        del self.cells[(cx, cy)]
+
+    def update(self, item, box, item_type=None):
+        """更新物件外框；覆蓋的網格不變時只更新記錄"""
+        entry = self.items.get(item)
+        if entry is None:
+            self.insert(item, box, item_type)
+            return
+
+        item_type = entry[1] if item_type is None else item_type
+        cell_range = self._cell_range(box)
+        if cell_range == entry[2]:
+            self.items[item] = (tuple(box), item_type, cell_range)
+            return
+        self.remove(item)
+        self.insert(item, box, item_type)
+
+    def clear(self):
+        self.cells.clear()
+        self.items.clear()
+
+    def get_box(self, item):
+        entry = self.items.get(item)
+        return entry[0] if entry else None
+
+    def query_box(self, box, types=None):
+        """返回外框與 box 相交的物件列表，types 為允許的類型集合"""
+        qx1, qy1, qx2, qy2 = box
+        cx1, cy1, cx2, cy2 = self._cell_range(box)
+
+        # 範圍比已佔用的網格還多時，直接遍歷已佔用網格
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > len(self.cells):
+            candidates = set()
+            for (cx, cy), bucket in self.cells.items():
+                if cx1 <= cx <= cx2 and cy1 <= cy <= cy2:
+                    candidates.update(bucket)
+        else:
+            candidates = set()
+            for cx in range(cx1, cx2 + 1):
+                for cy in range(cy1, cy2 + 1):
+                    bucket = self.cells.get((cx, cy))
+                    if bucket:
+                        candidates.update(bucket)
+
+        result = []
+        for item in candidates:
+            (x1, y1, x2, y2), item_type, _ = self.items[item]
+            if types is not None and item_type not in types:
+                continue
+            if x1 <= qx2 and x2 >= qx1 and y1 <= qy2 and y2 >= qy1:
+                result.append(item)
+        return result
+
+    def distance(self, item, point):
+        """point 到物件外框的最近距離（在外框內為 0）"""
+        x1, y1, x2, y2 = self.items[item][0]
+        dx = max(x1 - point[0], 0, point[0] - x2)
+        dy = max(y1 - point[1], 0, point[1] - y2)
+        return math.hypot(dx, dy)
+
+    def query_radius(self, point, radius, types=None, sort=False):
+        """返回外框與以 point 為圓心、radius 為半徑的圓相交的物件列表，sort 為 True 時按距離排序"""
+        px, py = point
+        found = []
+        for item in self.query_box((px - radius, py - radius, px + radius, py + radius), types):
+            distance = self.distance(item, point)
+            if distance <= radius:
+                found.append((distance, item))
+        if sort:
+            found.sort(key=lambda pair: pair[0])
+        return [item for _, item in found]
+
+    def query_nearest(self, point, k=1, types=None, max_distance=float("inf")):
+        """返回距離 point 最近的 k 個物件 [(距離, 物件), ...]，按距離由近到遠
+
+        由 point 所在網格向外逐圈搜索：掃描完第 r 圈後，距離小於 r × cell_size 的物件都已找到。
+        """
+        if not self.items or k <= 0:
+            return []
+
+        size = self.cell_size
+        center_x, center_y = math.floor(point[0] / size), math.floor(point[1] / size)
+        seen = set()
+        found = []
+        ring = 0
+        while True:
+            # 圈內網格比已佔用的網格還多時，直接遍歷所有物件
+            if (2 * ring + 1) ** 2 > len(self.cells):
+                candidates = self.items.keys() - seen
+                ring_done = True
+            else:
+                candidates = set()
+                for cx in range(center_x - ring, center_x + ring + 1):
+                    for cy in (center_y - ring, center_y + ring):
+                        candidates.update(self.cells.get((cx, cy), ()))
+                for cy in range(center_y - ring + 1, center_y + ring):
+                    for cx in (center_x - ring, center_x + ring):
+                        candidates.update(self.cells.get((cx, cy), ()))
+                candidates -= seen
+                ring_done = False
+
+            for item in candidates:
+                seen.add(item)
+                if types is not None and self.items[item][1] not in types:
+                    continue
+                distance = self.distance(item, point)
+                if distance <= max_distance:
+                    found.append((distance, item))
+
+            found.sort(key=lambda pair: pair[0])
+            reach = ring * size  # 尚未掃描的網格至少這麼遠
+            if ring_done or len(seen) == len(self.items) or reach > max_distance or \
+                    (len(found) >= k and found[k - 1][0] <= reach):
+                return found[:k]
+            ring += 1
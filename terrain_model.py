@@ -0,0 +1,163 @@
+import numpy as np
+
+# 屬於靜態地形的檢測類別
+TERRAIN_CLASSES = ("Ground", "ground", "platform")
+
+
+def box_iou(boxes_a, boxes_b):
+    """計算兩組 (x1, y1, x2, y2) 框之間的IoU矩陣"""
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    ix1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    iy1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    ix2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    iy2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    inter = np.maximum(0, ix2 - ix1) * np.maximum(0, iy2 - iy1)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+class TerrainModel:
+    """單一地圖的靜態地形模型
+
+    前 warmup_frames 幀的地形檢測（世界座標）按IoU合併成穩定的地形框；
+    穩定後只需每隔 validation_interval 幀做一次完整的地形檢測來驗證，
+    驗證時同時學習新出現的地形（例如移動到地圖的其他部分）。
+    """
+
+    def __init__(self, warmup_frames=30, merge_iou=0.5, min_hit_ratio=0.5, validation_interval=150):
+        self.warmup_frames = warmup_frames
+        self.merge_iou = merge_iou
+        self.min_hit_ratio = min_hit_ratio
+        self.validation_interval = validation_interval
+
+        self.boxes = np.zeros((0, 4), dtype=np.float64)
+        self.hits = np.zeros(0, dtype=np.int32)
+        self.class_names = []
+        self.frames_observed = 0
+        self.stable = False
+        self._frames_since_validation = 0
+
+    @property
+    def is_stable(self):
+        return self.stable
+
+    def needs_full_detection(self):
+        """本幀是否需要執行完整的地形檢測（學習中或到了驗證時間）"""
+        if not self.stable:
+            return True
+        self._frames_since_validation += 1
+        return self._frames_since_validation >= self.validation_interval
+
+    def observe(self, boxes, class_names, view_box=None):
+        """加入一幀完整的地形檢測結果（世界座標），view_box 為本幀畫面對應的世界範圍"""
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        if self.stable:
+            self._validate(boxes, class_names, view_box)
+            return
+
+        self._merge(boxes, class_names)
+        self.frames_observed += 1
+
+        if self.frames_observed >= self.warmup_frames:
+            # 只保留在足夠多幀中出現過的地形，過濾偶發的誤檢
+            keep = self.hits >= self.min_hit_ratio * self.frames_observed
+            self._keep(keep)
+            self.stable = len(self.boxes) > 0
+            self._frames_since_validation = 0
+            if self.stable:
+                print(f"地形模型已穩定: {len(self.boxes)} 個地形框")
+
+    def _validate(self, boxes, class_names, view_box=None):
+        """以完整檢測驗證畫面內已學習的地形，偏差過大時重新學習；畫面內新出現的地形會被加入"""
+        self._frames_since_validation = 0
+
+        # 只有完整位於畫面內的地形框才可能被本幀檢測到
+        visible = self._inside(view_box)
+        matched = np.zeros(len(self.boxes), dtype=bool)
+        if visible.any() and len(boxes):
+            matched[visible] = box_iou(self.boxes[visible], boxes).max(axis=1) >= self.merge_iou
+
+        # 以多次確認過的地形判斷是否偏差過大
+        confirmed = visible & (self.hits > 1)
+        if confirmed.any() and matched[confirmed].mean() < 0.5:
+            print("地形驗證失敗，重新學習地形")
+            self.reset()
+            self._merge(boxes, class_names)
+            self.frames_observed = 1
+            return
+
+        # 只出現過一次又沒被再次檢測到的框視為誤檢
+        self._keep(~(visible & ~matched & (self.hits <= 1)))
+        self._merge(boxes, class_names)
+
+    def _inside(self, view_box):
+        """完整位於 view_box 內的地形框；沒有 view_box 時視為全部可見"""
+        if view_box is None:
+            return np.ones(len(self.boxes), dtype=bool)
+        x1, y1, x2, y2 = view_box
+        return (self.boxes[:, 0] >= x1) & (self.boxes[:, 1] >= y1) & \
+               (self.boxes[:, 2] <= x2) & (self.boxes[:, 3] <= y2)
+
+    def _merge(self, boxes, class_names):
+        """把檢測框合併到已有的地形框（以命中次數加權平均）"""
+        if len(boxes) == 0:
+            return
+
+        if len(self.boxes):
+            iou = box_iou(boxes, self.boxes)
+            best = iou.argmax(axis=1)
+            matched = iou[np.arange(len(boxes)), best] >= self.merge_iou
+        else:
+            best = np.zeros(len(boxes), dtype=np.int64)
+            matched = np.zeros(len(boxes), dtype=bool)
+
+        for i in np.nonzero(matched)[0]:
+            j = best[i]
+            weight = self.hits[j]
+            self.boxes[j] = (self.boxes[j] * weight + boxes[i]) / (weight + 1)
+            self.hits[j] += 1
+
+        new = ~matched
+        if new.any():
+            self.boxes = np.vstack([self.boxes, boxes[new]])
+            self.hits = np.concatenate([self.hits, np.ones(int(new.sum()), dtype=np.int32)])
+            self.class_names.extend(class_names[i] for i in np.nonzero(new)[0])
+
+    def _keep(self, mask):
+        self.boxes = self.boxes[mask]
+        self.hits = self.hits[mask]
+        self.class_names = [name for name, keep in zip(self.class_names, mask) if keep]
+
+    def get_boxes(self):
+        """返回地形框 (N×4) 與對應的類別名稱"""
+        return self.boxes.copy(), list(self.class_names)
+
+    def reset(self):
+        self.boxes = np.zeros((0, 4), dtype=np.float64)
+        self.hits = np.zeros(0, dtype=np.int32)
+        self.class_names = []
+        self.frames_observed = 0
+        self.stable = False
+        self._frames_since_validation = 0
+
+    def to_dict(self):
+        """轉換為可保存的字典"""
+        return {
+            "boxes": self.boxes.tolist(),
+            "hits": self.hits.tolist(),
+            "class_names": list(self.class_names),
+            "frames_observed": self.frames_observed,
+            "stable": self.stable
+        }
+
+    def load_dict(self, data):
+        """從保存的字典還原"""
+        self.boxes = np.array(data.get("boxes", []), dtype=np.float64).reshape(-1, 4)
+        self.hits = np.array(data.get("hits", []), dtype=np.int32)
+        self.class_names = list(data.get("class_names", []))
+        self.frames_observed = data.get("frames_observed", 0)
+        self.stable = data.get("stable", False) and len(self.boxes) > 0
+        self._frames_since_validation = 0
@@ -0,0 +1,39 @@
+import ast
+import inspect
+import os
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _parse(name):
+    with open(os.path.join(ROOT, name), encoding="utf-8") as f:
+        return ast.parse(f.read())
+
+
+def _analyzer_signature():
+    """只取出 MinimapAnalyzer.__init__ 的參數列表（AutoBattleSystem 需要 pynput，測試環境不一定有）"""
+    for node in ast.walk(_parse("AutoBattleSystem.py")):
+        if isinstance(node, ast.ClassDef) and node.name == "MinimapAnalyzer":
+            init = next(n for n in node.body if isinstance(n, ast.FunctionDef) and n.name == "__init__")
+            stub = ast.Module([ast.FunctionDef(init.name, init.args, [ast.Pass()], [], None, None)], [])
+            namespace = {}
+            exec(compile(ast.fix_missing_locations(stub), "AutoBattleSystem.py", "exec"), namespace)
+            return inspect.signature(namespace["__init__"])
+    raise AssertionError("找不到 MinimapAnalyzer")
+
+
+def test_main_constructs_minimap_analyzer_with_valid_arguments():
+    signature = _analyzer_signature()
+    calls = [node for node in ast.walk(_parse("main.py"))
+             if isinstance(node, ast.Call) and getattr(node.func, "id", None) == "MinimapAnalyzer"]
+    assert calls
+    for call in calls:
+        signature.bind(None, *call.args, **{kw.arg: kw.value for kw in call.keywords})
+
+
+def test_minimap_analyzer_constructs():
+    pytest.importorskip("pynput")
+    from AutoBattleSystem import MinimapAnalyzer
+    analyzer = MinimapAnalyzer()
+    assert analyzer.player_position is None
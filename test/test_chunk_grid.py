@@ -0,0 +1,69 @@
+import numpy as np
+from chunk_grid import ChunkedGrid, FLAG_EXPLORED, FLAG_PLATFORM
+
+
+def test_flags_across_chunks_and_negative_cells():
+    grid = ChunkedGrid(chunk_size=4)
+    cells = [(0, 0), (3, 3), (4, 0), (-1, -1), (-5, 2)]
+    grid.set_flags(cells, FLAG_EXPLORED, timestamp=1700000000.25)
+
+    assert len(grid) == 4
+    assert grid.get_flags(cells + [(10, 10)]).tolist() == [FLAG_EXPLORED] * 5 + [0]
+    # 時間戳保留 float64 精度
+    assert grid.get_last_seen([(-1, -1)])[0] == 1700000000.25
+
+    grid.set_flags([(0, 0)], FLAG_PLATFORM)
+    grid.clear_flags([(0, 0), (4, 0)], FLAG_EXPLORED)
+    assert grid.get_flags([(0, 0), (4, 0)]).tolist() == [FLAG_PLATFORM, 0]
+    assert grid.has_flag((0, 0), FLAG_PLATFORM) and not grid.has_flag((0, 0), FLAG_EXPLORED)
+
+
+def test_region_write_and_read_span_chunks():
+    grid = ChunkedGrid(chunk_size=4)
+    values = np.arange(1, 31, dtype=np.uint8).reshape(5, 6)
+    grid.write_region(-2, -1, values)
+
+    np.testing.assert_array_equal(grid.read_region(-2, -1, 3, 3), values)
+    # 讀取範圍超出寫入範圍時以 0 填補
+    region = grid.read_region(-3, -1, 3, 4)
+    assert region.shape == (6, 7)
+    np.testing.assert_array_equal(region[:5, 1:], values)
+    assert not region[:, 0].any() and not region[5].any()
+
+    grid.write_region(-2, -1, np.full((1, 2), FLAG_PLATFORM, dtype=np.uint8), mode="or")
+    assert grid.read_region(-2, -1, -1, -1).tolist() == [[1 | FLAG_PLATFORM, 2 | FLAG_PLATFORM]]
+
+
+def test_all_zero_region_does_not_allocate():
+    grid = ChunkedGrid(chunk_size=4)
+    grid.write_region(0, 0, np.zeros((8, 8), dtype=np.uint8))
+    assert len(grid) == 0
+
+
+def test_cells_with():
+    grid = ChunkedGrid(chunk_size=4)
+    grid.set_flags([(1, 1), (-3, 6)], FLAG_PLATFORM)
+    grid.set_flags([(1, 1)], FLAG_EXPLORED)
+
+    assert sorted(map(tuple, grid.cells_with(FLAG_PLATFORM).tolist())) == [(-3, 6), (1, 1)]
+    assert grid.cells_with(FLAG_PLATFORM, exact=True).tolist() == [[-3, 6]]
+
+
+def test_dirty_and_lazy_loading():
+    grid = ChunkedGrid(chunk_size=4)
+    grid.set_flags([(0, 0), (5, 0)], FLAG_EXPLORED)
+    saved = grid.take_dirty()
+    assert set(saved) == {(0, 0), (1, 0)}
+    assert grid.take_dirty() == {}
+
+    loaded = []
+
+    def loader(key):
+        loaded.append(key)
+        return saved[key]
+
+    grid.set_pending(saved.keys(), loader)
+    assert len(grid) == 2 and loaded == []
+    assert grid.has_flag((5, 0), FLAG_EXPLORED)
+    assert loaded == [(1, 0)]
+    assert not grid.dirty  # 載入不算修改
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from CollisionSystem import CollisionBox, CollisionSystem
+from MapMemory import MapMemory
+from coordinate_system import CoordinateTransformer
+
+BOXES = np.array([
+    [10.0, -5.0, 20.0, 5.0],   # 正前方
+    [-20.0, -5.0, -10.0, 5.0],  # 正後方
+    [10.0, 10.0, 20.0, 20.0],  # 斜上方
+    [-5.0, -5.0, 5.0, 5.0],    # 包含起點
+])
+
+
+def test_ray_box_intervals_single_ray():
+    system = CollisionSystem(map_memory=None)
+    t_enter, t_exit = system.ray_box_intervals((0.0, 0.0), (1.0, 0.0), BOXES)
+
+    np.testing.assert_allclose(t_enter, [10.0, np.inf, np.inf, -5.0])
+    np.testing.assert_allclose(t_exit, [20.0, np.inf, np.inf, 5.0])
+
+
+def test_ray_box_intervals_fan():
+    system = CollisionSystem(map_memory=None)
+    diagonal = np.sqrt(0.5)
+    directions = np.array([[1.0, 0.0], [diagonal, diagonal], [-1.0, 0.0]])
+    t_enter, _ = system.ray_box_intervals((0.0, 0.0), directions, BOXES)
+
+    assert t_enter.shape == (3, 4)
+    np.testing.assert_allclose(t_enter[:, 0], [10.0, np.inf, np.inf])
+    np.testing.assert_allclose(t_enter[1, 2], 10.0 / diagonal)
+    np.testing.assert_allclose(t_enter[2, 1], 10.0)
+
+
+def test_time_to_collision_ignores_overlapping_start():
+    system = CollisionSystem(map_memory=None)
+    ground = CollisionBox(0, 15, 400, 20, "platform")  # 與玩家腳下重疊
+    wall = CollisionBox(100, 0, 20, 40, "obstacle")
+    system._insert_object(ground)
+    system._insert_object(wall)
+    player = (-10, -10, 10, 10)
+
+    t, hit = system.time_to_collision((200.0, 0.0), box=player, types=("obstacle", "platform"))
+    assert hit is wall
+    assert t == pytest.approx(0.4)  # 右緣由 10 移到牆的左緣 90
+
+    assert system.time_to_collision((-200.0, 0.0), box=player, types=("obstacle", "platform")) == (None, None)
+
+
+def test_predict_obstacle_collision_from_detections(tmp_path):
+    system = CollisionSystem(MapMemory(save_path=str(tmp_path)))
+    system.update_from_detections([
+        {"class_name": "Ground", "bbox": (0, 500, 800, 540)},
+        {"class_name": "platform", "bbox": (300, 380, 500, 500)},  # 前方高起的平台
+    ], CoordinateTransformer((0, 0, 100, 100)))
+
+    # 探測盒與腳下的地面重疊，不算障礙；前方的平台才是
+    ahead = system.predict_obstacle_collision((200.0, 495.0), "right", distance=150)
+    assert ahead["collision"] and ahead["obstacle"].data["class_name"] == "platform"
+    assert ahead["distance"] == pytest.approx(70.0)
+    assert not system.predict_obstacle_collision((200.0, 495.0), "left", distance=150)["collision"]
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from coordinate_system import AffineFitter, AffineTransform, CoordinateTransformer
+
+
+def test_affine_transform_inverse_and_boxes():
+    transform = AffineTransform.from_scale_offset((2.0, 3.0), (10.0, -5.0))
+    points = np.array([[0.0, 0.0], [1.0, 2.0]])
+    np.testing.assert_allclose(transform.apply(points), [[10, -5], [12, 1]])
+    np.testing.assert_allclose(transform.inverse().apply(transform.apply(points)), points)
+    # 負縮放時仍返回 (x1, y1, x2, y2) 外接框
+    flipped = AffineTransform.from_scale_offset((-1.0, 1.0), (0.0, 0.0))
+    np.testing.assert_allclose(flipped.apply_boxes([[1, 2, 3, 4]]), [[-3, 2, -1, 4]])
+
+
+def test_fitter_recovers_scale_and_offset():
+    fitter = AffineFitter(prior_scale=1.0, min_pairs=5)
+    src = np.array([[x, y] for x in range(0, 50, 10) for y in range(0, 30, 10)], dtype=np.float64)
+    fitter.add(src, src * [4.0, 2.5] + [100.0, -20.0])
+
+    assert fitter.fitted_scale() == pytest.approx((4.0, 2.5))
+    transform = fitter.solve()
+    np.testing.assert_allclose(transform.apply([7.0, 3.0]), [128.0, -12.5])
+
+
+def test_fitter_keeps_prior_scale_for_degenerate_axis():
+    fitter = AffineFitter(prior_scale=1.5, min_pairs=3)
+    for x in range(0, 60, 10):
+        fitter.add((x, 5.0), (x * 3.0, 40.0))  # 只在水平移動
+
+    assert fitter.fitted_scale() is None
+    transform = fitter.solve()
+    np.testing.assert_allclose(transform.matrix, [[3.0, 0.0, 0.0], [0.0, 1.5, 32.5]])
+
+
+def test_fitter_without_pairs():
+    assert AffineFitter().solve() is None
+
+
+def test_coordinate_transformer_round_trip():
+    transformer = CoordinateTransformer((0, 0, 100, 100))
+    transformer.x_scale, transformer.y_scale = 2.0, 0.5
+    transformer.anchor_camera((400, 300), (1000.0, 200.0))
+
+    assert transformer.screen_to_world((400, 300)) == pytest.approx((1000.0, 200.0))
+    assert transformer.world_to_screen((1000.0, 200.0)) == pytest.approx((400.0, 300.0))
+    boxes = transformer.screen_boxes_to_world([[390, 290, 410, 310]])
+    np.testing.assert_allclose(transformer.world_boxes_to_screen(boxes), [[390, 290, 410, 310]])
@@ -0,0 +1,57 @@
+import cv2
+import numpy as np
+from map_identifier import MapIdentifier
+
+
+def _minimap(seed, size=(120, 80)):
+    """以隨機灰色方塊組成的小地圖佈局（不含會被遮蔽的玩家/怪物顏色）"""
+    rng = np.random.default_rng(seed)
+    w, h = size
+    image = np.full((h, w, 3), 40, dtype=np.uint8)
+    for _ in range(12):
+        x, y = rng.integers(0, w - 20), rng.integers(0, h - 10)
+        shade = int(rng.integers(120, 230))
+        cv2.rectangle(image, (int(x), int(y)), (int(x) + 20, int(y) + 6), (shade, shade, shade), -1)
+    return image
+
+
+def test_blank_minimap_has_no_fingerprint(tmp_path):
+    identifier = MapIdentifier(save_path=str(tmp_path))
+    assert identifier.fingerprint(np.full((80, 120, 3), 200, dtype=np.uint8)) is None
+
+
+def test_lookup_matches_registered_map(tmp_path):
+    identifier = MapIdentifier(save_path=str(tmp_path))
+    image = _minimap(1)
+    fingerprint = identifier.fingerprint(image)
+    map_id = identifier.register(fingerprint, (120, 80))
+
+    assert identifier.lookup(fingerprint, (120, 80)) == (map_id, 0)
+    # 尺寸不同的小地圖不會配對
+    assert identifier.lookup(fingerprint, (200, 80)) == (None, None)
+    # 其他佈局距離過大
+    assert identifier.lookup(identifier.fingerprint(_minimap(2)), (120, 80)) == (None, None)
+
+
+def test_index_persists_between_instances(tmp_path):
+    identifier = MapIdentifier(save_path=str(tmp_path))
+    fingerprint = identifier.fingerprint(_minimap(3))
+    map_id = identifier.register(fingerprint, (120, 80))
+
+    reloaded = MapIdentifier(save_path=str(tmp_path))
+    assert reloaded.lookup(fingerprint, (120, 80))[0] == map_id
+
+
+def test_identify_registers_only_after_stable_window(tmp_path):
+    identifier = MapIdentifier(save_path=str(tmp_path), stable_frames=2, register_frames=5)
+    image = _minimap(4)
+
+    results = [identifier.identify(image) for _ in range(5)]
+    assert results[:4] == [(None, False)] * 4
+    map_id, is_new = results[4]
+    assert map_id is not None and is_new
+
+    # 已知地圖只需 stable_frames 幀就確認
+    identifier.identify(np.zeros((80, 120, 3), dtype=np.uint8))
+    assert identifier.identify(image) == (None, False)
+    assert identifier.identify(image) == (map_id, False)
@@ -0,0 +1,67 @@
+import os
+import numpy as np
+from MapMemory import MapMemory
+
+
+def _populate(memory):
+    memory.switch_map("map_0001")
+    for x in range(0, 500, 50):
+        memory.update_player_position((x, 100.0))
+    memory.update_terrain_feature((60.0, 160.0), "platform")
+    memory.add_object("rope", (120.0, 40.0))
+    memory.minimap_scale = (4.0, 3.5)
+
+
+def test_save_load_round_trip(tmp_path):
+    memory = MapMemory(save_path=str(tmp_path))
+    _populate(memory)
+    memory.save_map()
+    assert os.path.exists(tmp_path / "map_0001" / "index.json")
+
+    loaded = MapMemory(save_path=str(tmp_path))
+    loaded.switch_map("map_0001")
+    # 區塊延遲載入
+    assert loaded.grid.pending and not loaded.grid.chunks
+
+    assert loaded.is_position_explored((450.0, 100.0))
+    assert not loaded.is_position_explored((450.0, 600.0))
+    assert loaded.minimap_scale == (4.0, 3.5)
+    assert list(loaded.ropes) == [(2, 0)]
+    assert loaded.get_nearest_object((0.0, 0.0), "rope")["position"] == (120.0, 40.0)
+    np.testing.assert_array_equal(loaded.trajectory.samples(), memory.trajectory.samples())
+    np.testing.assert_array_equal(loaded.collision_layer.grid, memory.collision_layer.grid)
+    np.testing.assert_array_equal(loaded.grid.read_region(-2, -2, 12, 5), memory.grid.read_region(-2, -2, 12, 5))
+
+
+def test_save_writes_only_changes(tmp_path):
+    memory = MapMemory(save_path=str(tmp_path))
+    _populate(memory)
+    memory.save_map()
+    assert memory._snapshot() is None
+
+    memory.update_player_position((2000.0, 100.0))
+    snapshot = memory._snapshot()
+    assert list(snapshot["chunks"]) == [(0, 0)]
+
+
+def test_switching_maps_keeps_each_map(tmp_path):
+    memory = MapMemory(save_path=str(tmp_path))
+    _populate(memory)
+    memory.switch_map("map_0002")
+    assert not memory.is_position_explored((0.0, 100.0))
+    memory.update_player_position((0.0, 900.0))
+
+    memory.switch_map("map_0001")
+    assert memory.is_position_explored((0.0, 100.0))
+    assert not memory.is_position_explored((0.0, 900.0))
+
+
+def test_autosave_thread(tmp_path):
+    memory = MapMemory(save_path=str(tmp_path))
+    memory.start_autosave(interval=0.05)
+    _populate(memory)
+    memory.stop_autosave()
+
+    loaded = MapMemory(save_path=str(tmp_path))
+    loaded.switch_map("map_0001")
+    assert loaded.is_position_explored((450.0, 100.0))
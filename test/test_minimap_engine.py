@@ -0,0 +1,14 @@
+import numpy as np
+from minimap_engine import (ColorClassifier, DEFAULT_COLOR_RULES, MINIMAP_BACKGROUND_RULES,
+                            CLASS_BACKGROUND, CLASS_PLAYER, CLASS_MINIMAP_BACKGROUND)
+
+
+def test_class_ids_are_distinct():
+    ids = [CLASS_BACKGROUND, *DEFAULT_COLOR_RULES, *MINIMAP_BACKGROUND_RULES]
+    assert len(ids) == len(set(ids))
+
+
+def test_combined_rules_separate_player_and_background():
+    classifier = ColorClassifier({**DEFAULT_COLOR_RULES, **MINIMAP_BACKGROUND_RULES})
+    image = np.array([[[0, 230, 250], [235, 235, 235], [20, 20, 20]]], dtype=np.uint8)  # 黃色、白色、黑色（BGR）
+    assert classifier.classify(image).tolist() == [[CLASS_PLAYER, CLASS_MINIMAP_BACKGROUND, CLASS_BACKGROUND]]
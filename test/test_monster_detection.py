@@ -0,0 +1,46 @@
+import json
+import os
+import numpy as np
+from MonsterDetection import TemplateMonsterDetector
+
+
+def _template(seed):
+    return np.random.default_rng(seed).integers(0, 255, (12, 10, 3), dtype=np.uint8)
+
+
+def _index(templates_dir):
+    with open(os.path.join(templates_dir, "templates_info.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_atlas_round_trip(tmp_path):
+    detector = TemplateMonsterDetector(str(tmp_path))
+    detector.add_template(template_img=_template(1), name="a")
+    detector.add_template(template_img=_template(2), name="b")
+    assert not detector.add_template(template_img=_template(1), name="dup")
+
+    reloaded = TemplateMonsterDetector(str(tmp_path))
+    assert sorted(info["name"] for info in reloaded.template_info.values()) == ["a", "b"]
+    assert sorted(info["name"] for info in _index(tmp_path).values()) == ["a", "b"]
+
+
+def test_add_after_failed_entry_keeps_all_templates(tmp_path):
+    detector = TemplateMonsterDetector(str(tmp_path))
+    detector.add_template(template_img=_template(1), name="a")
+
+    # 索引中有一個檔案遺失的條目，且圖集尚不存在
+    index = _index(tmp_path)
+    index["lost"] = {"name": "lost", "path": "lost.png", "width": 10, "height": 12}
+    with open(os.path.join(tmp_path, "templates_info.json"), "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.remove(detector.atlas_file)
+
+    detector = TemplateMonsterDetector(str(tmp_path))
+    assert detector._unloaded_info and not os.path.exists(detector.atlas_file)
+    detector.add_template(template_img=_template(2), name="b")
+
+    # 新增模板後圖集與索引都包含全部模板，遺失的條目仍保留在索引中
+    assert sorted(info["name"] for info in _index(tmp_path).values()) == ["a", "b", "lost"]
+    reloaded = TemplateMonsterDetector(str(tmp_path))
+    assert sorted(info["name"] for info in reloaded.template_info.values()) == ["a", "b"]
+    assert list(reloaded._unloaded_info) == ["lost"]
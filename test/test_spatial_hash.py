@@ -0,0 +1,64 @@
+import math
+import random
+from spatial_hash import SpatialHashGrid
+
+
+def test_query_box_and_types():
+    grid = SpatialHashGrid(cell_size=10)
+    grid.insert("a", (0, 0, 5, 5), "rope")
+    grid.insert("b", (25, 25, 60, 30), "portal")
+    grid.insert("c", (-40, -40, -35, -35), "rope")
+
+    assert sorted(grid.query_box((0, 0, 30, 30))) == ["a", "b"]
+    assert grid.query_box((0, 0, 30, 30), types={"portal"}) == ["b"]
+    assert grid.query_box((-50, -50, -30, -30)) == ["c"]
+
+
+def test_update_and_remove():
+    grid = SpatialHashGrid(cell_size=10)
+    grid.insert("a", (0, 0, 5, 5), "rope")
+    grid.update("a", (100, 100, 105, 105))
+
+    assert grid.query_box((0, 0, 10, 10)) == []
+    assert grid.query_box((95, 95, 110, 110)) == ["a"]
+    assert grid.get_box("a") == (100, 100, 105, 105)
+
+    grid.remove("a")
+    assert len(grid) == 0 and not grid.cells
+    grid.remove("a")  # 不存在時忽略
+
+
+def test_query_radius_sorted():
+    grid = SpatialHashGrid(cell_size=10)
+    grid.insert("far", (30, 0, 30, 0))
+    grid.insert("near", (10, 0, 10, 0))
+    grid.insert("out", (0, 50, 0, 50))
+
+    assert grid.query_radius((0, 0), 35, sort=True) == ["near", "far"]
+
+
+def test_query_nearest_matches_brute_force():
+    rng = random.Random(7)
+    grid = SpatialHashGrid(cell_size=50)
+    boxes = {}
+    for i in range(200):
+        x, y = rng.uniform(-1000, 1000), rng.uniform(-1000, 1000)
+        boxes[i] = (x, y, x + rng.uniform(0, 80), y + rng.uniform(0, 80))
+        grid.insert(i, boxes[i], "rope" if i % 3 else "portal")
+
+    for _ in range(20):
+        point = (rng.uniform(-1200, 1200), rng.uniform(-1200, 1200))
+        expected = sorted((grid.distance(i, point), i) for i in boxes)
+        assert [i for _, i in grid.query_nearest(point, k=5)] == [i for _, i in expected[:5]]
+
+        portals = [(d, i) for d, i in expected if i % 3 == 0]
+        assert grid.query_nearest(point, k=2, types={"portal"}) == portals[:2]
+
+
+def test_query_nearest_limits():
+    grid = SpatialHashGrid(cell_size=10)
+    assert grid.query_nearest((0, 0)) == []
+    grid.insert("a", (100, 0, 100, 0))
+    assert grid.query_nearest((0, 0), max_distance=50) == []
+    assert grid.query_nearest((0, 0), k=3) == [(100.0, "a")]
+    assert math.isclose(grid.query_nearest((103, 4))[0][0], 5.0)
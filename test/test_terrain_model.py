@@ -0,0 +1,67 @@
+import numpy as np
+from terrain_model import TerrainModel, box_iou
+
+GROUND = [0, 500, 800, 540]
+PLATFORM = [100, 300, 300, 320]
+
+
+def _learned(warmup_frames=3):
+    model = TerrainModel(warmup_frames=warmup_frames)
+    for _ in range(warmup_frames):
+        model.observe([GROUND, PLATFORM], ["ground", "platform"])
+    return model
+
+
+def test_box_iou():
+    iou = box_iou([[0, 0, 10, 10]], [[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]])
+    np.testing.assert_allclose(iou, [[1.0, 1 / 3, 0.0]])
+
+
+def test_warmup_merges_and_drops_spurious_boxes():
+    model = TerrainModel(warmup_frames=4)
+    for i in range(4):
+        boxes = [[0, 500 + i, 800, 540 + i], PLATFORM]
+        names = ["ground", "platform"]
+        if i == 0:
+            boxes.append([600, 100, 650, 120])  # 只出現一幀的誤檢
+            names.append("platform")
+        model.observe(boxes, names)
+
+    assert model.is_stable
+    boxes, names = model.get_boxes()
+    assert names == ["ground", "platform"]
+    np.testing.assert_allclose(boxes[0], [0, 501.5, 800, 541.5])
+
+
+def test_validation_ignores_boxes_outside_view():
+    model = _learned()
+    # 畫面只看到地面，平台在畫面外沒被檢測到不算驗證失敗
+    model.observe([GROUND], ["ground"], view_box=(0, 400, 800, 600))
+    assert model.is_stable
+    assert len(model.get_boxes()[0]) == 2
+
+
+def test_validation_learns_new_terrain():
+    model = _learned()
+    model.observe([GROUND, PLATFORM, [500, 200, 700, 220]], ["ground", "platform", "platform"])
+    assert model.is_stable
+    assert len(model.get_boxes()[0]) == 3
+
+    # 新地形只出現一次、再次驗證時在畫面內卻沒被檢測到，視為誤檢移除
+    model.observe([GROUND, PLATFORM], ["ground", "platform"])
+    assert len(model.get_boxes()[0]) == 2
+
+
+def test_validation_failure_relearns():
+    model = _learned()
+    model.observe([[0, 100, 50, 120]], ["platform"])
+    assert not model.is_stable
+    assert model.frames_observed == 1
+
+
+def test_dict_round_trip():
+    model = _learned()
+    restored = TerrainModel()
+    restored.load_dict(model.to_dict())
+    assert restored.is_stable
+    np.testing.assert_array_equal(restored.get_boxes()[0], model.get_boxes()[0])
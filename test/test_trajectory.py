@@ -0,0 +1,55 @@
+import numpy as np
+from trajectory import TrajectoryStore, COL_TIME, COL_DURATION
+
+
+def test_add_skips_close_samples():
+    store = TrajectoryStore(min_distance=20, min_interval=1.0)
+    assert store.add((0, 0), 0.0)
+    assert not store.add((5, 5), 0.5)      # 太近且太快
+    assert store.add((50, 0), 0.6)         # 移動夠遠
+    assert store.add((50, 0), 2.0)         # 間隔夠久
+    assert len(store) == 3
+    assert store.last_position() == (50.0, 0.0)
+
+
+def test_capacity_is_bounded_and_downsampled():
+    store = TrajectoryStore(levels=((10.0, 0.0, 16), (100.0, 5.0, 16), (None, 50.0, 8)),
+                            min_distance=0, min_interval=0, max_gap=2.0)
+    for t in range(2000):
+        store.add((t * 30.0, 0.0), float(t))
+
+    samples = store.samples()
+    assert len(store) <= 16 + 16 + 8
+    assert np.all(np.diff(samples[:, COL_TIME]) > 0)
+    # 最近的一層保留每個樣本，更舊的樣本間隔至少為該層的取樣間隔
+    recent = samples[samples[:, COL_TIME] > 1989]
+    assert np.all(np.diff(recent[:, COL_TIME]) == 1.0)
+    oldest_level = store.levels[2][2].ordered()
+    assert np.all(np.diff(oldest_level[:, COL_TIME]) >= 50.0)
+
+
+def test_duration_is_kept_when_downsampling():
+    store = TrajectoryStore(levels=((5.0, 0.0, 8), (None, 10.0, 64)), min_distance=0, min_interval=0, max_gap=2.0)
+    for t in range(200):
+        store.add((0.0, 0.0), float(t))
+
+    # 每個樣本停留一秒（最新樣本尚未結束），降採樣後總和不變
+    assert store.samples()[:, COL_DURATION].sum() == 199.0
+    assert store.time_near((0.0, 0.0), 1.0) == 199.0
+    assert store.time_near((100.0, 0.0), 1.0) == 0.0
+
+
+def test_queries_and_reload():
+    store = TrajectoryStore(min_distance=0, min_interval=0)
+    store.add((0.0, 0.0), 10.0)
+    store.add((100.0, 0.0), 11.0)
+    store.add((0.0, 0.0), 12.0)
+
+    assert store.last_visit((-5, -5, 5, 5)) == 12.0
+    assert store.last_visit((95, -5, 105, 5)) == 11.0
+    assert store.last_visit((500, 500, 600, 600)) is None
+    assert len(store.positions(since=11.0)) == 2
+
+    restored = TrajectoryStore()
+    restored.load_array(store.samples()[::-1])
+    np.testing.assert_array_equal(restored.samples(), store.samples())
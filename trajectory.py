@@ -0,0 +1,143 @@
+import math
+import time
+import numpy as np
+
+# 樣本欄位：時間戳、世界座標、此樣本代表的停留時間（秒）
+COL_TIME, COL_X, COL_Y, COL_DURATION = range(4)
+
+
+class _Ring:
+    """固定容量的樣本環形緩衝區（N×4 陣列）"""
+
+    def __init__(self, capacity):
+        self.data = np.zeros((capacity, 4), dtype=np.float64)
+        self.start = 0
+        self.size = 0
+
+    @property
+    def full(self):
+        return self.size == len(self.data)
+
+    def push(self, row):
+        self.data[(self.start + self.size) % len(self.data)] = row
+        self.size += 1
+
+    def pop_oldest(self):
+        row = self.data[self.start].copy()
+        self.start = (self.start + 1) % len(self.data)
+        self.size -= 1
+        return row
+
+    def oldest(self):
+        return self.data[self.start] if self.size else None
+
+    def newest(self):
+        """最新樣本（陣列視圖，可直接修改）"""
+        return self.data[(self.start + self.size - 1) % len(self.data)] if self.size else None
+
+    def ordered(self):
+        """按時間順序返回樣本的副本"""
+        end = self.start + self.size
+        if end <= len(self.data):
+            return self.data[self.start:end].copy()
+        return np.concatenate([self.data[self.start:], self.data[:end - len(self.data)]])
+
+    def clear(self):
+        self.start = 0
+        self.size = 0
+
+
+class TrajectoryStore:
+    """有上限的玩家軌跡記錄，附時間戳並按時間分層降採樣
+
+    levels 為 (時間範圍秒數, 最小取樣間隔秒數, 容量) 的列表，由新到舊排列：
+    預設最近一分鐘保留全部樣本，一小時內每秒一個，更舊的每十秒一個，最後一層滿了就丟棄最舊樣本。
+    被降採樣丟棄的樣本把停留時間併入同層前一個樣本，停留時間的統計因此不會流失。
+    """
+
+    DEFAULT_LEVELS = ((60.0, 0.0, 4096), (3600.0, 1.0, 4096), (None, 10.0, 8192))
+
+    def __init__(self, levels=DEFAULT_LEVELS, min_distance=20.0, min_interval=1.0, max_gap=2.0):
+        self.levels = [(span, interval, _Ring(capacity)) for span, interval, capacity in levels]
+        self.min_distance = min_distance  # 移動超過此距離才記錄新樣本
+        self.min_interval = min_interval  # 或距離上一個樣本超過此秒數
+        self.max_gap = max_gap            # 單一樣本最長的停留時間（更長視為未追蹤）
+        self.version = 0                  # 每次修改遞增，供增量保存判斷是否需要寫入
+
+    def __len__(self):
+        return sum(ring.size for _, _, ring in self.levels)
+
+    def add(self, position, timestamp=None):
+        """記錄玩家位置，與上一個樣本太接近時忽略並返回False"""
+        timestamp = time.time() if timestamp is None else timestamp
+        last = self.levels[0][2].newest()
+        if last is not None:
+            elapsed = timestamp - last[COL_TIME]
+            moved = math.hypot(position[0] - last[COL_X], position[1] - last[COL_Y])
+            if elapsed < self.min_interval and moved <= self.min_distance:
+                return False
+            last[COL_DURATION] = min(max(elapsed, 0.0), self.max_gap)
+
+        self._push(0, (timestamp, position[0], position[1], 0.0))
+        self.version += 1
+        return True
+
+    def _push(self, level, row):
+        span, _, ring = self.levels[level]
+        # 把超出本層時間範圍或容量的舊樣本移到下一層
+        while ring.size and (ring.full or (span is not None and row[COL_TIME] - ring.oldest()[COL_TIME] > span)):
+            self._demote(level + 1, ring.pop_oldest())
+        ring.push(row)
+
+    def _demote(self, level, row):
+        if level >= len(self.levels):
+            return
+        _, interval, ring = self.levels[level]
+        newest = ring.newest()
+        if newest is not None and row[COL_TIME] - newest[COL_TIME] < interval:
+            newest[COL_DURATION] += row[COL_DURATION]
+            return
+        self._push(level, row)
+
+    def samples(self, since=None):
+        """按時間順序返回所有樣本 (N×4)：時間、x、y、停留時間"""
+        parts = [ring.ordered() for _, _, ring in reversed(self.levels) if ring.size]
+        result = np.concatenate(parts) if parts else np.zeros((0, 4), dtype=np.float64)
+        if since is not None:
+            result = result[result[:, COL_TIME] >= since]
+        return result
+
+    def positions(self, since=None):
+        """按時間順序返回樣本位置 (N×2)"""
+        return self.samples(since)[:, COL_X:COL_Y + 1]
+
+    def last_position(self):
+        last = self.levels[0][2].newest()
+        return None if last is None else (float(last[COL_X]), float(last[COL_Y]))
+
+    def time_near(self, point, radius, since=None):
+        """在 point 半徑 radius 內累計停留的秒數"""
+        samples = self.samples(since)
+        distance = np.hypot(samples[:, COL_X] - point[0], samples[:, COL_Y] - point[1])
+        return float(samples[distance <= radius, COL_DURATION].sum())
+
+    def last_visit(self, box):
+        """最後一次位於外框 (x1, y1, x2, y2) 內的時間戳，從未到過時返回None"""
+        samples = self.samples()
+        x1, y1, x2, y2 = box
+        inside = (samples[:, COL_X] >= x1) & (samples[:, COL_X] <= x2) & \
+                 (samples[:, COL_Y] >= y1) & (samples[:, COL_Y] <= y2)
+        return float(samples[inside, COL_TIME].max()) if inside.any() else None
+
+    def clear(self):
+        for _, _, ring in self.levels:
+            ring.clear()
+        self.version += 1
+
+    def load_array(self, samples):
+        """由保存的樣本陣列還原（依時間順序重新放入各層）"""
+        self.clear()
+        samples = np.asarray(samples, dtype=np.float64).reshape(-1, 4)
+        for row in samples[np.argsort(samples[:, COL_TIME], kind="stable")]:
+            self._push(0, row)
+        self.version += 1